@@ -3,6 +3,7 @@ import asyncio
 import websockets
 import json
 from enum import Enum
+from collections import deque
 import time
 
 
@@ -38,32 +39,69 @@ class BaiduTTSErrorCode(Enum):
         return "未知错误码"
 
 
+class BaiduTTSError(Exception):
+    """
+    百度 TTS 返回的错误，code 为百度错误码或握手阶段的 HTTP 状态码
+    调度器根据 code 识别限流 (429) 和后端连接失败 (502)
+    """
+
+    def __init__(self, code, message=None):
+        self.code = code
+        self.message = message or BaiduTTSErrorCode.get_message(code)
+        super().__init__(f"错误码: {code}, 错误信息: {self.message}")
+
+
 class BaiduTTSWebSocketSDK:
     def __init__(self, authorization, per="4146", base_url="wss://aip.baidubce.com/ws/2.0/speech/publiccloudspeech/v1/tts"):
         """
         初始化 SDK 实例
-        :param access_token: 鉴权令牌
+        :param authorization: 鉴权令牌；也可以是返回令牌的函数或协程函数，每次建立连接时重新获取，令牌刷新后自动生效
         :param per: 发音人参数，默认值为 4146
         :param base_url: WebSocket 服务的基础 URL
         """
         self.authorization = authorization
         self.per = per
         self.base_url = base_url
-        self.url = f"{self.base_url}?access_token={self.authorization}&per={self.per}"
+        self.url = None
         self.websocket = None
 
+    async def _current_token(self):
+        if not callable(self.authorization):
+            return self.authorization
+        token = self.authorization()
+        if asyncio.iscoroutine(token):
+            token = await token
+        return token
+
     async def connect(self):
         """
         建立 WebSocket 连接
         """
         try:
+            self.url = f"{self.base_url}?access_token={await self._current_token()}&per={self.per}"
             self.websocket = await websockets.connect(self.url)
             print("WebSocket 连接已建立")
         except Exception as e:
             print("WebSocket 连接失败:", e)
             self.websocket = None
+            # 握手被拒绝（如 429 限流）时带上 HTTP 状态码
+            response = getattr(e, "response", None)
+            status = getattr(response, "status_code", None) or getattr(e, "status_code", None)
+            if status:
+                raise BaiduTTSError(status) from e
             raise
 
+    @property
+    def is_connected(self):
+        """连接是否处于可用状态（兼容新旧版本 websockets）"""
+        websocket = self.websocket
+        if websocket is None:
+            return False
+        state = getattr(websocket, "state", None)
+        if state is not None:
+            return getattr(state, "name", "") == "OPEN"
+        return bool(getattr(websocket, "open", False))
+
     async def send_start_request(self, spd=5, pit=5, vol=5, audio_ctrl="{\"sampling_rate\":16000}", aue=3):
         """
         发送开始合成请求
@@ -93,8 +131,7 @@ class BaiduTTSWebSocketSDK:
             # 检查错误码
             code = response_data.get("code", -1)
             if code != 0:
-                error_message = BaiduTTSErrorCode.get_message(code)
-                raise Exception(f"错误码: {code}, 错误信息: {error_message}")
+                raise BaiduTTSError(code)
 
             return response_data
         except Exception as e:
@@ -119,38 +156,48 @@ class BaiduTTSWebSocketSDK:
             print("发送文本合成请求失败:", e)
             raise
 
+    async def iter_audio(self, chunk_timeout=10, total_timeout=60):
+        """
+        逐块接收音频数据，直到收到 system.finished
+        :param chunk_timeout: 相邻两块数据之间的最长等待时间（秒）
+        :param total_timeout: 整个接收过程的最长时间（秒），为 None 时不限制
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + total_timeout if total_timeout else None
+        while True:
+            timeout = chunk_timeout
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError("语音合成总时长超时")
+                timeout = min(timeout, remaining) if timeout else remaining
+            try:
+                response = await asyncio.wait_for(self.websocket.recv(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if deadline is not None and loop.time() >= deadline:
+                    raise asyncio.TimeoutError("语音合成总时长超时") from None
+                raise asyncio.TimeoutError("接收音频数据超时") from None
+
+            if isinstance(response, bytes):
+                yield response
+                continue
+
+            response_json = json.loads(response)
+            if response_json.get("type") == "system.error":
+                code = response_json.get("code", -1)
+                raise BaiduTTSError(code)
+            elif response_json.get("type") == "system.finished":
+                print("音频接收完成")
+                return
+
     async def receive_audio(self, output_file="output_file", timeout=5):
         """
         接收音频数据并保存到文件
-        :param output_file: 保存音频的文件名，默认值为 output.mp3
-        :param timeout: 接收音频数据的超时时间（秒），默认值为 10 秒
+        :param output_file: 保存音频的文件名
+        :param timeout: 相邻两块音频数据之间的超时时间（秒）
         """
         try:
-            with open(output_file, "wb") as f:
-                start_time = 0
-                while True:
-                    try:
-                        # 设置超时时间
-                        response = await asyncio.wait_for(self.websocket.recv(), timeout=timeout)
-                    except asyncio.TimeoutError:
-                        if (time.time() - start_time) >= timeout:
-                            return
-                        raise Exception("接收音频数据超时")
-
-                    start_time = time.time()
-                    if isinstance(response, bytes):
-                        print("收到音频数据 (二进制)")
-                        f.write(response)
-                    else:
-                        response_json = json.loads(response)
-                        print("收到服务端响应:", response_json)
-                        if response_json.get("type") == "system.error":
-                            code = response_json.get("code", -1)
-                            error_message = BaiduTTSErrorCode.get_message(code)
-                            raise Exception(f"错误码: {code}, 错误信息: {error_message}")
-                        elif response_json.get("type") == "system.finished":
-                            print("音频接收完成")
-                            break
+            await write_audio_file(self.iter_audio(chunk_timeout=timeout, total_timeout=None), output_file)
         except Exception as e:
             print("接收音频数据失败:", e)
             raise
@@ -177,14 +224,40 @@ class BaiduTTSWebSocketSDK:
             # 检查错误码
             code = response_data.get("code", -1)
             if code != 0:
-                error_message = BaiduTTSErrorCode.get_message(code)
-                raise Exception(f"错误码: {code}, 错误信息: {error_message}")
+                raise BaiduTTSError(code)
 
             return response_data
         except Exception as e:
             print("发送结束合成请求失败:", e)
             raise
 
+    async def synthesize_stream(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3,
+                                chunk_timeout=10, total_timeout=60):
+        """
+        在已建立的连接上完成一轮合成 (system.start -> text -> system.finish)，边接收边产出音频块
+        正常结束时连接保持打开，可供连接池复用；出错、超时或调用方提前停止迭代时关闭连接
+        :param chunk_timeout: 相邻两块音频之间的最长等待时间（秒）
+        :param total_timeout: 整次合成的最长时间（秒）
+        """
+        finished = False
+        try:
+            await self.send_start_request(spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue)
+            await self.send_text_request(text)
+            await self.websocket.send(json.dumps({"type": "system.finish"}))
+            async for chunk in self.iter_audio(chunk_timeout=chunk_timeout, total_timeout=total_timeout):
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                # 协议状态未知，连接不能再复用
+                await self.close_connection()
+                self.websocket = None
+
+    async def synthesize_to_bytes(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3, **timeouts):
+        """在已建立的连接上完成一轮合成，返回完整音频字节"""
+        return await collect_audio(self.synthesize_stream(
+            text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue, **timeouts))
+
     async def close_connection(self):
         """
         关闭 WebSocket 连接
@@ -209,18 +282,187 @@ class BaiduTTSWebSocketSDK:
         """
         try:
             await self.connect()
-            await self.send_start_request(spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue)
-            await self.send_text_request(text)
-            
-            finish_payload = {"type": "system.finish"}
-            await self.websocket.send(json.dumps(finish_payload))
-            print("发送结束合成请求:", finish_payload)
-            
-            await self.receive_audio(output_file=output_file)
+            await write_audio_file(self.synthesize_stream(
+                text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue), output_file)
         finally:
             await self.close_connection()
 
 
+async def collect_audio(chunks):
+    """内存输出：把音频块拼接为完整的字节串"""
+    audio = bytearray()
+    async for chunk in chunks:
+        audio += chunk
+    return bytes(audio)
+
+
+async def write_audio_file(chunks, output_file):
+    """文件输出：打开和写入都放到线程中执行，不阻塞事件循环；返回写入的字节数"""
+    f = await asyncio.to_thread(open, output_file, "wb")
+    size = 0
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(f.write, chunk)
+            size += len(chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    return size
+
+
+async def forward_audio(chunks, send):
+    """转发输出：每收到一块音频就 await send(chunk)（如推送给 WebSocket 客户端），同时返回完整音频"""
+    audio = bytearray()
+    async for chunk in chunks:
+        await send(chunk)
+        audio += chunk
+    return bytes(audio)
+
+
+class BaiduTTSSessionPool:
+    """
+    单个发音人 (per) 的 TTS WebSocket 会话池
+    - 每次合成独占一个会话，同一发音人的并发合成不会互相覆盖连接
+    - 合成结束后健康的连接放回池中，下一次合成跳过 WSS 握手；
+      如果服务端不支持同一连接多次 system.start，自动退化为每次新建连接
+    - 池大小即该发音人的最大并发合成数，断开的连接在取用时剔除
+    """
+
+    def __init__(self, authorization, per, max_size=4,
+                 base_url="wss://aip.baidubce.com/ws/2.0/speech/publiccloudspeech/v1/tts"):
+        self.authorization = authorization
+        self.per = per
+        self.max_size = max_size
+        self.base_url = base_url
+        self.allow_reuse = True
+
+        self._idle = deque()
+        self._slots = None  # 首次使用时在事件循环内创建
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.reuse_failures = 0
+        self.reuse_successes = 0
+
+    def _get_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        return self._slots
+
+    async def _new_session(self):
+        sdk = BaiduTTSWebSocketSDK(authorization=self.authorization, per=self.per, base_url=self.base_url)
+        await sdk.connect()
+        self.created += 1
+        return sdk
+
+    async def _discard(self, sdk):
+        self.evicted += 1
+        await sdk.close_connection()
+
+    async def acquire(self):
+        """
+        独占取出一个会话，返回 (sdk, 是否为复用连接)
+        池满时等待其他合成释放
+        """
+        await self._get_slots().acquire()
+        try:
+            while self._idle:
+                sdk = self._idle.popleft()
+                if sdk.is_connected:
+                    self.reused += 1
+                    return sdk, True
+                await self._discard(sdk)
+            return await self._new_session(), False
+        except BaseException:
+            self._get_slots().release()
+            raise
+
+    async def release(self, sdk, healthy=True):
+        """归还会话；不健康或不允许复用时直接关闭"""
+        try:
+            if healthy and self.allow_reuse and sdk.is_connected:
+                self._idle.append(sdk)
+            else:
+                await self._discard(sdk)
+        finally:
+            self._get_slots().release()
+
+    async def synthesize_stream(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3, **timeouts):
+        """从池中取会话完成一次合成，边接收边产出音频块"""
+        for attempt in range(2):
+            sdk, reused = await self.acquire()
+            healthy = started = False
+            try:
+                async for chunk in sdk.synthesize_stream(
+                        text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue, **timeouts):
+                    started = True
+                    yield chunk
+                healthy = True
+            except websockets.exceptions.ConnectionClosed:
+                # 复用的连接被服务端关闭：多半是不支持在同一连接上再次合成，尚未产出音频时用新连接重试一次
+                if started or not reused or attempt:
+                    raise
+                self.reuse_failures += 1
+                if self.reuse_successes == 0 and self.reuse_failures >= 3:
+                    self.allow_reuse = False
+                    print(f"发音人 {self.per} 的 TTS 连接无法复用，改为每次新建连接")
+                continue
+            finally:
+                await self.release(sdk, healthy=healthy)
+            if reused:
+                self.reuse_successes += 1
+            return
+
+    async def synthesize(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3, **timeouts):
+        """从池中取会话完成一次合成，返回完整音频字节"""
+        return await collect_audio(self.synthesize_stream(
+            text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue, **timeouts))
+
+    async def prewarm(self, count=1):
+        """预先建立 count 个连接放入池中"""
+        count = min(count, self.max_size) - len(self._idle)
+        if count <= 0:
+            return
+        results = await asyncio.gather(*(self._new_session() for _ in range(count)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"TTS 连接预热失败 (per={self.per}): {result}")
+            else:
+                self._idle.append(result)
+
+    async def close(self):
+        while self._idle:
+            await self._idle.popleft().close_connection()
+
+    def stats(self):
+        return {
+            'per': self.per,
+            'max_size': self.max_size,
+            'idle': len(self._idle),
+            'created': self.created,
+            'reused': self.reused,
+            'evicted': self.evicted,
+            'allow_reuse': self.allow_reuse,
+        }
+
+
+_session_pools = {}
+
+
+def get_session_pool(authorization, per, max_size=4):
+    """按发音人获取共享的会话池，同一发音人的所有处理器共用一个池"""
+    key = str(per)
+    pool = _session_pools.get(key)
+    if pool is None:
+        pool = BaiduTTSSessionPool(authorization=authorization, per=per, max_size=max_size)
+        _session_pools[key] = pool
+    return pool
+
+
+def session_pool_stats():
+    return {per: pool.stats() for per, pool in _session_pools.items()}
+
+
 # 示例：使用 SDK
 if __name__ == "__main__":
     Authorization = "KEY" # iam API_KEY或TOKEN二选一
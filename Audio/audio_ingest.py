@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+录音格式统一
+百度ASR只接受 16kHz 16 位单声道 PCM。前端（尤其是低端手机）不必在浏览器里转码，
+直接上传设备原始采样率（44.1k / 48k 等）的 PCM，由服务端在这里统一：
+- 采样格式：int16 或 float32（小端）
+- 声道：多声道取平均混为单声道
+- 重采样：Kaiser 窗 sinc 多相滤波（NumPy 向量化，整块一次矩阵运算，无逐样本 Python 循环）
+- 增益归一化：按峰值放大过小的录音，增益只降不升，避免忽大忽小；整段转换按全段峰值定增益，
+  流式转换在开口说话之前保持原音量，不把开头的底噪放大
+AudioIngest 支持流式：逐块输入任意长度的字节，逐块输出 16kHz PCM，可直接送入流式识别
+"""
+
+from math import gcd
+
+import numpy as np
+
+TARGET_RATE = 16000
+INGEST_BLOCK_FRAMES = 16384
+SAMPLE_FORMATS = {
+    'int16': ('<i2', 32768.0),
+    'float32': ('<f4', 1.0),
+}
+
+
+class Resampler:
+    """
+    流式多相重采样
+    输出 y[m] = Σ_q h[p + q·up] · x[i - q]，其中 t = m·down + delay，i = t // up，p = t % up；
+    delay 为滤波器中心，补偿后输出与输入对齐，总长度为 ceil(输入长度 · up / down)
+    """
+
+    def __init__(self, in_rate, out_rate=TARGET_RATE, half_taps=16, beta=8.0, cutoff=0.92):
+        """
+        Args:
+            in_rate / out_rate: 输入 / 输出采样率
+            half_taps: 滤波器单侧长度（按较低采样率的样本数计），越大过渡带越窄
+            beta: Kaiser 窗参数，越大阻带衰减越大
+            cutoff: 截止频率相对较低奈奎斯特频率的比例
+        """
+        common = gcd(in_rate, out_rate)
+        self.up = out_rate // common
+        self.down = in_rate // common
+        # 降采样时滤波器按较低采样率计长，过渡带宽度与升采样一致
+        self.taps = 2 * half_taps * -(-self.down // self.up)
+        self.passthrough = self.up == self.down
+
+        length = self.taps * self.up
+        self.delay = (length - 1) // 2
+        band = cutoff / max(self.up, self.down)
+        n = np.arange(length) - self.delay
+        h = band * np.sinc(band * n) * np.kaiser(length, beta) * self.up
+        # bank[p, q] = h[p + q·up]
+        self.bank = np.ascontiguousarray(h.reshape(self.taps, self.up).T, dtype=np.float32)
+
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)  # 上一块末尾的样本
+        self._consumed = 0  # 已输入的样本总数
+        self._produced = 0  # 已输出的样本总数
+
+    def _available(self, total):
+        """输入共 total 个样本时，滤波所需样本都已到达的输出数"""
+        # 需要 (m·down + delay) // up <= total - 1
+        return max(0, (total * self.up - self.delay - 1) // self.down + 1)
+
+    def _run(self, samples, final=False):
+        base = self._consumed - len(self._history)  # buffer[0] 对应的输入下标
+        buffer = np.concatenate((self._history, samples))
+        self._consumed += len(samples)
+
+        end = -(-self._consumed * self.up // self.down) if final else min(
+            self._available(self._consumed), -(-self._consumed * self.up // self.down))
+        m = np.arange(self._produced, end, dtype=np.int64)
+        self._produced = max(self._produced, end)
+        if final:
+            # 末尾补零，让最后几个输出也能取满滤波器
+            buffer = np.concatenate((buffer, np.zeros(self.taps, dtype=np.float32)))
+
+        self._history = buffer[max(0, self._consumed - base - (self.taps - 1)):self._consumed - base]
+        if len(m) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        t = m * self.down + self.delay
+        newest = t // self.up - base
+        index = newest[:, None] - np.arange(self.taps)[None, :]
+        window = buffer[np.clip(index, 0, len(buffer) - 1)]
+        window[index < 0] = 0.0
+        return np.einsum('ij,ij->i', window, self.bank[t % self.up])
+
+    def process(self, samples):
+        """输入一块 float32 样本，返回目前能够输出的样本"""
+        if self.passthrough:
+            return samples
+        return self._run(np.asarray(samples, dtype=np.float32))
+
+    def flush(self):
+        """输入结束，返回剩余样本"""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        return self._run(np.zeros(0, dtype=np.float32), final=True)
+
+
+class GainNormalizer:
+    """
+    峰值增益归一化：把录音放大到接近 target_dbfs，放大倍数不超过 max_gain_db；增益只降不升
+    流式输入时，某一块的 RMS 达到 onset_dbfs（开口说话）之前按原音量输出，
+    否则开头的底噪会被放大 max_gain_db，而语音因为峰值高只放大几倍，信噪比反而变差
+    """
+
+    def __init__(self, target_dbfs=-3.0, max_gain_db=20.0, onset_dbfs=-40.0):
+        self.target = 10 ** (target_dbfs / 20)
+        self.max_gain = 10 ** (max_gain_db / 20)
+        self.onset = 10 ** (onset_dbfs / 20)
+        self.gain = self.max_gain
+        self.peak = 0.0
+        self.started = False
+
+    def _track(self, samples):
+        if len(samples):
+            self.peak = max(self.peak, float(np.abs(samples).max()))
+        if self.peak > 0:
+            self.gain = min(self.gain, self.target / self.peak)
+
+    def process(self, samples):
+        """流式：逐块输入"""
+        self._track(samples)
+        if not self.started and len(samples):
+            self.started = float(np.sqrt(np.mean(np.square(samples)))) >= self.onset
+        if not self.started:
+            return samples
+        return samples * max(1.0, self.gain)
+
+    def apply(self, samples):
+        """整段：按全段峰值定增益，整段使用同一个增益"""
+        self._track(samples)
+        self.started = True
+        return samples * max(1.0, self.gain)
+
+
+class AudioIngest:
+    """
+    任意采样率 / 声道数 / 采样格式的 PCM 转为 16kHz 16 位单声道 PCM
+    feed() 可以输入任意长度的字节（不必按样本对齐），返回已经可以输出的 PCM；结束时调用 flush()
+    """
+
+    def __init__(self, rate=TARGET_RATE, channels=1, sample_format='int16', normalize=True,
+                 target_dbfs=-3.0, max_gain_db=20.0, onset_dbfs=-40.0, out_rate=TARGET_RATE):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f'不支持的采样格式: {sample_format}')
+        self.dtype, self.scale = SAMPLE_FORMATS[sample_format]
+        self.channels = max(1, int(channels))
+        self.frame_bytes = np.dtype(self.dtype).itemsize * self.channels
+        self.resampler = Resampler(int(rate), out_rate)
+        self.normalizer = GainNormalizer(target_dbfs, max_gain_db, onset_dbfs) if normalize else None
+        self._rest = b''
+
+    @property
+    def passthrough(self):
+        """输入已经是目标格式且不做归一化时可以跳过转换"""
+        return (self.resampler.passthrough and self.channels == 1 and self.dtype == '<i2'
+                and self.normalizer is None)
+
+    def _decode(self, data):
+        if self._rest:
+            data = self._rest + bytes(data)
+        usable = len(data) // self.frame_bytes * self.frame_bytes
+        self._rest = bytes(data[usable:])
+        samples = np.frombuffer(data, dtype=self.dtype, count=usable // np.dtype(self.dtype).itemsize)
+        samples = samples.astype(np.float32) / self.scale
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        return samples
+
+    @staticmethod
+    def _encode(samples):
+        return np.clip(np.rint(samples * 32767.0), -32768, 32767).astype('<i2').tobytes()
+
+    def _normalize(self, samples):
+        if self.normalizer is not None:
+            samples = self.normalizer.process(samples)
+        return samples
+
+    def convert(self, data):
+        """解码并重采样，返回 float32 样本（不做归一化）"""
+        return self.resampler.process(self._decode(data))
+
+    def feed(self, data):
+        if self.passthrough:
+            return bytes(data)
+        return self._encode(self._normalize(self.convert(data)))
+
+    def flush(self):
+        if self.passthrough:
+            return b''
+        return self._encode(self._normalize(self.resampler.flush()))
+
+
+def ingest(data, rate=TARGET_RATE, channels=1, sample_format='int16', normalize=True, **options):
+    """一次性转换整段录音；已经是 16kHz 16 位单声道且不归一化时原样返回"""
+    converter = AudioIngest(rate, channels, sample_format, normalize=normalize, **options)
+    if converter.passthrough:
+        return data
+    # 分块重采样，中间矩阵留在 CPU 缓存里；整段都在手里，归一化按全段峰值一次定增益
+    view = memoryview(data).cast('B')
+    block = converter.frame_bytes * INGEST_BLOCK_FRAMES
+    parts = [converter.convert(view[i:i + block]) for i in range(0, len(view), block)]
+    parts.append(converter.resampler.flush())
+    samples = np.concatenate(parts)
+    if converter.normalizer is not None:
+        samples = converter.normalizer.apply(samples)
+    return converter._encode(samples)
+
+
+
+def is_canonical(rate=TARGET_RATE, channels=1, sample_format='int16'):
+    """已经是百度ASR要求的 16kHz 16 位单声道 PCM"""
+    return int(rate) == TARGET_RATE and int(channels) == 1 and sample_format == 'int16'
+
+
+def normalize_pcm(pcm, target_dbfs=-3.0, max_gain_db=20.0):
+    """
+    对 16kHz 16 位单声道 PCM 整段做峰值增益归一化，不需要放大时原样返回
+    在 VAD 裁剪之后调用：先归一化会把纯底噪抬到语音阈值之上，只放大说话部分则不会
+    """
+    samples = np.frombuffer(pcm, dtype='<i2', count=len(pcm) // 2).astype(np.float32) / 32768.0
+    normalizer = GainNormalizer(target_dbfs, max_gain_db)
+    samples = normalizer.apply(samples)
+    if normalizer.gain <= 1.0:
+        return pcm
+    return AudioIngest._encode(samples)
+
+
+if __name__ == '__main__':
+    import time
+
+    print("录音格式统一基准测试（实时率 RTF = 处理耗时 / 音频时长，越小越好）")
+    print("=" * 60)
+
+    seconds = 60
+    rng = np.random.default_rng(0)
+
+    def tone(rate, freq, duration=1.0, amplitude=0.5):
+        t = np.arange(int(rate * duration)) / rate
+        return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+    def level_db(pcm):
+        samples = np.frombuffer(pcm, dtype='<i2').astype(np.float64)[2000:-2000] / 32768
+        return 20 * np.log10(np.sqrt(np.mean(samples ** 2)) + 1e-12)
+
+    for rate in (44100, 48000, 8000):
+        passed = level_db(ingest(tone(rate, 1000).tobytes(), rate, sample_format='float32', normalize=False))
+        if rate > TARGET_RATE:
+            stop = level_db(ingest(tone(rate, 10000).tobytes(), rate, sample_format='float32', normalize=False))
+            print(f"{rate}Hz: 1kHz 通带 {passed:6.1f} dB，10kHz（高于 8kHz 奈奎斯特）衰减到 {stop:6.1f} dB")
+        else:
+            print(f"{rate}Hz: 1kHz 通带 {passed:6.1f} dB（理论值 -9.0 dB）")
+
+    # 开头 1 秒底噪 + 说话：整段转换时底噪和语音同样放大，流式转换时开口之前的底噪不放大
+    noise = rng.normal(0, 100, TARGET_RATE)
+    t = np.arange(2 * TARGET_RATE) / TARGET_RATE
+    clip = np.concatenate((noise, 2500 * np.sin(2 * np.pi * 200 * t))).astype('<i2')
+    converter = AudioIngest()
+    raw = clip.tobytes()
+    for name, out in (('整段', ingest(raw)),
+                      ('流式', b''.join(converter.feed(raw[i:i + 3200]) for i in range(0, len(raw), 3200)) + converter.flush())):
+        out = np.frombuffer(out, dtype='<i2').astype(np.float64)
+        gain = [np.sqrt(np.mean(part ** 2)) / np.sqrt(np.mean(ref ** 2))
+                for part, ref in ((out[:TARGET_RATE], clip[:TARGET_RATE].astype(np.float64)),
+                                  (out[TARGET_RATE:], clip[TARGET_RATE:].astype(np.float64)))]
+        print(f"{name}归一化: 开头底噪 x{gain[0]:.2f}，语音 x{gain[1]:.2f}")
+
+    cases = [
+        ('48kHz float32 立体声', 48000, 2, 'float32'),
+        ('44.1kHz int16 单声道', 44100, 1, 'int16'),
+        ('16kHz int16 单声道', 16000, 1, 'int16'),
+    ]
+    for name, rate, channels, sample_format in cases:
+        dtype, scale = SAMPLE_FORMATS[sample_format]
+        raw = (rng.normal(0, 0.05, rate * seconds * channels) * scale).astype(dtype).tobytes()
+
+        start = time.perf_counter()
+        whole = ingest(raw, rate, channels, sample_format)
+        batch = time.perf_counter() - start
+
+        converter = AudioIngest(rate, channels, sample_format)
+        chunk = len(raw) // (seconds * 10) + 1  # 约 100ms 一块，故意不按样本对齐
+        start = time.perf_counter()
+        streamed = b''.join(converter.feed(raw[i:i + chunk]) for i in range(0, len(raw), chunk)) + converter.flush()
+        stream = time.perf_counter() - start
+        print(f"{name:<22} 整段 RTF {batch / seconds:.5f}，100ms 分块流式 RTF {stream / seconds:.5f}，"
+              f"输出 {len(whole) // 2 / TARGET_RATE:.2f}s，流式与整段一致: {len(streamed) == len(whole)}")
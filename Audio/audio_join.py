@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+音频拼接工具
+分段合成的音频按百度 TTS 的 aue 格式拼接为一段：
+- 3 (mp3)：去掉每段的 ID3 标签，从第一个帧同步字开始拼接，保证输出是连续的 MP3 帧流
+- 4 / 5 (pcm)：直接拼接
+- 6 (wav)：取出每段的 data 块，重新生成 RIFF 头
+"""
+
+import struct
+
+AUE_MP3 = 3
+AUE_PCM_16K = 4
+AUE_PCM_8K = 5
+AUE_WAV = 6
+
+ID3V1_SIZE = 128
+
+
+def _id3v2_size(data):
+    """ID3v2 标签总长度（10 字节头 + 同步安全整数表示的标签体 + 可选的 10 字节尾）"""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def mp3_frames(data):
+    """去掉 ID3v2 头和 ID3v1 尾，返回从第一个 MP3 帧开始的字节"""
+    view = memoryview(data)
+    start = _id3v2_size(view)
+    end = len(view)
+    if end - start >= ID3V1_SIZE and view[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == b'TAG':
+        end -= ID3V1_SIZE
+    # 跳到第一个帧同步字 (11 个 1)
+    while start + 1 < end and not (view[start] == 0xFF and view[start + 1] & 0xE0 == 0xE0):
+        start += 1
+    return bytes(view[start:end])
+
+
+def wav_parts(data):
+    """返回 (fmt 块内容, data 块内容)"""
+    if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError('不是有效的 WAV 数据')
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        chunk_size = struct.unpack('<I', data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + chunk_size]
+        if chunk_id == b'fmt ':
+            fmt = body
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('WAV 缺少 fmt 块')
+            return bytes(fmt), bytes(body)
+        pos += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError('WAV 缺少 data 块')
+
+
+def wav_bytes(fmt, pcm):
+    """由 fmt 块内容和 PCM 数据生成完整的 WAV"""
+    return b''.join((
+        b'RIFF', struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(pcm)), b'WAVE',
+        b'fmt ', struct.pack('<I', len(fmt)), fmt,
+        b'data', struct.pack('<I', len(pcm)), pcm,
+    ))
+
+
+def segment_payload(audio, aue):
+    """单段音频中可以直接拼接的部分（wav 除外，wav 需要整体重写头部）"""
+    if aue == AUE_MP3:
+        return mp3_frames(audio)
+    return bytes(audio)
+
+
+def join_audio(segments, aue=AUE_MP3):
+    """按顺序拼接多段同格式音频"""
+    segments = [segment for segment in segments if segment]
+    if len(segments) <= 1:
+        return bytes(segments[0]) if segments else b''
+    if aue == AUE_WAV:
+        parts = [wav_parts(segment) for segment in segments]
+        return wav_bytes(parts[0][0], b''.join(pcm for _, pcm in parts))
+    return b''.join(segment_payload(segment, aue) for segment in segments)
@@ -1,9 +1,109 @@
 from aip import AipSpeech
+import asyncio
+import hashlib
 import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from baidu_auth import BaiduAuth, TOKEN_CACHE_PATH
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_asr_result(result):
+    """把百度识别接口的原始返回转换为统一的结果字典"""
+    if result.get('err_no') == 0:
+        logger.info(f"识别成功: {result.get('result', [])}")
+        return {
+            'success': True,
+            'text': result.get('result', [''])[0] if result.get('result') else '',
+            'all_results': result.get('result', []),
+            'sn': result.get('sn'),
+            'corpus_no': result.get('corpus_no')
+        }
+    else:
+        logger.error(f"识别失败: {result.get('err_msg')} (错误码: {result.get('err_no')})")
+        return {
+            'success': False,
+            'error_code': result.get('err_no'),
+            'error_msg': result.get('err_msg'),
+            'text': ''
+        }
+
+
+def audio_fingerprint(audio_data):
+    """音频内容指纹（SHA-256 十六进制），前端可用 crypto.subtle.digest('SHA-256') 算出相同的值"""
+    return hashlib.sha256(audio_data).hexdigest()
+
+
+class ASRResultCache:
+    """
+    识别结果缓存（LRU + TTL）
+    客户端断线重连后常常重传同一段录音，按 (音频指纹, dev_pid, 采样率, 格式) 缓存成功的识别结果，
+    重传时不再请求百度；客户端先发送指纹时连 base64 解码都可以省掉
+    """
+
+    def __init__(self, max_entries=512, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def key(fingerprint, dev_pid, rate, format='pcm'):
+        return (fingerprint, dev_pid, rate, format)
+
+    def get(self, fingerprint, dev_pid, rate, format='pcm'):
+        """返回缓存的识别结果，没有或已过期时返回 None"""
+        if not fingerprint:
+            return None
+        key = self.key(fingerprint, dev_pid, rate, format)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, fingerprint, dev_pid, rate, result, format='pcm'):
+        """只缓存识别成功的结果"""
+        if not fingerprint or not result.get('success'):
+            return
+        key = self.key(fingerprint, dev_pid, rate, format)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
 class BaiduASR:
     def __init__(self, app_id, api_key, secret_key):
         self.app_id = app_id
@@ -22,24 +122,7 @@ class BaiduASR:
         
         try:
             result = self.client.asr(audio_data, format, rate, options)
-            
-            if result.get('err_no') == 0:
-                logger.info(f"识别成功: {result.get('result', [])}")
-                return {
-                    'success': True,
-                    'text': result.get('result', [''])[0] if result.get('result') else '',
-                    'all_results': result.get('result', []),
-                    'sn': result.get('sn'),
-                    'corpus_no': result.get('corpus_no')
-                }
-            else:
-                logger.error(f"识别失败: {result.get('err_msg')} (错误码: {result.get('err_no')})")
-                return {
-                    'success': False,
-                    'error_code': result.get('err_no'),
-                    'error_msg': result.get('err_msg'),
-                    'text': ''
-                }
+            return parse_asr_result(result)
         except Exception as e:
             logger.error(f"ASR异常: {str(e)}")
             return {
@@ -64,10 +147,113 @@ class BaiduASR:
             }
 
 
+class AsyncBaiduASR:
+    """
+    基于 aiohttp 的异步百度短语音识别客户端
+    直接以 raw 方式上传音频到 server_api，长连接池复用 TCP/TLS 连接，
+    token 默认用本模块的 ASR 凭据获取和刷新；并发识别只占用连接，不占用线程
+    """
+
+    URL = "https://vop.baidu.com/server_api"
+    TOKEN_ERRORS = (110, 111, 3302)  # token 无效 / 过期 / 鉴权失败
+
+    def __init__(self, token_provider=None, limit=32, connect_timeout=5, total_timeout=15,
+                 keepalive_timeout=60, cuid=None):
+        """
+        Args:
+            token_provider: 返回 access_token 的协程函数，接受 force_refresh 参数，默认 get_asr_token_async
+            limit: 连接池最大连接数
+            connect_timeout: 建立连接超时（秒）
+            total_timeout: 单次识别总超时（秒）
+            keepalive_timeout: 空闲连接保持时间（秒）
+            cuid: 设备标识，默认使用主机名
+        """
+        self.token_provider = token_provider or get_asr_token_async
+        self.limit = limit
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self.keepalive_timeout = keepalive_timeout
+        self.cuid = cuid or socket.gethostname()
+        # 会话绑定创建它的事件循环：每个循环一个会话，不在别的循环里复用或替换
+        self._sessions = {}
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # 已关闭的循环上的会话无法再 await close：分离连接器并丢弃，套接字随对象回收释放
+            for stale in [l for l in self._sessions if l.is_closed()]:
+                self._sessions.pop(stale).detach()
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=self.keepalive_timeout)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[loop] = session
+        return session
+
+    async def _request(self, audio_data, format, rate, dev_pid, cuid, force_refresh=False):
+        token = await self.token_provider(force_refresh=force_refresh)
+        params = {'dev_pid': dev_pid, 'cuid': cuid or self.cuid, 'token': token}
+        headers = {'Content-Type': f'audio/{format};rate={rate}'}
+        async with self._get_session().post(self.URL, params=params, data=audio_data, headers=headers) as response:
+            return await response.json(content_type=None)
+
+    async def asr(self, audio_data, format='pcm', rate=16000, dev_pid=1537, cuid=None):
+        """识别一段音频，返回值与 BaiduASR.asr 相同"""
+        try:
+            result = await self._request(audio_data, format, rate, dev_pid, cuid)
+            if result.get('err_no') in self.TOKEN_ERRORS:
+                # token 被提前吊销或过期，强制刷新后重试一次
+                result = await self._request(audio_data, format, rate, dev_pid, cuid, force_refresh=True)
+            return parse_asr_result(result)
+        except asyncio.TimeoutError:
+            logger.error("ASR异常: 请求超时")
+            return {
+                'success': False,
+                'error_code': -1,
+                'error_msg': '请求超时',
+                'text': ''
+            }
+        except Exception as e:
+            logger.error(f"ASR异常: {str(e)}")
+            return {
+                'success': False,
+                'error_code': -1,
+                'error_msg': str(e),
+                'text': ''
+            }
+
+    async def close(self):
+        """关闭当前循环的会话；其他仍在运行的循环上的会话交给各自的循环关闭"""
+        current = asyncio.get_running_loop()
+        sessions, self._sessions = self._sessions, {}
+        for loop, session in sessions.items():
+            if session.closed:
+                continue
+            if loop.is_closed():
+                session.detach()
+                continue
+            if loop is current:
+                await session.close()
+            else:
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+
 APP_ID = 'YOUR-ID'
 API_KEY = 'YOUR-API-KEY'
 SECRET_KEY = 'YOUR-SECRET_KEY'
 
+ASR_TOKEN_CACHE_PATH = os.path.join(os.path.dirname(TOKEN_CACHE_PATH), 'baidu_asr_token.json')
+
+_asr_auth = None
+
+def get_asr_auth():
+    """ASR 的 token 用 ASR 应用自己的 API_KEY/SECRET_KEY 获取，不借用 TTS 的凭据（baidu_auth）"""
+    global _asr_auth
+    if _asr_auth is None:
+        _asr_auth = BaiduAuth(API_KEY, SECRET_KEY, cache_path=ASR_TOKEN_CACHE_PATH)
+    return _asr_auth
+
+async def get_asr_token_async(force_refresh=False):
+    return await get_asr_auth().get_access_token_async(force_refresh)
+
 _asr_instance = None
 
 def get_asr_instance():
@@ -80,6 +266,31 @@ def asr(audio_data, format='pcm', rate=16000, dev_pid=1537, cuid=None):
     instance = get_asr_instance()
     return instance.asr(audio_data, format, rate, dev_pid, cuid)
 
+_async_asr_instance = None
+
+def get_async_asr_instance():
+    global _async_asr_instance
+    if _async_asr_instance is None:
+        _async_asr_instance = AsyncBaiduASR()
+    return _async_asr_instance
+
+async def asr_async(audio_data, format='pcm', rate=16000, dev_pid=1537, cuid=None):
+    instance = get_async_asr_instance()
+    return await instance.asr(audio_data, format, rate, dev_pid, cuid)
+
+_asr_cache = None
+
+def configure_asr_cache(max_entries=512, ttl=600):
+    global _asr_cache
+    _asr_cache = ASRResultCache(max_entries=max_entries, ttl=ttl)
+    return _asr_cache
+
+def get_asr_cache():
+    global _asr_cache
+    if _asr_cache is None:
+        _asr_cache = ASRResultCache()
+    return _asr_cache
+
 def asr_from_file(file_path, format='pcm', rate=16000, dev_pid=1537):
     instance = get_asr_instance()
     return instance.asr_from_file(file_path, format, rate, dev_pid)
@@ -1,44 +1,190 @@
-import requests
+import asyncio
+import hashlib
 import json
+import os
+import threading
 import time
 
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+TOKEN_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs', 'baidu_token.json')
+
+
+class FileLock:
+    """跨进程文件锁：POSIX 用 fcntl.flock，Windows 用 msvcrt.locking"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍拿不到锁会抛错，继续等待
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
 class BaiduAuth:
-    def __init__(self, api_key, secret_key):
+    """
+    百度 access_token 管理
+    - 内存缓存 + 磁盘缓存：多个工作进程共用同一个 token 文件，重启后不必重新获取
+    - 线程安全：同一时刻只有一个线程/进程去请求新 token（文件锁）
+    - 可启动后台线程，在过期前 refresh_ahead 秒主动刷新
+    """
+
+    def __init__(self, api_key, secret_key, cache_path=TOKEN_CACHE_PATH, timeout=10, refresh_ahead=24 * 3600):
         self.api_key = api_key
         self.secret_key = secret_key
         self.token_url = "https://aip.baidubce.com/oauth/2.0/token"
         self.access_token = None
         self.token_expires_at = 0
-    
-    def get_access_token(self, force_refresh=False):
-        if not force_refresh and self.access_token and time.time() < self.token_expires_at:
-            return self.access_token
-        
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.refresh_ahead = refresh_ahead
+
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+        # 只用 api_key 的摘要区分缓存文件中的 token，不把密钥写到磁盘
+        self._key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+    def _valid(self, margin=0):
+        return self.access_token is not None and time.time() < self.token_expires_at - margin
+
+    def _load_cached(self):
+        """读取磁盘缓存，token 属于当前 api_key 且未过期时载入内存"""
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('key_id') != self._key_id or time.time() >= cached.get('expires_at', 0):
+            return False
+        self.access_token = cached['access_token']
+        self.token_expires_at = cached['expires_at']
+        return True
+
+    def _save_cached(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'key_id': self._key_id,
+                    'access_token': self.access_token,
+                    'expires_at': self.token_expires_at
+                }, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"保存access_token缓存失败: {e}")
+
+    def _fetch(self):
         params = {
             'grant_type': 'client_credentials',
             'client_id': self.api_key,
             'client_secret': self.secret_key
         }
-        
+
         try:
-            response = requests.post(self.token_url, params=params)
+            response = requests.post(self.token_url, params=params, timeout=self.timeout)
             result = response.json()
-            
+
             if 'access_token' in result:
                 self.access_token = result['access_token']
                 expires_in = result.get('expires_in', 2592000)
                 self.token_expires_at = time.time() + expires_in - 300
-                
+
                 print(f"获取access_token成功，有效期: {expires_in}秒")
                 return self.access_token
             else:
                 error_msg = result.get('error_description', result.get('error', '未知错误'))
                 raise Exception(f"获取access_token失败: {error_msg}")
-                
+
         except Exception as e:
             print(f"获取access_token异常: {e}")
             raise
 
+    def get_access_token(self, force_refresh=False, margin=0):
+        """
+        获取有效的 access_token
+        margin: 剩余有效期不足 margin 秒时也视为需要刷新（后台刷新使用）
+        """
+        if not force_refresh and self._valid(margin):
+            return self.access_token
+
+        with self._lock:
+            if not force_refresh and self._valid(margin):
+                return self.access_token
+            if not self.cache_path:
+                return self._fetch()
+
+            lock_path = f"{self.cache_path}.lock"
+            with FileLock(lock_path):
+                # 其他进程可能已经刷新过
+                if not force_refresh and self._load_cached() and self._valid(margin):
+                    return self.access_token
+                token = self._fetch()
+                self._save_cached()
+                return token
+
+    async def get_access_token_async(self, force_refresh=False):
+        """协程版本：token 有效时直接返回，需要请求网络时放到线程中执行"""
+        if not force_refresh and self._valid():
+            return self.access_token
+        return await asyncio.to_thread(self.get_access_token, force_refresh)
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.get_access_token(margin=self.refresh_ahead)
+                wait = max(60, self.token_expires_at - self.refresh_ahead - time.time())
+            except Exception:
+                # 网络异常时稍后重试，当前 token 仍然可用
+                wait = 60
+            self._stop.wait(wait)
+
+    def start_background_refresh(self):
+        """启动后台刷新线程（守护线程，重复调用无副作用）"""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name='baidu-token-refresh', daemon=True)
+            self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+
 
 API_KEY = 'API'
 SECRET_KEY = 'KEY'
@@ -55,6 +201,14 @@ def get_access_token(force_refresh=False):
     instance = get_auth_instance()
     return instance.get_access_token(force_refresh)
 
+async def get_access_token_async(force_refresh=False):
+    instance = get_auth_instance()
+    return await instance.get_access_token_async(force_refresh)
+
+def start_token_refresher():
+    """服务启动时调用：后台在 token 过期前主动刷新"""
+    get_auth_instance().start_background_refresh()
+
 
 if __name__ == '__main__':
     print("测试获取百度access_token")
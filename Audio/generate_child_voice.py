@@ -4,7 +4,8 @@ import sys
 import importlib.util
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from baidu_auth import get_access_token
+from baidu_auth import get_access_token_async
+from tts_scheduler import PRIORITY_OFFLINE, get_tts_scheduler
 
 spec = importlib.util.spec_from_file_location("TTS_ws_demo", os.path.join(os.path.dirname(__file__), "TTS-ws-demo.py"))
 TTS_ws_demo = importlib.util.module_from_spec(spec)
@@ -21,9 +22,8 @@ async def generate_child_voice():
     
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
-    access_token = get_access_token()
     tts_sdk = BaiduTTSWebSocketSDK(
-        authorization=access_token,
+        authorization=get_access_token_async,
         per=6561  # 童声发音人
     )
     
@@ -31,14 +31,14 @@ async def generate_child_voice():
     print(f"文本: {text}")
     print(f"发音人: 6561 (童声)")
     
-    await tts_sdk.synthesize(
+    await get_tts_scheduler().run(lambda: tts_sdk.synthesize(
         text=text,
         output_file=output_path,
         spd=5,   # 语速：正常
         pit=5,   # 音调：正常
         vol=5,   # 音量：正常
         aue=3    # MP3格式
-    )
+    ), priority=PRIORITY_OFFLINE)
     
     print(f"✓ 生成成功！")
     print(f"文件保存在: {output_path}")
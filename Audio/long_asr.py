@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+长录音分段识别
+百度短语音识别单次最长约 60 秒。长录音在静音处切成不超过 max_seconds 的片段，
+相邻片段保留少量重叠，片段并发识别后按顺序拼接文本，并去掉重叠部分重复识别出的字。
+"""
+
+import asyncio
+
+import numpy as np
+
+from vad import frame_features
+
+FRAME_MS = 30
+TRAILING_PUNCTUATION = '。，,.！!？?；;、 '
+
+
+def split_at_silence(pcm, rate=16000, max_seconds=50, overlap_ms=300):
+    """
+    返回 [(起始字节, 结束字节)]，每段不超过 max_seconds（含重叠）
+    切分点取每段后半部分中能量最低的帧，尽量落在句间停顿上
+    """
+    total = len(pcm) // 2 * 2
+    max_bytes = int(max_seconds * rate) * 2
+    if total <= max_bytes:
+        return [(0, total)]
+
+    samples = np.frombuffer(pcm, dtype='<i2', count=total // 2)
+    frame_len = rate * FRAME_MS // 1000
+    frame_bytes = frame_len * 2
+    energy_db, _ = frame_features(samples, frame_len)
+    overlap_bytes = (rate * overlap_ms // 1000) * 2
+    max_frames = (max_bytes - 2 * overlap_bytes) // frame_bytes
+
+    cuts = []
+    start_frame = 0
+    while (len(energy_db) - start_frame) * frame_bytes > max_bytes - overlap_bytes:
+        lo = start_frame + max_frames // 2
+        hi = min(start_frame + max_frames, len(energy_db))
+        window = energy_db[lo:hi]
+        # 能量接近最低（3 dB 内）的帧里取最靠后的，片段尽量长、段数尽量少
+        quiet = np.flatnonzero(window <= window.min() + 3.0)
+        cut = lo + int(quiet[-1])
+        cuts.append(cut * frame_bytes)
+        start_frame = cut
+
+    bounds = [0] + cuts + [total]
+    return [
+        (max(0, bounds[i] - overlap_bytes) if i else 0, min(total, bounds[i + 1] + overlap_bytes))
+        for i in range(len(bounds) - 1)
+    ]
+
+
+def stitch_texts(texts, max_overlap_chars=12, min_overlap_chars=3):
+    """按顺序拼接各段文本；前一段结尾与后一段开头重复的字只保留一次"""
+    stitched = ''
+    for text in texts:
+        if not text:
+            continue
+        if stitched:
+            tail = stitched.rstrip(TRAILING_PUNCTUATION)
+            limit = min(max_overlap_chars, len(tail), len(text))
+            for k in range(limit, min_overlap_chars - 1, -1):
+                if tail.endswith(text[:k]):
+                    stitched = tail
+                    text = text[k:]
+                    break
+        stitched += text
+    return stitched
+
+
+def _merge_results(results):
+    """合并各段识别结果，返回与 BaiduASR.asr 相同结构的字典"""
+    succeeded = [r for r in results if r.get('success')]
+    if not succeeded:
+        first_error = results[0] if results else {}
+        return {
+            'success': False,
+            'error_code': first_error.get('error_code', -1),
+            'error_msg': first_error.get('error_msg', '识别失败'),
+            'text': ''
+        }
+    text = stitch_texts([r.get('text', '') if r.get('success') else '' for r in results])
+    merged = {
+        'success': True,
+        'text': text,
+        'all_results': [text],
+        'segments': len(results)
+    }
+    if len(succeeded) < len(results):
+        merged['failed_segments'] = len(results) - len(succeeded)
+    return merged
+
+
+def transcribe_long(pcm, recognize, pool, rate=16000, max_seconds=50, overlap_ms=300, **asr_options):
+    """
+    同步版本：各段提交到有界线程池（worker_pools.WorkerPool）并发识别
+    recognize: 与 baidu_asr.asr 相同签名的识别函数
+    """
+    view = memoryview(pcm).cast('B')
+    segments = split_at_silence(view, rate, max_seconds, overlap_ms)
+    if len(segments) == 1:
+        return recognize(view[segments[0][0]:segments[0][1]], rate=rate, **asr_options)
+    futures = [pool.submit(recognize, view[start:end], rate=rate, **asr_options) for start, end in segments]
+    return _merge_results([future.result() for future in futures])
+
+
+async def transcribe_long_async(pcm, recognize, rate=16000, max_seconds=50, overlap_ms=300, concurrency=4,
+                                **asr_options):
+    """
+    协程版本：最多 concurrency 段同时识别
+    recognize: 与 baidu_asr.asr_async 相同签名的协程函数
+    """
+    view = memoryview(pcm).cast('B')
+    segments = split_at_silence(view, rate, max_seconds, overlap_ms)
+    if len(segments) == 1:
+        return await recognize(view[segments[0][0]:segments[0][1]], rate=rate, **asr_options)
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(start, end):
+        async with limit:
+            return await recognize(view[start:end], rate=rate, **asr_options)
+
+    results = await asyncio.gather(*(one(start, end) for start, end in segments))
+    return _merge_results(list(results))
+
+
+if __name__ == '__main__':
+    import time
+
+    print("长录音分段识别基准测试（模拟ASR，每段耗时与音频长度成正比）")
+    print("=" * 50)
+
+    rate = 16000
+    rng = np.random.default_rng(0)
+    sentences = ["今天要给宝宝买尿不湿", "下午三点带宝宝打疫苗", "晚上记得给老公打电话", "明天早上去超市买菜"]
+
+    # 3 分钟录音：每 6 秒一句话，句间 1 秒停顿
+    audio = rng.normal(0, 30, 180 * rate)
+    spoken = []
+    for i, start in enumerate(range(0, 180 * rate, 6 * rate)):
+        t = np.arange(5 * rate) / rate
+        audio[start:start + len(t)] += 3000 * np.sin(2 * np.pi * 200 * t)
+        spoken.append((start * 2, (start + len(t)) * 2, f"{sentences[i % len(sentences)]}{i}。"))
+    pcm = np.clip(audio, -32768, 32767).astype('<i2').tobytes()
+
+    async def fake_asr(chunk, rate=16000, **options):
+        """按片段覆盖的字节范围返回对应句子，模拟 1 秒/分钟 的识别耗时"""
+        offset = np.frombuffer(chunk, dtype=np.uint8).ctypes.data - np.frombuffer(pcm, dtype=np.uint8).ctypes.data
+        await asyncio.sleep(len(chunk) / (rate * 2) / 60)
+        text = ''.join(s for a, b, s in spoken if a >= offset and b <= offset + len(chunk))
+        return {'success': True, 'text': text, 'all_results': [text]}
+
+    segments = split_at_silence(pcm, rate)
+    print(f"切分: {len(segments)} 段, 每段 {[round((b - a) / rate / 2, 1) for a, b in segments]} 秒")
+
+    start = time.perf_counter()
+    result = asyncio.run(transcribe_long_async(pcm, fake_asr, rate=rate, concurrency=4))
+    elapsed = time.perf_counter() - start
+    serial = sum(b - a for a, b in segments) / (rate * 2) / 60
+    print(f"并发识别耗时 {elapsed:.2f}s（串行约 {serial:.2f}s），文本完整: "
+          f"{result['text'] == ''.join(s for _, _, s in spoken)}")
+    print(stitch_texts(["今天要给宝宝买尿不湿，下午三", "下午三点带宝宝打疫苗。"]))
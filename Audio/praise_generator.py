@@ -8,7 +8,8 @@ import importlib.util
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llm_req import Agent
-from baidu_auth import get_access_token
+from baidu_auth import get_access_token_async
+from tts_scheduler import PRIORITY_PRAISE, get_tts_scheduler
 
 spec = importlib.util.spec_from_file_location("TTS_ws_demo", os.path.join(os.path.dirname(__file__), "TTS-ws-demo.py"))
 TTS_ws_demo = importlib.util.module_from_spec(spec)
@@ -46,9 +47,8 @@ class HusbandPraiseGenerator:
 每次夸奖控制在2-3句话，简洁有力，充满爱意。
 可以使用一些昵称如"宝贝"、"老婆"、"亲爱的"等，但不要每句都用。"""
         
-        access_token = get_access_token()
         self.tts_sdk = BaiduTTSWebSocketSDK(
-            authorization=access_token, 
+            authorization=get_access_token_async, 
             per=tts_per
         )
     
@@ -87,14 +87,14 @@ class HusbandPraiseGenerator:
             output_path = os.path.join(os.path.dirname(__file__), 'outputs', output_file)
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            await self.tts_sdk.synthesize(
+            await get_tts_scheduler().run(lambda: self.tts_sdk.synthesize(
                 text=praise_text,
                 output_file=output_path,
                 spd=self.tts_speed,
                 pit=self.tts_pitch,
                 vol=self.tts_volume,
                 aue=3
-            )
+            ), priority=PRIORITY_PRAISE)
             
             with open(output_path, 'rb') as f:
                 audio_content = f.read()
@@ -10,17 +10,30 @@ import io
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from llm_req import Agent
-from baidu_asr import asr
-from baidu_auth import get_access_token
+from baidu_asr import asr_async
+from baidu_auth import get_access_token_async
+from worker_pools import get_pool
+from tts_cache import tts_cache_key
+from text_segmenter import split_for_tts
+from audio_join import AUE_WAV, join_audio, segment_payload
+from tts_scheduler import PRIORITY_INTERACTIVE, get_tts_scheduler
 
-spec = importlib.util.spec_from_file_location("TTS_ws_demo", os.path.join(os.path.dirname(__file__), "TTS-ws-demo.py"))
-TTS_ws_demo = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(TTS_ws_demo)
+# 只加载一次，保证进程内共享同一个 TTS 会话池注册表
+TTS_ws_demo = sys.modules.get("TTS_ws_demo")
+if TTS_ws_demo is None:
+    spec = importlib.util.spec_from_file_location("TTS_ws_demo", os.path.join(os.path.dirname(__file__), "TTS-ws-demo.py"))
+    TTS_ws_demo = importlib.util.module_from_spec(spec)
+    sys.modules["TTS_ws_demo"] = TTS_ws_demo
+    spec.loader.exec_module(TTS_ws_demo)
 BaiduTTSWebSocketSDK = TTS_ws_demo.BaiduTTSWebSocketSDK
+get_session_pool = TTS_ws_demo.get_session_pool
+collect_audio = TTS_ws_demo.collect_audio
+forward_audio = TTS_ws_demo.forward_audio
 
 class RealtimeVoiceHandler:
     def __init__(self, system_instruction=None, tts_per=4192, llm_model='gemini-3-flash-preview', 
-                 tts_speed=5, tts_pitch=5, tts_volume=5, asr_dev_pid=1537):
+                 tts_speed=5, tts_pitch=5, tts_volume=5, asr_dev_pid=1537, tts_pool_size=4, tts_cache=None,
+                 tts_max_chars=500, tts_segment_concurrency=3, tts_scheduler=None):
         self.llm_agent = Agent()
         self.system_instruction = system_instruction or "你是一个友好的语音助手，请用简洁、自然的方式回答用户的问题。"
         self.llm_model = llm_model
@@ -29,55 +42,84 @@ class RealtimeVoiceHandler:
         self.tts_pitch = tts_pitch
         self.tts_volume = tts_volume
         
-        access_token = get_access_token()
-        self.tts_sdk = BaiduTTSWebSocketSDK(
-            authorization=access_token, 
-            per=tts_per
-        )
-        
-    
-    async def synthesize_to_memory(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3):
-        """TTS合成直接返回音频数据到内存，无需保存文件"""
-        audio_buffer = io.BytesIO()
-        
+        # 同一发音人的处理器共用一个会话池，每次合成独占一个连接，健康的连接合成结束后复用
+        # 每次建立连接时重新获取 token，后台刷新后新连接自动使用新 token
+        self.tts_pool = get_session_pool(get_access_token_async, tts_per, max_size=tts_pool_size)
+        self.tts_per = tts_per
+        self.tts_cache = tts_cache
+        # 百度TTS单次文本有长度上限，超出的回复按句切段并发合成
+        self.tts_max_chars = tts_max_chars
+        self.tts_segment_concurrency = tts_segment_concurrency
+        # 所有处理器共用的调度器，统一控制百度TTS的并发、QPS和限流退避
+        self.tts_scheduler = tts_scheduler or get_tts_scheduler()
+
+    async def prewarm_tts(self, count=1):
+        """预先建立 TTS 连接，避免第一次合成时等待 WSS 握手"""
+        await self.tts_pool.prewarm(count)
+
+    async def synthesize_stream(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3, priority=PRIORITY_INTERACTIVE):
+        """
+        TTS合成，边合成边产出音频块；配置了 tts_cache 时相同参数的文本只合成一次
+        priority: 调度优先级，见 tts_scheduler
+        """
+        key = None
+        if self.tts_cache is not None:
+            key = tts_cache_key(text, self.tts_per, spd=spd, pit=pit, vol=vol, aue=aue, audio_ctrl=audio_ctrl)
+            audio = await asyncio.to_thread(self.tts_cache.get, key)
+            if audio is not None:
+                yield audio
+                return
+
+        segments = split_for_tts(text, self.tts_max_chars)
+        if len(segments) > 1:
+            chunks = self._synthesize_segments(segments, priority, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue)
+        else:
+            chunks = self.tts_scheduler.stream(
+                lambda: self.tts_pool.synthesize_stream(text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue),
+                priority=priority
+            )
+
+        audio = bytearray()
+        async for chunk in chunks:
+            audio += chunk
+            yield chunk
+        if key is not None:
+            await asyncio.to_thread(self.tts_cache.put, key, bytes(audio))
+
+    async def _synthesize_segments(self, segments, priority, aue=3, **params):
+        """分段并发合成，按原顺序产出音频；总耗时约等于最慢的一段而不是各段之和"""
+        limit = asyncio.Semaphore(self.tts_segment_concurrency)
+
+        async def synthesize(segment):
+            async with limit:
+                return await self.tts_scheduler.run(
+                    lambda: self.tts_pool.synthesize(segment, aue=aue, **params),
+                    priority=priority
+                )
+
+        tasks = [asyncio.ensure_future(synthesize(segment)) for segment in segments]
         try:
-            await self.tts_sdk.connect()
-            await self.tts_sdk.send_start_request(spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue)
-            await self.tts_sdk.send_text_request(text)
-            
-            finish_payload = {"type": "system.finish"}
-            await self.tts_sdk.websocket.send(json.dumps(finish_payload))
-            
-            timeout = 10
-            while True:
-                try:
-                    response = await asyncio.wait_for(self.tts_sdk.websocket.recv(), timeout=timeout)
-                except asyncio.TimeoutError:
-                    print("TTS接收超时")
-                    break
-                
-                if isinstance(response, bytes):
-                    audio_buffer.write(response)
-                else:
-                    response_json = json.loads(response)
-                    if response_json.get("type") == "system.error":
-                        code = response_json.get("code", -1)
-                        raise Exception(f"TTS错误码: {code}")
-                    elif response_json.get("type") == "system.finished":
-                        print("TTS音频接收完成")
-                        break
-            
-            return audio_buffer.getvalue()
-            
+            if aue == AUE_WAV:
+                # WAV 需要按总长度重写文件头，只能全部完成后一次产出
+                yield join_audio([await task for task in tasks], aue)
+                return
+            for task in tasks:
+                yield segment_payload(await task, aue)
         finally:
-            await self.tts_sdk.close_connection()
-    
+            for task in tasks:
+                task.cancel()
+
+    async def synthesize_to_memory(self, text, spd=5, pit=5, vol=5, audio_ctrl="", aue=3, priority=PRIORITY_INTERACTIVE):
+        """TTS合成直接返回音频数据到内存，无需保存文件"""
+        return await collect_audio(self.synthesize_stream(
+            text, spd=spd, pit=pit, vol=vol, audio_ctrl=audio_ctrl, aue=aue, priority=priority))
+
     async def process_audio(self, audio_data):
         try:
             pcm_data = base64.b64decode(audio_data)
             print(f"接收到PCM音频数据: {len(pcm_data)} 字节")
             
-            asr_result = asr(
+            asr_result = await asr_async(
                 pcm_data, 
                 format='pcm', 
                 rate=16000, 
@@ -93,7 +135,8 @@ class RealtimeVoiceHandler:
             user_text = asr_result.get('text', '')
             print(f"识别文本: {user_text}")
             
-            llm_response = self.llm_agent.router(
+            llm_response = await get_pool('llm').run(
+                self.llm_agent.router,
                 prompt=user_text,
                 model=self.llm_model,
                 systemInstruction=self.system_instruction,
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+朗读文本提取
+LLM 回复是给人看的 Markdown：表格、加粗、列表、emoji。直接送去 TTS 会把竖线、星号读出来，
+也浪费合成时间和字数。这里把回复拆成两份：
+- 显示文本：原样返回给前端
+- 朗读文本：去掉表格（只概括第一列）、Markdown 标记和 emoji，整理标点后再合成；
+  数字之间的 *、× 读作“乘”，2~3、2-3 这样的数字范围读作“到”（日期、电话号码等多段连写的数字不改）
+SpeechFilter 支持在 LLM 流式输出上增量处理，供逐句流水线使用
+"""
+
+import re
+
+from text_segmenter import SENTENCE_ENDINGS, CLOSING_MARKS
+
+_TABLE_SEPARATOR = re.compile(r'^:?-{2,}:?$')
+_RULE = re.compile(r'^\s*(?:[-*_]\s*){3,}$')
+_HEADING = re.compile(r'^\s{0,3}#{1,6}\s*')
+_QUOTE = re.compile(r'^\s*>+\s?')
+_LIST_MARKER = re.compile(r'^\s*(?:[-*+•]\s+|\d+(?:[.)]\s+|、))')
+_IMAGE = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+_LINK = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+_URL = re.compile(r'https?://\S+')
+_CODE = re.compile(r'`+([^`]*)`+')
+_TIMES = re.compile(r'(?<=\d)\s*[*×]\s*(?=\d)')  # 3*4=12：读作“乘”，不当作强调标记
+_EMPHASIS = re.compile(r'(\*{1,3}|_{2,3}|~~)(?=\S)(.+?)(?<=\S)\1')  # 成对包住文字的才是强调
+_STRAY_EMPHASIS = re.compile(r'\*+|__+|~~')  # 按句切开后落单的强调标记
+_EMOJI = re.compile('[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D\u20E3]')
+_STRAY_MARKS = re.compile(r'[#`|<>^\\]')
+_ELLIPSIS = re.compile(r'(?:\.{3,}|。{3,}|…+)')
+_REPEATED_PUNCT = re.compile(r'([。！？!?，,；;])\1+')
+_SPACE_AFTER_END = re.compile(r'(?<=[。！？；…])\s+')
+_NUMERAL = '0-9０-９一二两三四五六七八九十百千万半'
+_RANGE_TILDE = re.compile(rf'(?<=[{_NUMERAL}%％])\s*[~～]\s*(?=[{_NUMERAL}])')  # 2~3杯：读作“到”
+_LEADING_TILDE = re.compile(r'^[~～\s]+')
+_TILDE = re.compile(r'[~～]+')  # 其余是语气装饰（“就够啦~”），换成停顿
+# 2-3次、36.5–37.3度：读作“到”；前后还连着“-数字”的（2024-05-01、400-123-4567）不是范围
+_RANGE_DASH = re.compile(r'(?<![\d.\-–—])(\d+(?:\.\d+)?[%％]?)\s*[-–—]\s*(\d+(?:\.\d+)?)(?![.\d]|\s*[-–—]\s*\d)')
+_SPACES = re.compile(r'[ \t　]+')
+_PARENTHETICAL = re.compile(r'[（(][^）)]*[）)]')
+
+_LINE_END_OK = SENTENCE_ENDINGS + CLOSING_MARKS + '，,：:、'
+
+
+def clean_inline(text):
+    """去掉行内 Markdown 标记、链接、emoji，整理标点"""
+    text = _IMAGE.sub('', text)
+    text = _LINK.sub(r'\1', text)
+    text = _URL.sub('', text)
+    text = _CODE.sub(r'\1', text)
+    text = _TIMES.sub('乘', text)
+    text = _EMPHASIS.sub(r'\2', text)
+    text = _STRAY_EMPHASIS.sub('', text)
+    text = _EMOJI.sub('', text)
+    text = _STRAY_MARKS.sub('', text)
+    text = _ELLIPSIS.sub('…', text)
+    text = _RANGE_TILDE.sub('到', text)
+    text = _RANGE_DASH.sub(r'\1到\2', text)
+    text = _LEADING_TILDE.sub('', text)
+    text = _TILDE.sub('。', text)
+    text = _REPEATED_PUNCT.sub(r'\1', text)
+    text = _SPACE_AFTER_END.sub('', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def _table_cells(line):
+    return [cell.strip() for cell in line.strip().strip('|').split('|')]
+
+
+def is_table_row(line):
+    stripped = line.strip()
+    return stripped.startswith('|') and stripped.count('|') >= 2
+
+
+def summarize_table(rows, mode='summary'):
+    """
+    表格朗读方式：
+    summary: 只读第一列，如“推荐食材：乌鸡、黑芝麻、红枣。”，数字列和点评列不读
+    skip: 整张表不读
+    """
+    if mode == 'skip':
+        return ''
+    rows = [_table_cells(row) for row in rows]
+    rows = [cells for cells in rows if not all(_TABLE_SEPARATOR.match(c.replace(' ', '')) for c in cells if c)]
+    if len(rows) < 2:
+        return ''
+    header = clean_inline(rows[0][0])
+    items = []
+    for cells in rows[1:]:
+        item = clean_inline(_PARENTHETICAL.sub('', cells[0]))
+        if item and item not in items:
+            items.append(item)
+    if not items:
+        return ''
+    return f"{header}：{'、'.join(items)}。" if header else f"{'、'.join(items)}。"
+
+
+class SpeechFilter:
+    """
+    增量朗读文本过滤器
+    feed() 接收 LLM 增量文本，返回可以朗读的文本：
+    - 普通行中已经出现句末标点的部分立即返回，不等整行结束
+    - 表格行缓存到表格结束后一次性返回概括
+    """
+
+    def __init__(self, table_mode='summary'):
+        self.table_mode = table_mode
+        self._pending = ''
+        self._mid_line = False  # 当前行的开头部分已经输出过
+        self._table = []
+        self._last = ''  # 上一次输出的最后一个字符，用于合并跨增量的重复标点
+
+    def _flush_table(self):
+        if not self._table:
+            return ''
+        summary = summarize_table(self._table, self.table_mode)
+        self._table = []
+        return summary
+
+    def _process(self, text, complete):
+        """处理一行（complete=True）或一行中已到句末的前半部分"""
+        if not self._mid_line and is_table_row(text):
+            self._table.append(text)
+            return ''
+
+        spoken = self._flush_table()
+        if self._mid_line:
+            cleaned = clean_inline(text)
+        elif _RULE.match(text):
+            cleaned = ''
+        else:
+            line = _HEADING.sub('', text)
+            line = _QUOTE.sub('', line)
+            line = _LIST_MARKER.sub('', line)
+            cleaned = clean_inline(line)
+
+        if complete and cleaned and cleaned[-1] not in _LINE_END_OK:
+            # 标题、列表项等没有句末标点的行补一个句号，朗读时自然停顿
+            cleaned += '。'
+        spoken += cleaned
+        if spoken[:1] and spoken[0] == self._last and spoken[0] in _LINE_END_OK:
+            spoken = spoken[1:]
+        if spoken:
+            self._last = spoken[-1]
+        return spoken
+
+    def feed(self, delta):
+        self._pending += delta
+        parts = []
+        while True:
+            newline = self._pending.find('\n')
+            if newline < 0:
+                break
+            line = self._pending[:newline]
+            self._pending = self._pending[newline + 1:]
+            parts.append(self._process(line, complete=True))
+            self._mid_line = False
+
+        if self._pending and (self._mid_line or not self._pending.lstrip().startswith('|')):
+            cut = max(self._pending.rfind(mark) for mark in SENTENCE_ENDINGS) + 1
+            if cut > 0:
+                parts.append(self._process(self._pending[:cut], complete=False))
+                self._pending = self._pending[cut:]
+                self._mid_line = True
+        return ''.join(parts)
+
+    def flush(self):
+        """返回剩余的朗读文本（LLM 输出结束时调用）"""
+        spoken = self.feed('\n') if self._pending else ''
+        self._mid_line = False
+        return spoken + self._flush_table()
+
+
+def to_speech(text, table_mode='summary'):
+    """整段回复转为朗读文本"""
+    speech_filter = SpeechFilter(table_mode=table_mode)
+    return (speech_filter.feed(text) + speech_filter.flush()).strip()
+
+
+def split_display_speech(text, table_mode='summary'):
+    """返回 (显示文本, 朗读文本)"""
+    return text.strip(), to_speech(text, table_mode=table_mode)
+
+
+if __name__ == '__main__':
+    import time
+
+    sample = (
+        "哎呀宝儿，这可是产后激素在“作妖”，咱不慌！！😊 这是身体在提醒你该补“黑色能量”和蛋白质啦。"
+        "今晚别点外卖了，给自己整一碗**黑芝麻何首乌炖乌鸡**，既养发又补气~\n\n"
+        "| 推荐食材 | 核心营养成分 | 预计含量/占比 | 闺蜜点评 |\n"
+        "| :--- | :--- | :--- | :--- |\n"
+        "| 乌鸡 (100g) | 优质蛋白质 | 约 22g (高) | 头发的“建筑材料”，必须吃够！ |\n"
+        "| 黑芝麻 | 维生素E、铁 | 脂肪约 46% | 抗氧化神器，虽然油大但养发一流。 |\n"
+        "| 红枣 | 维生素C | 微量 | 促进铁吸收，让气色红润起来~ |\n\n"
+        "### 小贴士\n- 每周吃 **2-3 次**就够啦\n---\n"
+    )
+    for written, expected in (('每天喝2~3杯牛奶就够啦', '每天喝2到3杯牛奶就够啦'), ('每周2-3次', '每周2到3次'),
+                              ('3*4=12', '3乘4=12'), ('2024-05-01复查', '2024-05-01复查')):
+        assert clean_inline(written) == expected, (written, clean_inline(written))
+
+    display, spoken = split_display_speech(sample)
+    print("朗读文本:", spoken)
+    print(f"字数: 显示 {len(display)} -> 朗读 {len(spoken)}")
+
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        to_speech(sample)
+    print(f"整段处理: {(time.perf_counter() - start) / rounds * 1e6:.1f} µs/次")
+
+    start = time.perf_counter()
+    for _ in range(rounds // 10):
+        speech_filter = SpeechFilter()
+        streamed = ''.join(speech_filter.feed(ch) for ch in sample) + speech_filter.flush()
+    print(f"逐字增量处理: {(time.perf_counter() - start) / (rounds // 10) * 1e6:.1f} µs/次, "
+          f"与整段结果一致: {streamed.strip() == spoken}")
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+流式语音识别
+客户端边录音边上传 PCM，服务端边收边识别并推送中间结果，检测到说完后立即给出最终结果，
+不必等整段录音上传完再调用短语音识别。
+
+- StreamingRecognizer: 识别器接口，start() / feed() / finish() / cancel()
+- BaiduRealtimeRecognizer: 百度实时语音识别（WebSocket，wss://vop.baidu.com/realtime_asr）
+- LocalStreamingRecognizer: 本地替身，缓存音频并定期用短语音识别最近一段音频作为中间结果，
+  用于没有开通实时识别的部署和本地测试（会额外消耗短语音识别额度，正式部署用百度实时识别）
+- VoiceStream: 一次流式语音输入 = 识别器 + 端点检测 + 时长上限
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+import uuid
+
+import numpy as np
+import websockets
+
+from baidu_asr import APP_ID, API_KEY
+from long_asr import stitch_texts
+from vad import Endpointer, frame_features
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from output_sink import get_logger
+
+logger = get_logger('streaming_asr')
+
+
+class StreamingRecognizer:
+    """
+    流式识别接口
+    start() 之后不断 feed() PCM，finish() 返回最终结果（结构与 BaiduASR.asr 相同）
+    中间结果通过 on_partial(text) 协程回调推送，text 为到目前为止的完整识别文本
+    """
+
+    def __init__(self, on_partial=None):
+        self.on_partial = on_partial
+        self._last_partial = ''
+
+    async def start(self):
+        pass
+
+    async def feed(self, pcm):
+        raise NotImplementedError
+
+    async def finish(self):
+        raise NotImplementedError
+
+    async def cancel(self):
+        pass
+
+    async def _emit_partial(self, text):
+        if self.on_partial is None or not text or text == self._last_partial:
+            return
+        self._last_partial = text
+        try:
+            await self.on_partial(text)
+        except Exception as e:
+            # 推送中间结果失败（客户端断开等）不影响识别本身
+            logger.error(f"[StreamingASR] 推送中间结果失败: {e}")
+
+
+def _failure(message, code=-1):
+    return {'success': False, 'error_code': code, 'error_msg': message, 'text': ''}
+
+
+def _success(text):
+    return {'success': True, 'text': text, 'all_results': [text]}
+
+
+class BaiduRealtimeRecognizer(StreamingRecognizer):
+    """
+    百度实时语音识别
+    协议：START 文本帧 -> 若干 PCM 二进制帧（建议每帧 160ms）-> FINISH 文本帧；
+    服务端推送 MID_TEXT（当前句的临时结果）和 FIN_TEXT（一句的最终结果），FINISH 后发完最后一句即关闭连接
+    """
+
+    URL = 'wss://vop.baidu.com/realtime_asr'
+
+    def __init__(self, app_id=APP_ID, app_key=API_KEY, dev_pid=15372, rate=16000, cuid=None,
+                 on_partial=None, frame_ms=160, finish_timeout=5.0):
+        super().__init__(on_partial)
+        self.app_id = app_id
+        self.app_key = app_key
+        self.dev_pid = dev_pid
+        self.rate = rate
+        self.cuid = cuid or socket.gethostname()
+        self.frame_bytes = rate * frame_ms // 1000 * 2
+        self.finish_timeout = finish_timeout
+
+        self.websocket = None
+        self._receiver = None
+        self._buffer = bytearray()
+        self._sentences = []  # 已经确定的句子（FIN_TEXT）
+        self._error = None
+
+    async def start(self):
+        self.websocket = await websockets.connect(f"{self.URL}?sn={uuid.uuid4()}")
+        await self.websocket.send(json.dumps({
+            'type': 'START',
+            'data': {
+                'appid': int(self.app_id) if str(self.app_id).isdigit() else self.app_id,
+                'appkey': self.app_key,
+                'dev_pid': self.dev_pid,
+                'cuid': self.cuid,
+                'format': 'pcm',
+                'sample': self.rate
+            }
+        }))
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def _receive(self):
+        try:
+            async for message in self.websocket:
+                data = json.loads(message)
+                if data.get('err_no', 0) != 0:
+                    self._error = (data.get('err_no'), data.get('err_msg', '识别失败'))
+                    logger.error(f"[StreamingASR] 百度实时识别错误: {self._error}")
+                    continue
+                kind = data.get('type')
+                if kind == 'MID_TEXT':
+                    await self._emit_partial(''.join(self._sentences) + data.get('result', ''))
+                elif kind == 'FIN_TEXT':
+                    if data.get('result'):
+                        self._sentences.append(data['result'])
+                    await self._emit_partial(''.join(self._sentences))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _send_frames(self, final=False):
+        while len(self._buffer) >= self.frame_bytes or (final and self._buffer):
+            frame = bytes(self._buffer[:self.frame_bytes])
+            del self._buffer[:self.frame_bytes]
+            await self.websocket.send(frame)
+
+    async def feed(self, pcm):
+        self._buffer += pcm
+        await self._send_frames()
+
+    async def finish(self):
+        try:
+            await self._send_frames(final=True)
+            await self.websocket.send(json.dumps({'type': 'FINISH'}))
+            await asyncio.wait_for(asyncio.shield(self._receiver), self.finish_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[StreamingASR] 等待最终结果超时，使用已确定的句子")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            await self._close()
+
+        text = ''.join(self._sentences)
+        if not text and self._error is not None:
+            return _failure(self._error[1], self._error[0])
+        return _success(text)
+
+    async def cancel(self):
+        if self.websocket is not None:
+            try:
+                await self.websocket.send(json.dumps({'type': 'CANCEL'}))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+        await self._close()
+
+    async def _close(self):
+        if self._receiver is not None and not self._receiver.done():
+            self._receiver.cancel()
+        if self.websocket is not None:
+            await self.websocket.close()
+
+
+class LocalStreamingRecognizer(StreamingRecognizer):
+    """
+    本地替身：缓存收到的音频，每新增 partial_interval_ms 音频就在后台识别一次当前窗口（最近未定稿的音频），
+    已定稿的文本加上窗口的识别结果作为中间结果推送。窗口超过 window_ms 时在后半段最安静处定稿：
+    切点之前识别一次后不再重复发送，每次请求的音频大致在 window_ms 以内，识别额度随录音时长线性增长
+    （每次都识别全部已收音频时是平方增长：30 秒的话、每秒一次中间结果要识别约 465 秒音频）。
+    finish() 只识别最后一个窗口；最后一次中间识别之后没有新音频时直接复用其结果
+    recognize: 与 baidu_asr.asr_async 相同签名的协程函数
+    """
+
+    def __init__(self, recognize, dev_pid=1537, rate=16000, on_partial=None, partial_interval_ms=1000,
+                 window_ms=6000):
+        super().__init__(on_partial)
+        self.recognize = recognize
+        self.dev_pid = dev_pid
+        self.rate = rate
+        self.partial_bytes = rate * partial_interval_ms // 1000 * 2
+        self.window_bytes = rate * window_ms // 1000 * 2
+
+        self._audio = bytearray()
+        self._window_start = 0       # 当前窗口的起点，之前的音频已经定稿
+        self._committed = []         # 已定稿部分的识别文本
+        self._window_text = ''
+        self._recognized_bytes = 0   # 最近一次中间识别覆盖到的位置
+        self._partial_task = None
+
+    async def _recognize_range(self, start, end):
+        try:
+            result = await self.recognize(bytes(self._audio[start:end]), format='pcm', rate=self.rate,
+                                          dev_pid=self.dev_pid)
+        except Exception as e:
+            logger.error(f"[StreamingASR] 中间识别失败: {e}")
+            return None
+        return result if result.get('success') else None
+
+    def _quiet_point(self, start, end):
+        """窗口后半段能量最低的帧的起点，定稿切点尽量落在停顿上"""
+        frame_len = self.rate * 30 // 1000
+        samples = np.frombuffer(bytes(self._audio[start:end]), dtype='<i2')
+        energy_db, _ = frame_features(samples, frame_len)
+        half = len(energy_db) // 2
+        return start + (half + int(np.argmin(energy_db[half:]))) * frame_len * 2
+
+    async def _recognize_partial(self, size):
+        start = self._window_start
+        if size - start >= self.window_bytes:
+            cut = self._quiet_point(start, size)
+            committed = await self._recognize_range(start, cut)
+            if committed is None:
+                return
+            self._committed.append(committed.get('text', ''))
+            self._window_start = start = cut
+        result = await self._recognize_range(start, size)
+        if result is None:
+            return
+        self._recognized_bytes = size
+        self._window_text = result.get('text', '')
+        await self._emit_partial(stitch_texts(self._committed + [self._window_text]))
+
+    async def feed(self, pcm):
+        self._audio += pcm
+        busy = self._partial_task is not None and not self._partial_task.done()
+        if self.partial_bytes > 0 and not busy and len(self._audio) - self._recognized_bytes >= self.partial_bytes:
+            self._partial_task = asyncio.ensure_future(self._recognize_partial(len(self._audio)))
+
+    async def finish(self):
+        if self._partial_task is not None and not self._partial_task.done():
+            await asyncio.wait([self._partial_task])
+        if not self._audio:
+            return _failure('没有收到音频')
+        if self._recognized_bytes != len(self._audio):
+            result = await self.recognize(bytes(self._audio[self._window_start:]), format='pcm', rate=self.rate,
+                                          dev_pid=self.dev_pid)
+            if not result.get('success'):
+                return result
+            self._window_text = result.get('text', '')
+        return _success(stitch_texts(self._committed + [self._window_text]))
+
+    async def cancel(self):
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+
+
+class VoiceStream:
+    """
+    一次流式语音输入
+    feed() 把 PCM 同时送给识别器和端点检测，返回 True 表示用户已经说完（或达到时长上限），
+    调用方随后调用 finish() 取最终结果
+    """
+
+    def __init__(self, recognizer, endpointer=None, rate=16000, max_seconds=60, ingest=None):
+        """ingest: 可选的 audio_ingest.AudioIngest，客户端上传的不是 16kHz 单声道 PCM 时先逐块转换"""
+        self.recognizer = recognizer
+        self.endpointer = endpointer
+        self.ingest = ingest
+        self.max_bytes = int(max_seconds * rate) * 2
+        self.rate = rate
+        self.received = 0
+
+    async def start(self):
+        await self.recognizer.start()
+
+    async def feed(self, pcm):
+        if self.ingest is not None:
+            pcm = self.ingest.feed(pcm)
+        self.received += len(pcm)
+        await self.recognizer.feed(pcm)
+        ended = self.endpointer is not None and self.endpointer.feed(pcm)
+        return ended or self.received >= self.max_bytes
+
+    @property
+    def speech_ms(self):
+        if self.endpointer is not None:
+            return self.endpointer.speech_ms
+        return self.received * 1000 // (self.rate * 2)
+
+    async def finish(self):
+        if self.ingest is not None:
+            tail = self.ingest.flush()
+            if tail:
+                await self.recognizer.feed(tail)
+        return await self.recognizer.finish()
+
+    async def cancel(self):
+        await self.recognizer.cancel()
+
+
+if __name__ == '__main__':
+    import time
+
+    import numpy as np
+
+    print("流式识别本地替身测试：边说边出中间结果，说完后立即得到最终结果")
+    print("=" * 50)
+
+    rate = 16000
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 30, rate * 5)
+    t = np.arange(int(2.5 * rate)) / rate
+    audio[rate // 2:rate // 2 + len(t)] += 5000 * np.sin(2 * np.pi * 200 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    pcm = np.clip(audio, -32768, 32767).astype('<i2').tobytes()
+    words = "宝宝晚上总是哭闹怎么办"
+
+    async def fake_asr(data, format='pcm', rate=16000, dev_pid=1537):
+        """模拟短语音识别：已收到的音频越长，识别出的字越多"""
+        await asyncio.sleep(0.15)
+        seconds = len(data) / (rate * 2)
+        text = words[:int(len(words) * min(1.0, max(0.0, seconds - 0.5) / 2.5))]
+        return {'success': True, 'text': text, 'all_results': [text]}
+
+    async def main():
+        started = time.perf_counter()
+
+        async def on_partial(text):
+            print(f"  {time.perf_counter() - started:4.1f}s 中间结果: {text}")
+
+        stream = VoiceStream(LocalStreamingRecognizer(fake_asr, on_partial=on_partial, partial_interval_ms=500),
+                             Endpointer(rate=rate), rate=rate)
+        await stream.start()
+        frame = rate * 2 // 10  # 客户端每 100ms 发送一帧
+        for offset in range(0, len(pcm), frame):
+            await asyncio.sleep(0.1)
+            if await stream.feed(pcm[offset:offset + frame]):
+                print(f"  {time.perf_counter() - started:4.1f}s 检测到说完（语音 {stream.speech_ms}ms）")
+                break
+        ended = time.perf_counter()
+        result = await stream.finish()
+        print(f"  最终结果: {result['text']}，说完到出结果 {(time.perf_counter() - ended) * 1000:.0f}ms")
+
+    asyncio.run(main())
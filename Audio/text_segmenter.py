@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+文本分句工具
+在 LLM 流式输出的增量文本上按句末标点切分，供逐句 TTS 合成使用
+"""
+
+SENTENCE_ENDINGS = '。！？!?；;…\n'
+CLOSING_MARKS = '”’」』）)】》"\''
+
+
+def _find_boundaries(text):
+    """返回所有句子结束位置（不含），句末标点后紧跟的引号/括号算在本句内"""
+    boundaries = []
+    i, n = 0, len(text)
+    while i < n:
+        if text[i] in SENTENCE_ENDINGS:
+            j = i + 1
+            while j < n and (text[j] in SENTENCE_ENDINGS or text[j] in CLOSING_MARKS):
+                j += 1
+            boundaries.append(j)
+            i = j
+        else:
+            i += 1
+    return boundaries
+
+
+class SentenceSplitter:
+    """
+    增量分句器
+    feed() 接收增量文本，返回已经完整的句子；过短的句子与下一句合并，避免产生过碎的 TTS 请求
+    """
+
+    def __init__(self, min_chars=8):
+        self.min_chars = min_chars
+        self._buffer = ''
+
+    def feed(self, delta):
+        self._buffer += delta
+        boundaries = _find_boundaries(self._buffer)
+        if not boundaries:
+            return []
+
+        sentences = []
+        start = 0
+        for end in boundaries:
+            if len(self._buffer[start:end].strip()) < self.min_chars:
+                continue
+            sentences.append(self._buffer[start:end].strip())
+            start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """返回缓冲区中剩余的文本（LLM 输出结束时调用）"""
+        rest = self._buffer.strip()
+        self._buffer = ''
+        return [rest] if rest else []
+
+
+def split_sentences(text, min_chars=8):
+    """把整段文本切分为句子列表"""
+    splitter = SentenceSplitter(min_chars=min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+SOFT_BREAKS = '，,、：:　 '
+
+
+def _split_long(sentence, max_chars):
+    """单句超过上限时，先在逗号等停顿处切分，找不到合适位置再按长度硬切"""
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = max(sentence.rfind(mark, 0, max_chars) for mark in SOFT_BREAKS) + 1
+        if cut < max_chars // 2:
+            cut = max_chars
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def split_for_tts(text, max_chars=500):
+    """
+    把长文本切分为不超过 max_chars 个字符的片段，供分段并发合成
+    片段尽量由完整的句子拼成，保证每段读起来自然
+    """
+    if len(text) <= max_chars:
+        return [text] if text.strip() else []
+
+    segments = []
+    current = ''
+    for sentence in split_sentences(text, min_chars=1):
+        for piece in _split_long(sentence, max_chars):
+            if current and len(current) + len(piece) > max_chars:
+                segments.append(current)
+                current = piece
+            else:
+                current += piece
+    if current:
+        segments.append(current)
+    return segments
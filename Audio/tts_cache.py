@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+TTS 音频缓存（按内容寻址）
+以 (text, per, spd, pit, vol, aue, audio_ctrl) 的 SHA-256 作为键：
+- 内存层：按字节数限制的 LRU
+- 磁盘层：Audio/outputs/tts_cache 下按键分目录存放，按总大小限制，按最近访问时间淘汰
+写入先写临时文件再原子替换，读取用 mmap，不会读到写了一半的文件
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from output_sink import get_logger
+
+logger = get_logger('tts_cache')
+
+AUDIO_SUFFIX = '.audio'
+
+
+def tts_cache_key(text, per, spd=5, pit=5, vol=5, aue=3, audio_ctrl=""):
+    """合成参数完全相同才视为同一段音频"""
+    raw = json.dumps([text, str(per), spd, pit, vol, aue, audio_ctrl or ""], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """两级 TTS 音频缓存，可在多个线程中同时使用"""
+
+    def __init__(self, directory, memory_bytes=32 * 1024 * 1024, disk_bytes=512 * 1024 * 1024):
+        """
+        Args:
+            directory: 磁盘缓存目录，为 None 时只使用内存层
+            memory_bytes: 内存层最大字节数
+            disk_bytes: 磁盘层最大字节数
+        """
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk = OrderedDict()  # key -> 文件大小，按最近访问排序
+        self._disk_size = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + AUDIO_SUFFIX)
+
+    def _scan_disk(self):
+        """启动时按修改时间重建磁盘索引，清理上次异常退出留下的临时文件"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp'):
+                    os.remove(path)
+                elif name.endswith(AUDIO_SUFFIX):
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, name[:-len(AUDIO_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def _remember(self, key, audio):
+        """放入内存层；单条超过内存预算四分之一的音频只留在磁盘"""
+        if len(audio) > self.memory_bytes // 4:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    audio = mapped[:]
+            os.utime(path)
+            return audio
+        except (OSError, ValueError):
+            return None
+
+    def get(self, key):
+        """返回缓存的音频字节，未命中返回 None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+            on_disk = key in self._disk
+
+        audio = self._read_disk(key) if on_disk else None
+
+        with self._lock:
+            if audio is None:
+                if on_disk and key in self._disk:
+                    # 文件被外部删除或损坏
+                    self._disk_size -= self._disk.pop(key)
+                self.misses += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._remember(key, audio)
+            self.disk_hits += 1
+            return audio
+
+    def put(self, key, audio):
+        """写入音频；空音频（合成失败或超时）不缓存"""
+        if not audio:
+            return
+        audio = bytes(audio)
+        with self._lock:
+            self._remember(key, audio)
+            if not self.directory or key in self._disk:
+                return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"[TTSCache] 写入磁盘缓存失败: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = len(audio)
+                self._disk_size += len(audio)
+                self._evict_disk()
+
+    def stats(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_size,
+            'disk_entries': len(self._disk),
+            'disk_bytes': self._disk_size,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / total if total else 0.0,
+        }
+
+
+if __name__ == '__main__':
+    import random
+    import shutil
+    import tempfile
+
+    print("TTS 缓存基准测试")
+    print("=" * 50)
+
+    directory = tempfile.mkdtemp(prefix='tts_cache_')
+    try:
+        cache = TTSCache(directory, memory_bytes=4 * 1024 * 1024, disk_bytes=64 * 1024 * 1024)
+        texts = [f"宝儿辛苦了，第{i}句夸奖" for i in range(500)]
+        audio = os.urandom(30 * 1024)
+
+        start = time.perf_counter()
+        for text in texts:
+            cache.put(tts_cache_key(text, 4192), audio)
+        print(f"写入 {len(texts)} 条: 平均 {(time.perf_counter() - start) / len(texts) * 1000:.3f} ms")
+
+        rng = random.Random(0)
+        keys = [tts_cache_key(rng.choice(texts), 4192) for _ in range(2000)]
+        start = time.perf_counter()
+        for key in keys:
+            cache.get(key)
+        print(f"读取 {len(keys)} 次: 平均 {(time.perf_counter() - start) / len(keys) * 1000:.3f} ms")
+        print(cache.stats())
+
+        reopened = TTSCache(directory, memory_bytes=4 * 1024 * 1024, disk_bytes=64 * 1024 * 1024)
+        print(f"重启后磁盘条目: {reopened.stats()['disk_entries']}, "
+              f"命中: {reopened.get(keys[0]) == audio}")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+TTS 请求调度器
+所有 RealtimeVoiceHandler 共用一个调度器，统一控制对百度 TTS 的并发数和请求速率：
+- 优先级：实时语音回复 > 备忘录夸奖 > 离线素材生成，空出的名额总是先给优先级高的请求
+- 速率：令牌桶限制每秒发起的合成数
+- 自适应退避：遇到 429（限流）/ 502（后端连接失败）时暂停派发并把速率减半，
+  被限流的请求稍后自动重试；之后每次成功逐步恢复速率
+突发流量下请求会排队变慢，而不是直接失败
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from output_sink import get_logger
+
+logger = get_logger('tts_scheduler')
+
+PRIORITY_INTERACTIVE = 0  # 实时语音 / 文本对话回复
+PRIORITY_PRAISE = 1       # 备忘录完成后的夸奖
+PRIORITY_OFFLINE = 2      # 离线素材生成
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_PRAISE: 'praise',
+    PRIORITY_OFFLINE: 'offline',
+}
+
+THROTTLE_CODES = (429, 502)
+
+
+class TTSScheduler:
+    """按优先级派发 TTS 合成，在并发数和 QPS 预算内执行"""
+
+    def __init__(self, max_concurrency=4, qps=10, max_retries=3, base_backoff=0.5, max_backoff=8.0):
+        """
+        Args:
+            max_concurrency: 同时进行的合成数上限
+            qps: 每秒最多发起的合成数
+            max_retries: 被限流后的最大重试次数
+            base_backoff: 第一次被限流后的暂停时间（秒），连续限流时翻倍
+            max_backoff: 暂停时间上限（秒）
+        """
+        self.max_concurrency = max_concurrency
+        self.qps = qps
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._rate = float(qps)
+        self._tokens = float(qps)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._wake_handle = None
+
+        self._waiters = []
+        self._seq = itertools.count()
+        self._active = 0
+
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self._wait_stats = {priority: [0, 0.0, 0.0] for priority in PRIORITY_NAMES}  # 次数、总等待、最大等待
+
+    # ---------- 派发 ----------
+
+    def _refill(self, now):
+        self._tokens = min(max(1.0, self._rate), self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+    def _schedule_wake(self, delay):
+        if self._wake_handle is None:
+            loop = asyncio.get_running_loop()
+            self._wake_handle = loop.call_later(delay, self._wake_later)
+
+    def _wake_later(self):
+        self._wake_handle = None
+        self._wake()
+
+    def _wake(self):
+        """在预算允许的范围内，按优先级依次放行排队的请求"""
+        while self._waiters and self._active < self.max_concurrency:
+            now = time.monotonic()
+            if now < self._paused_until:
+                self._schedule_wake(self._paused_until - now)
+                return
+            self._refill(now)
+            if self._tokens < 1:
+                self._schedule_wake((1 - self._tokens) / self._rate)
+                return
+
+            priority, _, enqueued, future = heapq.heappop(self._waiters)
+            if future.done():
+                # 等待方已经取消
+                continue
+            self._tokens -= 1
+            self._active += 1
+            stats = self._wait_stats[priority]
+            waited = now - enqueued
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+            future.set_result(None)
+
+    async def _acquire(self, priority, seq):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, seq, time.monotonic(), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分到名额但调用方取消了，归还名额
+                self._release()
+            raise
+
+    def _release(self):
+        self._active -= 1
+        self._wake()
+
+    # ---------- 限流反馈 ----------
+
+    def _on_success(self):
+        self._consecutive_throttles = 0
+        if self._rate < self.qps:
+            self._rate = min(float(self.qps), self._rate + max(0.1, self.qps * 0.05))
+
+    def _on_throttled(self, code):
+        self.throttled += 1
+        self._consecutive_throttles += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_throttles - 1))
+        self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+        self._rate = max(0.5, self._rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+        logger.warning(f"[TTSScheduler] 百度TTS返回 {code}，暂停 {backoff:.1f}s，速率降至 {self._rate:.1f}/s")
+
+    def _should_retry(self, error, attempt, started):
+        return not started and getattr(error, 'code', None) in THROTTLE_CODES and attempt < self.max_retries
+
+    # ---------- 对外接口 ----------
+
+    async def stream(self, make_chunks, priority=PRIORITY_INTERACTIVE):
+        """
+        在调度器名额内执行一次流式合成，逐块产出音频
+        make_chunks: 无参函数，每次调用返回一个新的音频块异步迭代器（重试时会再次调用）
+        尚未产出音频时被限流会自动重试；已经产出音频后出错直接抛出
+        """
+        seq = next(self._seq)
+        attempt = 0
+        while True:
+            await self._acquire(priority, seq)
+            started = False
+            try:
+                async for chunk in make_chunks():
+                    started = True
+                    yield chunk
+                self._on_success()
+                return
+            except Exception as e:
+                if not self._should_retry(e, attempt, started):
+                    self.failures += 1
+                    raise
+                self._on_throttled(e.code)
+                self.retries += 1
+                attempt += 1
+            finally:
+                self._release()
+
+    async def run(self, make_call, priority=PRIORITY_INTERACTIVE):
+        """
+        在调度器名额内执行一次非流式合成
+        make_call: 无参函数，每次调用返回一个新的协程（重试时会再次调用）
+        """
+        seq = next(self._seq)
+        attempt = 0
+        while True:
+            await self._acquire(priority, seq)
+            try:
+                result = await make_call()
+                self._on_success()
+                return result
+            except Exception as e:
+                if not self._should_retry(e, attempt, started=False):
+                    self.failures += 1
+                    raise
+                self._on_throttled(e.code)
+                self.retries += 1
+                attempt += 1
+            finally:
+                self._release()
+
+    def stats(self):
+        queued = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._waiters:
+            if not future.done():
+                queued[PRIORITY_NAMES[priority]] += 1
+        wait = {}
+        for priority, (count, total, longest) in self._wait_stats.items():
+            wait[PRIORITY_NAMES[priority]] = {
+                'count': count,
+                'avg_wait_ms': round(total / count * 1000, 2) if count else 0.0,
+                'max_wait_ms': round(longest * 1000, 2),
+            }
+        return {
+            'active': self._active,
+            'max_concurrency': self.max_concurrency,
+            'qps_limit': self.qps,
+            'current_qps': round(self._rate, 2),
+            'queued': queued,
+            'wait': wait,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'failures': self.failures,
+        }
+
+
+_scheduler = None
+
+
+def configure_tts_scheduler(**kwargs):
+    """按配置创建共享调度器；需要在第一次使用之前调用"""
+    global _scheduler
+    _scheduler = TTSScheduler(**kwargs)
+    return _scheduler
+
+
+def get_tts_scheduler():
+    """获取进程内共享的调度器，未配置时使用默认参数"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = TTSScheduler()
+    return _scheduler
+
+
+if __name__ == '__main__':
+    import random
+
+    class ThrottledError(Exception):
+        def __init__(self, code):
+            super().__init__(f"错误码: {code}")
+            self.code = code
+
+    async def fake_tts(server):
+        """模拟百度TTS：同时超过 3 个请求就返回 429"""
+        if server['active'] >= 3:
+            raise ThrottledError(429)
+        server['active'] += 1
+        try:
+            await asyncio.sleep(random.uniform(0.05, 0.15))
+            return b'mp3'
+        finally:
+            server['active'] -= 1
+
+    async def burst(use_scheduler):
+        server = {'active': 0}
+        scheduler = TTSScheduler(max_concurrency=3, qps=30)
+        latencies = {name: [] for name in PRIORITY_NAMES.values()}
+        failed = 0
+
+        async def one(priority):
+            nonlocal failed
+            start = time.perf_counter()
+            try:
+                if use_scheduler:
+                    await scheduler.run(lambda: fake_tts(server), priority=priority)
+                else:
+                    await fake_tts(server)
+                latencies[PRIORITY_NAMES[priority]].append(time.perf_counter() - start)
+            except ThrottledError:
+                failed += 1
+
+        priorities = [PRIORITY_OFFLINE] * 10 + [PRIORITY_PRAISE] * 10 + [PRIORITY_INTERACTIVE] * 10
+        await asyncio.gather(*(one(p) for p in priorities))
+        return latencies, failed
+
+    random.seed(0)
+    for use_scheduler in (False, True):
+        latencies, failed = asyncio.run(burst(use_scheduler))
+        summary = ', '.join(
+            f"{name} {sum(values) / len(values) * 1000:.0f}ms" for name, values in latencies.items() if values)
+        print(f"{'调度器' if use_scheduler else '直接请求'}: 30 个并发请求, 失败 {failed} 个, 平均延迟 {summary}")
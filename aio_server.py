@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+单进程 asyncio HTTP + WebSocket 服务
+前端静态文件、REST 接口和语音 WebSocket 共用一个 aiohttp 事件循环和一个端口，
+不再是 Flask 开发服务器线程 + websockets 服务两套循环、两个端口：
+- 静态文件：aiohttp 直接发送（sendfile），不经过 Flask
+- REST 接口：原有 Flask 路由不改，由 WSGIAdapter 把请求转成 WSGI environ 放到 http 线程池执行，
+  请求体不预先读完，Flask 在线程中边收边读（录音直接读进预分配的缓冲区，不多复制一份）
+- WebSocket：AiohttpWebSocket 把 aiohttp 的连接包装成 websockets 连接的接口
+  （async for 收消息、send() 发消息、断开时抛 ConnectionClosed），SuperMomVoiceServer.handle_client 原样复用
+- 优雅退出：停止监听后，空闲的 WebSocket 以 1001 关闭（前端重连到其他进程），正在处理的消息处理完再关闭
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import os
+import sys
+from urllib.parse import unquote_to_bytes
+
+import websockets
+from aiohttp import WSCloseCode, WSMsgType, web
+from multidict import CIMultiDict
+
+from output_sink import get_logger
+from worker_pools import WorkerPoolFull
+
+logger = get_logger('aio_server')
+
+# 逐跳首部由 aiohttp 自己处理，不能照抄 WSGI 应用返回的
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length'}
+
+
+class RequestBodyReader(io.RawIOBase):
+    """
+    阻塞读取的 wsgi.input：在线程池线程中调用，每次 readinto 交给事件循环从 request.content 读一块，
+    数据直接写进调用方的缓冲区；分块传输时由这里按 max_size 截断
+    """
+
+    def __init__(self, content, loop, max_size=None, timeout=60):
+        self.content = content
+        self.loop = loop
+        self.max_size = max_size
+        self.timeout = timeout
+        self.received = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        if not len(view):
+            return 0
+        future = asyncio.run_coroutine_threadsafe(self.content.read(len(view)), self.loop)
+        try:
+            data = future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise OSError('读取请求体超时') from None
+        self.received += len(data)
+        if self.max_size is not None and self.received > self.max_size:
+            raise ValueError(f'请求体超过 {self.max_size} 字节上限')
+        view[:len(data)] = data
+        return len(data)
+
+
+class WSGIAdapter:
+    """把 aiohttp 请求交给 WSGI 应用（Flask）处理，在线程池中执行，事件循环不被阻塞"""
+
+    def __init__(self, wsgi_app, pool, max_body_size=None):
+        """
+        Args:
+            wsgi_app: WSGI 应用，例如 Flask app
+            pool: worker_pools.WorkerPool，排队已满时返回 503
+            max_body_size: 请求体上限（字节），超过时返回 413
+        """
+        self.wsgi_app = wsgi_app
+        self.pool = pool
+        self.max_body_size = max_body_size
+
+    def _environ(self, request):
+        path = request.raw_path.split('?', 1)[0]
+        host, _, port = (request.host or '').partition(':')
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            # WSGI 约定 PATH_INFO 为按 latin-1 解码的原始字节
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': host or 'localhost',
+            'SERVER_PORT': port or ('443' if request.secure else '80'),
+            'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+            'REMOTE_ADDR': request.remote or '',
+            'REMOTE_PORT': str(peer[1]) if isinstance(peer, tuple) and len(peer) > 1 else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': RequestBodyReader(request.content, asyncio.get_running_loop(), self.max_body_size),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif key not in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+                # 分块传输由 aiohttp 解码，对 WSGI 应用来说只是没有长度、读到 EOF 为止的请求体
+                key = 'HTTP_' + key
+                # 同名首部按 WSGI 约定用逗号合并
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        if request.content_length is not None:
+            environ['CONTENT_LENGTH'] = str(request.content_length)
+        else:
+            # 告诉 WSGI 应用请求体会正常结束，可以读到 EOF（否则 werkzeug 把没有长度的请求体当作空）
+            environ['wsgi.input_terminated'] = True
+        return environ
+
+    def _call(self, environ):
+        """在线程池中执行 WSGI 应用，返回 (状态码, 原因, 首部, 响应体)"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started['status'] = status
+            started['headers'] = headers
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        code, _, reason = started['status'].partition(' ')
+        return int(code), reason, started['headers'], body
+
+    async def __call__(self, request):
+        if self.max_body_size is not None and (request.content_length or 0) > self.max_body_size:
+            return web.json_response({'success': False, 'message': '请求体过大'}, status=413)
+        try:
+            status, reason, headers, payload = await self.pool.run(self._call, self._environ(request))
+        except WorkerPoolFull as e:
+            return web.json_response({'success': False, 'message': str(e)}, status=503)
+        response_headers = CIMultiDict(
+            (name, value) for name, value in headers if name.lower() not in HOP_BY_HOP_HEADERS)
+        return web.Response(status=status, reason=reason or None, headers=response_headers, body=payload)
+
+
+class AiohttpWebSocket:
+    """
+    aiohttp WebSocketResponse 的 websockets 风格包装
+    async for 依次得到 str（文本帧）或 bytes（二进制帧），对方关闭时迭代结束；
+    连接已断开时 send() 抛出 websockets.exceptions.ConnectionClosed
+    """
+
+    def __init__(self, ws, request):
+        self.ws = ws
+        self.remote_address = request.transport.get_extra_info('peername') if request.transport else None
+        self.draining = False
+        self._busy = False  # 调用方正在处理上一条消息
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        self._busy = False
+        if self.draining:
+            await self._going_away()
+            raise StopAsyncIteration
+        message = await self.ws.receive()
+        self._busy = True
+        if message.type == WSMsgType.TEXT:
+            return message.data
+        if message.type == WSMsgType.BINARY:
+            return message.data
+        if message.type == WSMsgType.ERROR:
+            logger.error(f"[WebSocket] 连接异常: {self.ws.exception()}")
+        # CLOSE / CLOSING / CLOSED / ERROR
+        raise StopAsyncIteration
+
+    async def recv(self):
+        try:
+            return await self.__anext__()
+        except StopAsyncIteration:
+            raise websockets.exceptions.ConnectionClosed(None, None) from None
+
+    async def send(self, message):
+        if self.ws.closed:
+            raise websockets.exceptions.ConnectionClosed(None, None)
+        try:
+            if isinstance(message, str):
+                await self.ws.send_str(message)
+            else:
+                await self.ws.send_bytes(message)
+        except ConnectionResetError:
+            raise websockets.exceptions.ConnectionClosed(None, None) from None
+
+    async def close(self, code=1000, reason=''):
+        await self.ws.close(code=code, message=reason.encode())
+
+    async def _going_away(self):
+        await self.ws.close(code=WSCloseCode.GOING_AWAY, message='服务重启'.encode())
+
+    async def drain(self):
+        """进程退出前调用：空闲连接立即关闭，正在处理消息的连接等这条消息处理完再关闭"""
+        self.draining = True
+        if not self._busy:
+            await self._going_away()
+
+
+def _is_websocket(request):
+    return request.headers.get('Upgrade', '').lower() == 'websocket'
+
+
+def create_app(handle_client, wsgi_app, pool, static_dir=None, ws_path='/ws', client_max_size=32 * 1024 * 1024,
+               max_message_size=2 ** 20, on_startup=None, on_cleanup=None):
+    """
+    组装 aiohttp 应用
+
+    Args:
+        handle_client: 协程函数 handle_client(websocket)，接收 websockets 风格的连接
+        wsgi_app: 处理其余 HTTP 请求的 WSGI 应用（Flask app）
+        pool: 执行 WSGI 应用的 worker_pools.WorkerPool
+        static_dir: 前端构建目录，存在时 / 返回其中的 index.html，其余存在的静态文件直接发送
+        ws_path: 语音 WebSocket 路径；带 Upgrade 首部请求 / 也按 WebSocket 处理，兼容旧前端只改端口
+        client_max_size: 请求体上限（字节）
+        max_message_size: 单条 WebSocket 消息上限（字节），默认与 websockets.serve 一致；
+            语音消息整段携带录音，调用方应按录音上传上限设置
+        on_startup / on_cleanup: 无参协程函数，随应用启动和关闭调用
+    """
+    adapter = WSGIAdapter(wsgi_app, pool, client_max_size)
+    index = os.path.join(static_dir, 'index.html') if static_dir else None
+    static_root = os.path.realpath(static_dir) if static_dir and os.path.isdir(static_dir) else None
+    connections = set()
+
+    async def websocket_handler(request):
+        ws = web.WebSocketResponse(max_msg_size=max_message_size)
+        await ws.prepare(request)
+        connection = AiohttpWebSocket(ws, request)
+        connections.add(connection)
+        try:
+            await handle_client(connection)
+        finally:
+            connections.discard(connection)
+            await ws.close()
+        return ws
+
+    async def drain_connections(_):
+        # 此时已停止监听；之后 aiohttp 最多等待 shutdown_timeout 秒让处理中的请求结束
+        await asyncio.gather(*(connection.drain() for connection in list(connections)), return_exceptions=True)
+
+    async def root_handler(request):
+        if _is_websocket(request):
+            return await websocket_handler(request)
+        if index and os.path.isfile(index):
+            return web.FileResponse(index)
+        return await adapter(request)
+
+    async def fallback_handler(request):
+        # 前端构建目录里存在的文件直接发送，其余路径（包括不存在的文件）交给 Flask，保持原有路由行为（包括 404）
+        if static_root and request.method in ('GET', 'HEAD'):
+            path = os.path.realpath(os.path.join(static_root, request.match_info['tail']))
+            if path.startswith(static_root + os.sep) and os.path.isfile(path):
+                return web.FileResponse(path)
+        return await adapter(request)
+
+    app = web.Application(client_max_size=client_max_size)
+    app.router.add_get(ws_path, websocket_handler)
+    app.router.add_get('/', root_handler)
+    app.router.add_route('*', '/api/{tail:.*}', adapter)
+    app.router.add_route('*', '/{tail:.*}', fallback_handler)
+
+    app.on_shutdown.append(drain_connections)
+    if on_startup is not None:
+        app.on_startup.append(lambda _: on_startup())
+    if on_cleanup is not None:
+        app.on_cleanup.append(lambda _: on_cleanup())
+    return app
+
+
+if __name__ == '__main__':
+    import asyncio
+    import logging
+    import socket
+    import threading
+    import time
+
+    import aiohttp
+    from flask import Flask, jsonify
+    from werkzeug.serving import make_server
+
+    from worker_pools import get_pool
+
+    print("HTTP + WebSocket 吞吐对比：Flask 开发服务器线程 + websockets 服务 vs 单个 aiohttp 服务")
+    print("=" * 70)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 不逐条打印访问日志
+    demo = Flask(__name__)
+
+    @demo.route('/api/ping')
+    def ping():
+        return jsonify({'ok': True})
+
+    async def echo_client(websocket):
+        """与 handle_client 相同的接口：收到什么回什么"""
+        try:
+            async for message in websocket:
+                await websocket.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def free_port():
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    async def http_load(url, clients=32, seconds=3.0):
+        done = 0
+        latencies = []
+        deadline = time.perf_counter() + seconds
+
+        async def worker(session):
+            nonlocal done
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                async with session.get(url) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - start)
+                done += 1
+
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=clients)) as session:
+            await asyncio.gather(*(worker(session) for _ in range(clients)))
+        latencies.sort()
+        return done / seconds, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+    async def ws_load(url, clients=32, seconds=3.0):
+        done = 0
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal done
+            async with websockets.connect(url) as ws:
+                while time.perf_counter() < deadline:
+                    await ws.send('{"type": "hello"}')
+                    await ws.recv()
+                    done += 1
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        return done / seconds
+
+    def report(name, http, ws):
+        rps, p50, p99 = http
+        print(f"{name:<28} HTTP {rps:7.0f} req/s (p50 {p50:5.1f}ms, p99 {p99:6.1f}ms)  WebSocket {ws:7.0f} msg/s")
+
+    # 旧方案：Flask 开发服务器（每请求一个线程）+ 另一个端口上的 websockets 服务
+    http_port, ws_port = free_port(), free_port()
+    legacy_http = make_server('127.0.0.1', http_port, demo, threaded=True)
+    threading.Thread(target=legacy_http.serve_forever, daemon=True).start()
+
+    async def legacy():
+        async with websockets.serve(echo_client, '127.0.0.1', ws_port):
+            return (await http_load(f'http://127.0.0.1:{http_port}/api/ping'),
+                    await ws_load(f'ws://127.0.0.1:{ws_port}'))
+
+    report('Flask 线程 + websockets', *asyncio.run(legacy()))
+    legacy_http.shutdown()
+
+    # 新方案：单个 aiohttp 服务，同一端口
+    port = free_port()
+
+    async def single():
+        runner = web.AppRunner(create_app(echo_client, demo, get_pool('http', max_workers=8)))
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        try:
+            return (await http_load(f'http://127.0.0.1:{port}/api/ping'),
+                    await ws_load(f'ws://127.0.0.1:{port}/ws'))
+        finally:
+            await runner.cleanup()
+
+    report('aiohttp 单服务', *asyncio.run(single()))
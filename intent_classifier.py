@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+本地轻量意图分类器
+字符 n-gram 哈希特征 + NumPy 线性模型（多类 logistic 回归），
+放在 Agent.router 之前：置信度足够时直接本地给出意图，否则回落到 LLM。
+模型可以直接用记录下来的 LLM 决策（JSONL）训练。
+"""
+
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+
+def char_ngram_counts(text, n_features=2 ** 14, ngram_range=(1, 3)):
+    """统计文本的字符 n-gram，哈希到 n_features 个桶，返回 {桶: 次数}"""
+    text = f" {text.strip().lower()} "
+    counts = {}
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        for i in range(len(text) - n + 1):
+            # 使用 crc32 而不是内置 hash()，保证跨进程稳定
+            bucket = zlib.crc32(text[i:i + n].encode('utf-8')) % n_features
+            counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def hash_features(text, n_features=2 ** 14, ngram_range=(1, 3)):
+    """稀疏特征：返回 L2 归一化后的 (indices, values)"""
+    counts = char_ngram_counts(text, n_features, ngram_range)
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    norm = np.sqrt(np.dot(values, values))
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+
+def hash_vector(text, n_features=2 ** 14, ngram_range=(1, 3)):
+    """稠密特征：返回 L2 归一化后的 float32 向量"""
+    vector = np.zeros(n_features, dtype=np.float32)
+    indices, values = hash_features(text, n_features, ngram_range)
+    vector[indices] = values
+    return vector
+
+
+def log_decision(log_path, text, label, latency=None):
+    """追加一条 LLM 意图决策到 JSONL 日志，供后续训练"""
+    record = {'text': text, 'label': label, 'latency': latency, 'ts': time.time()}
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def load_decisions(log_path):
+    """读取 LLM 意图决策日志，返回 (texts, labels, latencies)"""
+    texts, labels, latencies = [], [], []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('text') is None or record.get('label') is None:
+                continue
+            texts.append(record['text'])
+            labels.append(record['label'])
+            latencies.append(record.get('latency'))
+    return texts, labels, latencies
+
+
+class IntentClassifier:
+    """
+    多类 logistic 回归意图分类器
+
+    训练全程使用稀疏矩阵（indptr/indices/values）做批量梯度下降，
+    预测时只取命中的权重行求和，单条文本耗时在几十微秒量级。
+    """
+
+    def __init__(self, labels=None, n_features=2 ** 14, ngram_range=(1, 3), threshold=0.8):
+        """
+        Args:
+            labels: 意图标签列表，fit 时未指定则从数据中推断
+            n_features: 哈希桶数量
+            ngram_range: 字符 n-gram 范围
+            threshold: 本地直接作答所需的最低置信度
+        """
+        self.labels = list(labels) if labels else []
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.threshold = threshold
+        self.weights = None
+        self.bias = None
+
+    @property
+    def is_trained(self):
+        return self.weights is not None
+
+    def _featurize_batch(self, texts):
+        indptr = [0]
+        all_indices = []
+        all_values = []
+        for text in texts:
+            indices, values = hash_features(text, self.n_features, self.ngram_range)
+            all_indices.append(indices)
+            all_values.append(values)
+            indptr.append(indptr[-1] + len(indices))
+        indices = np.concatenate(all_indices) if all_indices else np.zeros(0, dtype=np.int64)
+        values = np.concatenate(all_values) if all_values else np.zeros(0, dtype=np.float32)
+        return np.asarray(indptr, dtype=np.int64), indices, values
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def fit(self, texts, labels, epochs=200, lr=1.0, l2=1e-4):
+        """
+        用 (文本, LLM 给出的意图) 训练模型
+
+        Args:
+            texts: 用户输入列表
+            labels: 对应的意图标签列表
+            epochs: 梯度下降轮数
+            lr: 学习率
+            l2: L2 正则系数
+        """
+        if len(texts) != len(labels) or not texts:
+            raise ValueError("训练数据为空或文本与标签数量不一致")
+
+        for label in labels:
+            if label not in self.labels:
+                self.labels.append(label)
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([label_index[label] for label in labels], dtype=np.int64)
+
+        n_samples, n_classes = len(texts), len(self.labels)
+        indptr, indices, values = self._featurize_batch(texts)
+        rows = np.repeat(np.arange(n_samples), np.diff(indptr))
+        targets = np.zeros((n_samples, n_classes), dtype=np.float32)
+        targets[np.arange(n_samples), y] = 1.0
+
+        self.weights = np.zeros((self.n_features, n_classes), dtype=np.float32)
+        self.bias = np.zeros(n_classes, dtype=np.float32)
+
+        for _ in range(epochs):
+            # 前向：logits[i] = sum_j values[j] * W[indices[j]]
+            contrib = self.weights[indices] * values[:, None]
+            logits = np.zeros((n_samples, n_classes), dtype=np.float32)
+            np.add.at(logits, rows, contrib)
+            logits += self.bias
+
+            error = (self._softmax(logits) - targets) / n_samples
+
+            grad_w = np.zeros_like(self.weights)
+            np.add.at(grad_w, indices, error[rows] * values[:, None])
+            grad_w += l2 * self.weights
+
+            self.weights -= lr * grad_w
+            self.bias -= lr * error.sum(axis=0)
+
+        return self
+
+    def predict_proba(self, text):
+        """返回各意图的概率向量，顺序与 self.labels 一致"""
+        if not self.is_trained:
+            raise RuntimeError("意图分类器尚未训练")
+        indices, values = hash_features(text, self.n_features, self.ngram_range)
+        logits = values @ self.weights[indices] + self.bias
+        return self._softmax(logits)
+
+    def predict(self, text):
+        """返回 (意图, 置信度)"""
+        proba = self.predict_proba(text)
+        best = int(np.argmax(proba))
+        return self.labels[best], float(proba[best])
+
+    def save(self, path):
+        """保存模型到 .npz 文件"""
+        if not self.is_trained:
+            raise RuntimeError("意图分类器尚未训练")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        meta = {
+            'labels': self.labels,
+            'n_features': self.n_features,
+            'ngram_range': list(self.ngram_range),
+            'threshold': self.threshold,
+        }
+        np.savez_compressed(path, weights=self.weights, bias=self.bias,
+                            meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    @classmethod
+    def load(cls, path):
+        """从 .npz 文件加载模型"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            model = cls(labels=meta['labels'], n_features=meta['n_features'],
+                        ngram_range=meta['ngram_range'], threshold=meta['threshold'])
+            model.weights = data['weights']
+            model.bias = data['bias']
+        return model
+
+    @classmethod
+    def from_decision_log(cls, log_path, **kwargs):
+        """直接从 LLM 决策日志训练一个分类器"""
+        texts, labels, _ = load_decisions(log_path)
+        return cls(**kwargs).fit(texts, labels)
+
+
+def _demo_decisions():
+    """没有真实日志时用于基准测试的合成数据（模拟 chat / restaurant 意图）"""
+    places = ["三亚学院", "公司", "家", "西湖", "国贸", "五道口", "火车站", "商场", "医院", "幼儿园"]
+    foods = ["好吃的", "火锅", "粤菜", "小吃", "餐厅", "饭店", "海鲜", "烧烤", "早茶", "面馆"]
+    restaurant_templates = ["{p}附近有什么{f}？", "推荐一下{p}周边的{f}", "{p}哪里有{f}",
+                            "想在{p}附近吃{f}", "{p}旁边的{f}怎么样"]
+    chat_templates = ["今天好累啊，{p}的事情太多了", "我在{p}待了一天，心情不太好", "你觉得我应该早点休息吗",
+                      "宝宝今天又哭了很久", "和你聊聊天吧，{p}好无聊", "最近睡不好怎么办"]
+    texts, labels = [], []
+    for i, p in enumerate(places):
+        for j, f in enumerate(foods):
+            texts.append(restaurant_templates[(i + j) % len(restaurant_templates)].format(p=p, f=f))
+            labels.append('restaurant')
+            texts.append(chat_templates[(i + j) % len(chat_templates)].format(p=p))
+            labels.append('chat')
+    return texts, labels, [None] * len(texts)
+
+
+if __name__ == '__main__':
+    import sys
+
+    print("本地意图分类器基准测试")
+    print("=" * 50)
+
+    if len(sys.argv) > 1:
+        texts, labels, latencies = load_decisions(sys.argv[1])
+        print(f"LLM 决策日志: {sys.argv[1]} ({len(texts)} 条)")
+    else:
+        texts, labels, latencies = _demo_decisions()
+        print(f"未指定日志，使用合成数据 ({len(texts)} 条)")
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(texts))
+    split = int(len(order) * 0.8)
+    train_idx, test_idx = order[:split], order[split:]
+
+    model = IntentClassifier(threshold=0.8)
+    start = time.perf_counter()
+    model.fit([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+    print(f"训练耗时: {(time.perf_counter() - start) * 1000:.1f} ms ({len(train_idx)} 条)")
+
+    agree = confident = confident_agree = 0
+    elapsed = 0.0
+    for i in test_idx:
+        start = time.perf_counter()
+        label, confidence = model.predict(texts[i])
+        elapsed += time.perf_counter() - start
+        agree += label == labels[i]
+        if confidence >= model.threshold:
+            confident += 1
+            confident_agree += label == labels[i]
+
+    n_test = len(test_idx)
+    known = [latencies[i] for i in test_idx if latencies[i]]
+    llm_latency = sum(known) / len(known) if known else 1.5
+    print(f"与 LLM 一致率（全部）: {agree / n_test:.1%}")
+    print(f"本地作答覆盖率 (置信度 >= {model.threshold}): {confident / n_test:.1%}")
+    if confident:
+        print(f"与 LLM 一致率（本地作答部分）: {confident_agree / confident:.1%}")
+    print(f"本地预测平均耗时: {elapsed / n_test * 1e6:.1f} µs")
+    print(f"LLM 平均耗时: {llm_latency:.2f} s{'' if known else ' (假设值)'}")
+    print(f"每次请求平均节省: {confident / n_test * llm_latency * 1000:.0f} ms")
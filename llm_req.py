@@ -2,18 +2,24 @@ import uuid
 import os
 import sys
 from router import LLMRouter
+from intent_classifier import log_decision
+from output_sink import OutputSink, NULL_SINK, get_logger
 import requests
 import json
 import asyncio
 import time
 
+logger = get_logger('llm_agent')
+
 class Agent(LLMRouter):
+    default_sink = None # 实例级默认输出通道，None 表示按 stream_output 决定
 
     def stdout_off(self):
-        sys.stdout = open(os.devnull, 'w')
+        """关闭本实例的流式输出（只影响当前 Agent，不再替换全局 sys.stdout）"""
+        self.default_sink = NULL_SINK
 
     def stdout_on(self):
-        sys.stdout = sys.__stdout__
+        self.default_sink = None
 
     def router(
         self,
@@ -28,7 +34,8 @@ class Agent(LLMRouter):
         base_url: str = None,
         schema: dict = None,
         stream_output: bool = True,
-        description=''
+        description='',
+        sink: OutputSink = None
     ):
         """
         provider: 指定的供应商，可选值：
@@ -40,6 +47,8 @@ class Agent(LLMRouter):
             - 'glm_coding': GLM Coding (/api/coding/pass/v4)
 
         stream_output: 是否打印流式输出到控制台，默认为 True
+        sink: 本次调用的流式输出通道 (NullSink / ConsoleSink / CallbackSink / AsyncQueueSink)，
+              指定后忽略 stream_output
 
         * 支持图像理解;
         * 支持文档理解 (gemini, anthropic);
@@ -57,14 +66,61 @@ class Agent(LLMRouter):
         handler = getattr(self, self._providers[actual_provider]['handler'].__name__)
         return handler(prompt=prompt, systemInstruction=systemInstruction, image_path=image_path, schema=schema,
                        pdf_path=pdf_path, pdf_data=pdf_data, model=model, api_key=api_key, base_url=base_url,
-                       stream_output=stream_output, desc=description)
+                       stream_output=stream_output, desc=description,
+                       sink=sink if sink is not None else self.default_sink)
+
+    def route_intent(
+        self,
+        user_input: str,
+        prompt: str,
+        schema: dict,
+        classifier=None,
+        threshold: float = None,
+        decision_log: str = None,
+        intent_key: str = 'intent',
+        **router_kwargs
+    ):
+        """
+        意图识别：本地分类器优先，置信度不足时回落到 LLM
+
+        classifier: IntentClassifier 实例，未训练或为 None 时直接走 LLM
+        threshold: 本地作答的最低置信度，默认使用 classifier.threshold
+        decision_log: LLM 决策日志路径 (JSONL)，用于后续重新训练本地分类器
+        intent_key: schema 中意图字段名
+
+        返回值与 LLM 结构化输出一致，例如 {"intent": "restaurant"}
+        """
+        if classifier is not None and classifier.is_trained:
+            label, confidence = classifier.predict(user_input)
+            if confidence >= (threshold if threshold is not None else classifier.threshold):
+                logger.info(f"[Intent] 本地分类: {label} (置信度 {confidence:.2f})")
+                return {intent_key: label}
+
+        start = time.perf_counter()
+        result = self.router(prompt=prompt, schema=schema, **router_kwargs)
+        latency = time.perf_counter() - start
+
+        if decision_log and isinstance(result, dict) and intent_key in result:
+            log_decision(decision_log, user_input, result[intent_key], latency)
+
+        return result
 
 
 if __name__ == '__main__':
+    from intent_classifier import IntentClassifier
+
     llm = Agent()
     user_input = "三亚学院附近有什么好吃的？"
-    
-    result = llm.router(
+
+    # 本地意图模型（由 intent_decisions.jsonl 训练得到），不存在时全部走 LLM
+    intent_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'intent_classifier.npz')
+    intent_log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'intent_decisions.jsonl')
+    classifier = IntentClassifier.load(intent_model_path) if os.path.exists(intent_model_path) else None
+
+    result = llm.route_intent(
+        user_input=user_input,
+        classifier=classifier,
+        decision_log=intent_log_path,
         prompt=f"""
         你的任务是针对用户的输入进行**意图识别**
 
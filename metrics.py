@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标注册表
+各模块注册一个返回 dict 的函数，/api/metrics 统一汇总输出
+"""
+
+import threading
+
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """注册指标来源，provider() 返回可 JSON 序列化的 dict"""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot(exclude=()):
+    """采集所有已注册的指标，exclude 中的来源不采集"""
+    with _lock:
+        providers = dict(_providers)
+    result = {}
+    for name, provider in providers.items():
+        if name in exclude:
+            continue
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+输出通道 (Output Sink) 与非阻塞日志
+- 每次 LLM 调用可以单独指定流式输出去向：丢弃 / 控制台 / 回调 / asyncio 队列
+- 控制台输出与诊断日志统一交给后台线程写出，热路径只做一次入队，不会阻塞在终端 I/O 上
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+
+
+class _ConsoleWriter:
+    """后台控制台写线程：批量取出待写文本，写完一批再 flush 一次"""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='console-writer', daemon=True)
+                    self._thread.start()
+
+    def write(self, text):
+        self._ensure_started()
+        self._queue.put(text)
+
+    def _run(self):
+        stream = sys.__stdout__
+        while True:
+            text = self._queue.get()
+            if text is None:
+                break
+            parts = [text]
+            stop = False
+            while True:
+                try:
+                    text = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if text is None:
+                    stop = True
+                    break
+                parts.append(text)
+            try:
+                stream.write(''.join(parts))
+                stream.flush()
+            except Exception:
+                pass
+            if stop:
+                break
+
+    def close(self, timeout=1.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _after_fork(self):
+        # fork 出的子进程里没有写线程，队列和锁可能停在父进程写了一半的状态，全部换新
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+_console = _ConsoleWriter()
+atexit.register(_console.close)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_console._after_fork)
+
+
+def flush_console(timeout=1.0):
+    """写完队列里剩余的输出并停止写线程；multiprocessing 子进程退出时不跑 atexit，需要显式调用"""
+    _console.close(timeout)
+
+
+class OutputSink:
+    """流式输出通道基类"""
+
+    def write(self, text: str):
+        raise NotImplementedError
+
+    def end(self):
+        """一次流式输出结束"""
+        pass
+
+
+class NullSink(OutputSink):
+    """丢弃所有输出"""
+
+    def write(self, text: str):
+        pass
+
+
+class ConsoleSink(OutputSink):
+    """写到控制台（经后台线程，不阻塞调用方）"""
+
+    def write(self, text: str):
+        _console.write(text)
+
+    def end(self):
+        _console.write('\n')
+
+
+class CallbackSink(OutputSink):
+    """每个增量文本调用一次 callback(text)，由调用方自行保证 callback 足够轻量"""
+
+    def __init__(self, callback, on_end=None):
+        self.callback = callback
+        self.on_end = on_end
+
+    def write(self, text: str):
+        self.callback(text)
+
+    def end(self):
+        if self.on_end:
+            self.on_end()
+
+
+class AsyncQueueSink(OutputSink):
+    """
+    把增量文本投递到 asyncio.Queue，可在工作线程中安全调用
+    消费方在 LLM 调用结束后调用 close()，队列中会收到 None 作为结束标记
+    """
+
+    def __init__(self, loop, async_queue=None):
+        self.loop = loop
+        self.queue = async_queue if async_queue is not None else asyncio.Queue()
+
+    def write(self, text: str):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+
+NULL_SINK = NullSink()
+CONSOLE_SINK = ConsoleSink()
+
+
+class _ConsoleLogHandler(logging.Handler):
+    """日志记录格式化后交给后台写线程"""
+
+    def emit(self, record):
+        try:
+            _console.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+def get_logger(name: str, level=logging.INFO):
+    """获取非阻塞日志器：记录只在调用线程格式化并入队，由后台线程写到控制台"""
+    logger = logging.getLogger(name)
+    if not any(isinstance(h, _ConsoleLogHandler) for h in logger.handlers):
+        handler = _ConsoleLogHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+    return logger
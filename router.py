@@ -1,13 +1,12 @@
 """
 TODO:
 
-1. 清理所有 self.log 和 self.warn 的代码，或改写为 print
+1. 清理所有 self.log 和 self.warn 的代码，统一改写为 logger（见 output_sink.get_logger）
 2. 执行 python llm_req.py ，确保测试通过
 
 """
 
 import os
-import sys
 import time
 import random
 from functools import wraps
@@ -15,14 +14,105 @@ import requests
 import base64
 import json
 
+from output_sink import OutputSink, NULL_SINK, CONSOLE_SINK, get_logger
+
+logger = get_logger('llm_router')
+
 # TODO: 思考数据的控制台浅色输出
 
+class Base64File:
+    """
+    文件级 base64 编码器：请求体序列化时才按块读取文件并编码，
+    不在内存中保留整份文件内容或 base64 字符串
+    """
+    CHUNK_SIZE = 3 * 64 * 1024  # 必须是 3 的倍数，分块编码结果才能直接拼接
+
+    def __init__(self, path: str, prefix: str = ''):
+        self.path = path
+        self.prefix = prefix # 例如 data URL 的 "data:image/png;base64,"
+
+    def iter_chunks(self):
+        if self.prefix:
+            yield self.prefix.encode('utf-8')
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+
+
+def _iter_json_parts(obj):
+    """递归地把 payload 序列化为 JSON 片段，Base64File 字段逐块写出"""
+    if isinstance(obj, Base64File):
+        yield b'"'
+        yield from obj.iter_chunks()
+        yield b'"'
+    elif isinstance(obj, dict):
+        yield b'{'
+        for i, (key, value) in enumerate(obj.items()):
+            if i:
+                yield b', '
+            yield json.dumps(str(key)).encode('utf-8')
+            yield b': '
+            yield from _iter_json_parts(value)
+        yield b'}'
+    elif isinstance(obj, (list, tuple)):
+        yield b'['
+        for i, value in enumerate(obj):
+            if i:
+                yield b', '
+            yield from _iter_json_parts(value)
+        yield b']'
+    else:
+        yield json.dumps(obj, allow_nan=False).encode('utf-8')
+
+
+def iter_json(obj, chunk_size: int = 64 * 1024):
+    """
+    流式 JSON 请求体生成器（配合 requests 的 chunked 传输）
+    小片段合并到 chunk_size 再写出，大块附件直接透传，单次请求的内存占用与附件大小无关
+    """
+    buffer = bytearray()
+    for part in _iter_json_parts(obj):
+        if len(part) >= chunk_size:
+            if buffer:
+                yield bytes(buffer)
+                buffer.clear()
+            yield part
+            continue
+        buffer += part
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+class _TrackedSink(OutputSink):
+    """转发到调用方的输出通道，并记录是否已经输出过内容"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.written = False
+
+    def write(self, text: str):
+        self.written = True
+        self.sink.write(text)
+
+    def end(self):
+        self.sink.end()
+
+
 def exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2):
-    """指数退避重试装饰器"""
+    """指数退避重试装饰器；流式输出已经写出内容后失败不再重试，避免同样的内容再输出一遍"""
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             last_exception = None
+            sink = kwargs.get('sink')
+            if sink is not None:
+                sink = kwargs['sink'] = _TrackedSink(sink)
 
             for attempt in range(max_retries + 1):
                 try:
@@ -33,11 +123,13 @@ def exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff
                         ConnectionError,
                         TimeoutError) as e:
                     last_exception = e
+                    if sink is not None and sink.written:
+                        # 下游（逐句TTS、客户端）已经收到部分回复，重试会从头再输出一遍
+                        logger.error(f"流式输出中途失败，不再重试: {e}")
+                        break
                     if attempt == max_retries:
                         # 最后一次重试失败，记录错误并返回None
-                        self = args[0] if args and hasattr(args[0], 'log') else None
-                        if self:
-                            print(f"重试{max_retries}次后仍然失败: {e}")
+                        logger.error(f"重试{max_retries}次后仍然失败: {e}")
                         break
 
                     # 计算退避延迟时间，加入随机抖动
@@ -45,9 +137,7 @@ def exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff
                     jitter = delay * 0.1 * random.random()
                     sleep_time = delay + jitter
 
-                    self = args[0] if args and hasattr(args[0], 'log') else None
-                    if self:
-                        print(f"第{attempt + 1}次请求失败，{sleep_time:.2f}秒后重试: {e}")
+                    logger.warning(f"第{attempt + 1}次请求失败，{sleep_time:.2f}秒后重试: {e}")
 
                     time.sleep(sleep_time)
                 except Exception as e:
@@ -61,6 +151,7 @@ def exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff
 
 class LLMRouter:
     _providers = {}
+    stream_request_body = True # False 时一次性拼出请求体（兼容不支持 chunked 上传的网关）
 
     @classmethod
     def register(cls, name: str, model_patterns: list = None):
@@ -81,42 +172,53 @@ class LLMRouter:
                     return name
         return 'openai_completions' # 默认 openai chat completions 格式（兼容大部分规范）
 
+    def _resolve_sink(self, sink, stream_output):
+        """未指定输出通道时，按 stream_output 选择控制台或丢弃"""
+        if sink is not None:
+            return sink
+        return CONSOLE_SINK if stream_output else NULL_SINK
+
     def _get_headers(self, api_key):
         return {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {api_key}"
         }
 
-    def _get_b64(self, img):
-        final_image_data = None
-        try:
-            with open(img, 'rb') as f:
-                final_image_data = f.read()
-            if img.lower().endswith('.png'):
-                image_mime_type = 'image/png'
-            elif img.lower().endswith('.webp'):
-                image_mime_type = 'image/webp'
-            elif img.lower().endswith('.git'):
-                image_mime_type = 'image/gif'
-            else:
-                image_mime_type = 'image/jpeg'
-        except FileNotFoundError:
-            print(f"Error: Image file not found: {img}")
-        except Exception as e:
-            print(f"Error reading image file: {e}")
-            return None
-        img_b64 = base64.b64encode(final_image_data).decode('utf-8')
-        return image_mime_type, img_b64
+    def _get_mime_type(self, img):
+        img_lower = img.lower()
+        if img_lower.endswith('.png'):
+            return 'image/png'
+        elif img_lower.endswith('.webp'):
+            return 'image/webp'
+        elif img_lower.endswith('.gif'):
+            return 'image/gif'
+        return 'image/jpeg'
+
+    def _get_b64(self, img, data_url=False):
+        """
+        返回 (mime_type, Base64File)；文件内容在发送请求时才按块编码
+        data_url: 为 True 时编码结果带 "data:<mime>;base64," 前缀
+        """
+        if not os.path.isfile(img):
+            logger.error(f"Error: Image file not found: {img}")
+            raise FileNotFoundError(img)
+        image_mime_type = self._get_mime_type(img)
+        prefix = f"data:{image_mime_type};base64," if data_url else ''
+        return image_mime_type, Base64File(img, prefix=prefix)
     
     def _get_pdf_b64(self, pdf):
         from PyPDF2 import PdfReader
 
         pages = len(PdfReader(pdf).pages)
-        pdf_size_mb = os.path.getsize(pdf_path) / (1024 ** 2)
-        with open(pdf, 'rb') as f:
-            pdf_data = base64.b64encode(f.read()).decode('utf-8')
+        pdf_size_mb = os.path.getsize(pdf) / (1024 ** 2)
+
+        return pages, pdf_size_mb, Base64File(pdf)
 
-        return pages, pdf_size_mb, pdf_data
+    def _json_body(self, payload):
+        """请求体：默认流式分块生成，关闭 stream_request_body 时一次性拼接"""
+        if self.stream_request_body:
+            return iter_json(payload)
+        return b''.join(iter_json(payload))
 
     def _parse_json_response(self, content: str):
         """
@@ -156,7 +258,7 @@ class LLMRouter:
                 pass
 
         # 如果所有解析都失败，返回原始内容
-        print(f'Json 解析失败，返回字符串结果: {content}')
+        logger.error(f'Json 解析失败，返回字符串结果: {content}')
         return content
 
     # NOTE: 弃用
@@ -192,13 +294,15 @@ class LLMRouter:
     #     return "openai"  # 默认为标准 JSON Schema
 
     @exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2)
-    def _openai_completions(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str):
+    def _openai_completions(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str, sink: OutputSink = None):
+
+        sink = self._resolve_sink(sink, stream_output)
 
         if pdf_path != [] or pdf_data:
-            print(f"OpenAI 暂不支持文档理解")
+            logger.info(f"OpenAI 暂不支持文档理解")
             return None
 
-        print(f"Call LLM with {model}@_openai_completions: {desc}")
+        logger.info(f"Call LLM with {model}@_openai_completions: {desc}")
 
         messages = []
         contents = []
@@ -217,9 +321,9 @@ class LLMRouter:
 
         if image_path != []:
             for img in image_path:
-                mime_type, b64_data = self._get_b64(img)
+                mime_type, data_url = self._get_b64(img, data_url=True)
                 contents.append({"type": "image_url", "image_url": {
-                    "url": f"data:{mime_type};base64,{b64_data}"
+                    "url": data_url
                 }})
 
         messages.append({"role": "user", "content": contents})    
@@ -241,10 +345,10 @@ class LLMRouter:
         full_content = ""
 
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True) as response:
+            with requests.post(url, headers=headers, data=self._json_body(payload), stream=True) as response:
 
                 if response.status_code != 200:
-                    print(f"Error {response.status_code}: {response.text}")
+                    logger.error(f"Error {response.status_code}: {response.text}")
                     return None
                 
                 for line in response.iter_lines():
@@ -269,40 +373,40 @@ class LLMRouter:
 
                             if content:
                                 full_content += content
-                                if stream_output:
-                                    sys.stdout.write(content)
-                                    sys.stdout.flush()
+                                sink.write(content)
                         
                             finish_reason = choices[0].get("finish_reason")
                             if finish_reason:
-                                if stream_output:
-                                    print()
+                                sink.end()
                                 # print(f"[Finish Reason: {finish_reason}]")
-                                print(f"[Status: completed]") # Update: 保持日志风格统一
+                                logger.info(f"[Status: completed]") # Update: 保持日志风格统一
                         usage = chunk.get("usage")
                         if usage:
-                            print(f"[Token Usage - Prompt: {usage.get('prompt_tokens')}, "
+                            logger.info(f"[Token Usage - Prompt: {usage.get('prompt_tokens')}, "
                                   f"Completion: {usage.get('completion_tokens')}, "
                                   f"Total: {usage.get('total_tokens')}]")
 
                     except json.JSONDecodeError as e:
-                        print(f"\nJSON Decode Error: {e}")
+                        logger.error(f"\nJSON Decode Error: {e}")
                         continue
 
         except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            return None
+            # 交给 exponential_backoff_retry：还没输出内容时退避重试，已经输出过则不再重试，最终返回 None
+            logger.error(f"Request Error: {e}")
+            raise
 
         return full_content
 
     @exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2)
-    def _openai_responses(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str):
-        
+    def _openai_responses(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str, sink: OutputSink = None):
+
+        sink = self._resolve_sink(sink, stream_output)
+
         if pdf_path != [] or pdf_data:
-            print(f"OpenAI 暂不支持文档理解")
+            logger.info(f"OpenAI 暂不支持文档理解")
             return None
 
-        print(f"Call LLM with {model}@_openai_responses: {desc}")
+        logger.info(f"Call LLM with {model}@_openai_responses: {desc}")
         
         messages = []
         contents = []
@@ -310,8 +414,8 @@ class LLMRouter:
         contents.append({"type": "input_text", "text": prompt})
         if image_path != []:
             for img in image_path:
-                mime_type, b64_data = self._get_b64(img)
-                contents.append({"type": "input_image", "image_url": f"data:{mime_type};base64,{b64_data}"})
+                mime_type, data_url = self._get_b64(img, data_url=True)
+                contents.append({"type": "input_image", "image_url": data_url})
         
         messages.append({"role": "user", "content": contents})
 
@@ -342,10 +446,10 @@ class LLMRouter:
         response_id = None
 
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True) as response:
+            with requests.post(url, headers=headers, data=self._json_body(payload), stream=True) as response:
 
                 if response.status_code != 200:
-                    print(f"Error {response.status_code}: {response.text}")
+                    logger.error(f"Error {response.status_code}: {response.text}")
                     return None
 
                 for line in response.iter_lines():
@@ -371,15 +475,13 @@ class LLMRouter:
                         if event_type == "response.created":
                             resp = event.get("response", {})
                             response_id = resp.get("id")
-                            print(f"[Response Created: {response_id}]")
+                            logger.info(f"[Response Created: {response_id}]")
                         
                         elif event_type == "response.output_text.delta":
                             delta = event.get("delta", "")
                             if delta:
                                 full_content += delta
-                                if stream_output:
-                                    sys.stdout.write(delta)
-                                    sys.stdout.flush()
+                                sink.write(delta)
 
                         elif event_type == "response.output_text.done":
                             text = event.get("text", "")
@@ -389,23 +491,22 @@ class LLMRouter:
                             status = resp.get("status")
                             usage = resp.get("usage", {})
 
-                            if stream_output:
-                                print()
-                            print(f"[Status: {status}]")
+                            sink.end()
+                            logger.info(f"[Status: {status}]")
 
                             if usage:
-                                print(f"[Token Usage - Prompt: {usage.get('input_tokens')}, "
+                                logger.info(f"[Token Usage - Prompt: {usage.get('input_tokens')}, "
                                         f"Completion: {usage.get('output_tokens')}, "
                                         f"Total: {usage.get('total_tokens')}]")
 
                         elif event_type == "response.failed":
                             resp = event.get("response", {})
                             error = resp.get("error", {})
-                            print(f"\n[Error: {error}]")
+                            logger.error(f"\n[Error: {error}]")
 
                         elif event_type == "error":
                             error = event.get("error", {})
-                            print(f"\n[Stream Error: {error}]")
+                            logger.error(f"\n[Stream Error: {error}]")
                         
                         else:
                             pass
@@ -414,15 +515,18 @@ class LLMRouter:
                         continue
 
         except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            return None
+            # 交给 exponential_backoff_retry：还没输出内容时退避重试，已经输出过则不再重试，最终返回 None
+            logger.error(f"Request Error: {e}")
+            raise
 
         return full_content
     
     @exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2)
-    def _anthropic_messages(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str):
+    def _anthropic_messages(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str, sink: OutputSink = None):
 
-        print(f"Call LLM with {model}@_anthropic_messages: {desc}")
+        sink = self._resolve_sink(sink, stream_output)
+
+        logger.info(f"Call LLM with {model}@_anthropic_messages: {desc}")
 
         messages = []
         contents = []
@@ -473,7 +577,7 @@ class LLMRouter:
 
         # TODO: 完善结构化输出
         if schema:
-            print(f"Anthropic Messages 格式的结构化输出待开发……")
+            logger.info(f"Anthropic Messages 格式的结构化输出待开发……")
 
         if systemInstruction:
             payload["system"] = systemInstruction
@@ -483,16 +587,16 @@ class LLMRouter:
         output_tokens = 0
 
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True) as response:
+            with requests.post(url, headers=headers, data=self._json_body(payload), stream=True) as response:
 
                 if response.status_code != 200:
                     try:
                         error_data = response.json()
                         error_type = error_data.get("error", {}).get("type", "unknown")
                         error_message = error_data.get("error", {}).get("message", "Unknown error")
-                        print(f"Error {response.status_code} - {error_type}: {error_message}")
+                        logger.error(f"Error {response.status_code} - {error_type}: {error_message}")
                     except:
-                        print(f"Error {response.status_code}: {response.text}")
+                        logger.error(f"Error {response.status_code}: {response.text}")
                     return None
 
                 for line in response.iter_lines():
@@ -526,9 +630,7 @@ class LLMRouter:
                                     text = delta.get("text", "")
                                     if text:
                                         full_content += text
-                                        if stream_output:
-                                            sys.stdout.write(text)
-                                            sys.stdout.flush()
+                                        sink.write(text)
 
                             elif event_type == "message_delta":
                                 delta = data.get("delta", {})
@@ -537,13 +639,12 @@ class LLMRouter:
                                     output_tokens = usage.get("output_tokens", 0)
 
                             elif event_type == "message_stop":
-                                if stream_output:
-                                    print()
-                                print(f'[Status]: completed')
+                                sink.end()
+                                logger.info(f'[Status]: completed')
 
                                 if input_tokens > 0 or output_tokens > 0:
                                     total_tokens = input_tokens + output_tokens
-                                    print(f"[Token Usage - Prompt: {input_tokens}, "
+                                    logger.info(f"[Token Usage - Prompt: {input_tokens}, "
                                       f"Completion: {output_tokens}, "
                                       f"Total: {total_tokens}]")
                                 break
@@ -552,25 +653,28 @@ class LLMRouter:
                                 error = data.get("error", {})
                                 error_type = error.get("type", "unknown")
                                 error_message = error.get("message", "Unknown error")
-                                print(f"\n[API Error - {error_type}: {error_message}]")
+                                logger.error(f"\n[API Error - {error_type}: {error_message}]")
                                 break
 
                         except json.JSONDecodeError as e:
-                            print(f"\n[JSON Decode Error: {e}]")
-                            print(f"[Raw data: {data_str[:100]}...]")
+                            logger.error(f"\n[JSON Decode Error: {e}]")
+                            logger.info(f"[Raw data: {data_str[:100]}...]")
                             continue
 
         except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            return None
+            # 交给 exponential_backoff_retry：还没输出内容时退避重试，已经输出过则不再重试，最终返回 None
+            logger.error(f"Request Error: {e}")
+            raise
 
         return full_content
 
 
     @exponential_backoff_retry(max_retries=3, base_delay=1, max_delay=60, backoff_factor=2)
-    def _gemini_generateContent(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str):
-        
-        print(f"Call LLM with {model}@_gemini_generateContent: {desc}")
+    def _gemini_generateContent(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str, sink: OutputSink = None):
+
+        sink = self._resolve_sink(sink, stream_output)
+
+        logger.info(f"Call LLM with {model}@_gemini_generateContent: {desc}")
 
         api_key = api_key if api_key else "YOUR-APIKEY"
         base_url = base_url if base_url else "https://api.singinggirl.com/v1beta"
@@ -601,7 +705,7 @@ class LLMRouter:
             for pdf in pdf_path:
                 pages, pdf_size, pdf_data = self._get_pdf_b64(pdf)
                 if pages > 1000 or pdf_size > 50: # TODO: 上提，不要写死
-                    print(f"Gemini 支持不超过 50MB 或 1,000 页的 PDF 文件，请对文件额外处理后重试")
+                    logger.info(f"Gemini 支持不超过 50MB 或 1,000 页的 PDF 文件，请对文件额外处理后重试")
                     return None
                 parts.append({"inline_data": {
                     "mime_type": "application/pdf",
@@ -627,11 +731,11 @@ class LLMRouter:
         full_content = ""
 
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True) as response:
+            with requests.post(url, headers=headers, data=self._json_body(payload), stream=True) as response:
 
                 if response.status_code != 200:
                     error_data = response.json() if response.headers.get('content-type') == 'application/json' else response.text
-                    print(f"Error {response.status_code}: {error_data}")
+                    logger.error(f"Error {response.status_code}: {error_data}")
                     return None
 
                 for line in response.iter_lines():
@@ -654,7 +758,7 @@ class LLMRouter:
 
                         if "error" in chunk:
                             error = chunk["error"]
-                            print(f"\n[API Error: {error.get('message', 'Unknown error')}]")
+                            logger.error(f"\n[API Error: {error.get('message', 'Unknown error')}]")
                             break
 
                         candidates = chunk.get("candidates", [])
@@ -667,7 +771,7 @@ class LLMRouter:
                         if safety_ratings:
                             blocked = any(rating.get("blocked", False) for rating in safety_ratings)
                             if blocked:
-                                print("\n[Content blocked by safety filters]")
+                                logger.error("\n[Content blocked by safety filters]")
                                 break
 
                         content = candidate.get("content", {})
@@ -680,35 +784,33 @@ class LLMRouter:
                             if 'text' in part:
                                 text = part["text"]
                                 full_content += text
-                                if stream_output:
-                                    sys.stdout.write(text)
-                                    sys.stdout.flush()
+                                sink.write(text)
 
                         finish_reason = candidate.get("finishReason")
                         if finish_reason:
-                            if stream_output:
-                                print()
+                            sink.end()
                             # print(f"\n\n[Finish Reason: {finish_reason}]")
-                            print(f"[Status: completed]") # Update: 保持日志风格统一
+                            logger.info(f"[Status: completed]") # Update: 保持日志风格统一
                             usage = chunk.get("usageMetadata")
                             if usage:
                                 prompt_tokens = usage.get("promptTokenCount", 0)
                                 candidates_tokens = usage.get("candidatesTokenCount", 0)
                                 total_tokens = usage.get("totalTokenCount", 0)
 
-                                print(f"[Token Usage - Prompt: {prompt_tokens}, "
+                                logger.info(f"[Token Usage - Prompt: {prompt_tokens}, "
                                   f"Completion: {candidates_tokens}, "
                                   f"Total: {total_tokens}]")
 
                             break
 
                     except json.JSONDecodeError as e:
-                        print(f"\nJSON Decode Error: {e}")
+                        logger.error(f"\nJSON Decode Error: {e}")
                         continue
 
         except requests.exceptions.RequestException as e:
-            print(f"Request Error: {e}")
-            return None
+            # 交给 exponential_backoff_retry：还没输出内容时退避重试，已经输出过则不再重试，最终返回 None
+            logger.error(f"Request Error: {e}")
+            raise
 
         # 当有 schema 时，尝试解析 JSON
         if schema:
@@ -718,17 +820,17 @@ class LLMRouter:
 
 
 
-    def _glm_coding(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str):
+    def _glm_coding(self, prompt: str, systemInstruction: str, image_path: list, pdf_path: list, pdf_data: str, model: str, api_key: str, base_url: str, schema: dict, stream_output: bool, desc: str, sink: OutputSink = None):
 
         if pdf_path != [] or pdf_data:
-            print(f"GLM 暂不支持文档理解")
+            logger.info(f"GLM 暂不支持文档理解")
             return None
 
         if schema:
-            print(f"GLM 暂不支持结构化输出")
+            logger.info(f"GLM 暂不支持结构化输出")
             return None
 
-        print(f"{model} 兼容 openai chat completions 格式")
+        logger.info(f"{model} 兼容 openai chat completions 格式")
 
         return self._openai_completions(
             prompt=prompt,
@@ -741,7 +843,8 @@ class LLMRouter:
             base_url='https://open.bigmodel.cn/api/coding/paas/v4',
             schema=None,
             stream_output=stream_output,
-            desc=desc
+            desc=desc,
+            sink=sink
         )
 
 # 注册装饰器
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+语义近似问答缓存
+用字符 n-gram 哈希 + TF-IDF 作为本地向量（纯 NumPy，无网络），
+内存矩阵索引做 top-k 余弦检索，命中时直接返回已缓存的回答和 TTS 音频。
+“哺乳期失眠怎么办”和“哺乳期便秘怎么办”共享大部分句式 n-gram，余弦相似度很高但不是同一个问题，
+因此命中还要求去掉句式词后的主题词有足够重叠。
+"""
+
+import io
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from Audio.baidu_auth import FileLock
+from intent_classifier import char_ngram_counts
+from output_sink import get_logger
+
+logger = get_logger('semantic_cache')
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+# 提问句式里常见、与主题无关的词，长的在前，保证先匹配完整的词
+TEMPLATE_PHRASES = sorted({
+    '怎么办', '怎么样', '怎么', '如何', '该怎么调理', '调理', '有什么食谱', '有什么', '什么', '吃什么好', '吃什么',
+    '吃啥', '喝什么', '能喝什么汤', '可以', '能不能', '能', '会不会', '是不是', '严重吗', '要不要', '应该',
+    '哺乳期', '产后', '生完宝宝', '生完孩子', '坐月子', '月子里', '月子期间', '月子', '剖腹产后', '顺产后',
+    '二胎后', '最近', '感觉', '总是', '一直', '有点', '比较', '好', '很', '吗', '呢', '啊', '呀', '了', '的', '我',
+}, key=len, reverse=True)
+_TEMPLATE = re.compile('|'.join(map(re.escape, TEMPLATE_PHRASES)))
+
+
+def topic_terms(text):
+    """去掉句式词后剩余片段的字符 bigram（单字片段取单字），作为问题的主题词"""
+    terms = set()
+    for piece in _TEMPLATE.split(_NON_WORD.sub(' ', text.lower())):
+        for segment in piece.split():
+            if len(segment) == 1:
+                terms.add(segment)
+            terms.update(segment[i:i + 2] for i in range(len(segment) - 1))
+    return terms
+
+
+def topic_overlap(a, b):
+    """两组主题词的重叠比例（交集 / 较小的一组）；都没有主题词时视为一致"""
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class SemanticCache:
+    """
+    近似问题缓存
+
+    索引矩阵保存每个问题的原始词频 (TF)，IDF 随缓存内容增量更新，
+    检索时再加权，因此新增条目不需要重算已有向量。
+    """
+
+    def __init__(self, path=None, threshold=0.5, ttl=7 * 24 * 3600, max_entries=1000,
+                 n_features=2 ** 12, ngram_range=(1, 2), autosave_interval=60, min_topic_overlap=0.5):
+        """
+        Args:
+            path: 持久化文件路径 (.npz)，为 None 时只保存在内存
+            threshold: 余弦相似度阈值，达到后还要通过主题词检查才视为同一问题
+            ttl: 条目有效期（秒），为 None 时不过期
+            max_entries: 最大条目数，超出时淘汰最久未命中的条目
+            n_features: 哈希向量维度
+            ngram_range: 字符 n-gram 范围
+            autosave_interval: 新增条目后自动落盘的最小间隔（秒），在后台线程中进行
+            min_topic_overlap: 主题词最低重叠比例，见 topic_overlap()
+        """
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.autosave_interval = autosave_interval
+        self.min_topic_overlap = min_topic_overlap
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # 同一时间只有一次落盘
+        self._autosaving = False            # 由 _lock 保护，保证同一时间只有一个自动保存线程
+        self._tf = np.zeros((16, n_features), dtype=np.float32)
+        self._doc_freq = np.zeros(n_features, dtype=np.float32)
+        self._entries = []
+        self._norms = None
+        self._last_save = time.time()
+        self._dirty = False                 # 上次落盘 / 加载后是否有新增或删除，没有时 save() 直接跳过
+
+        self.hits = 0
+        self.misses = 0
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _term_freq(self, text):
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        counts = char_ngram_counts(_NON_WORD.sub('', text), self.n_features, self.ngram_range)
+        vector[list(counts.keys())] = list(counts.values())
+        return vector
+
+    def _idf(self):
+        return np.log((1.0 + len(self._entries)) / (1.0 + self._doc_freq)) + 1.0
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry['created'] > self.ttl
+
+    def _remove_at(self, index):
+        """删除第 index 条：用最后一行覆盖，O(1)"""
+        last = len(self._entries) - 1
+        self._doc_freq -= self._tf[index] > 0
+        if index != last:
+            self._tf[index] = self._tf[last]
+            self._entries[index] = self._entries[last]
+        self._tf[last] = 0
+        self._entries.pop()
+        self._norms = None
+        self._dirty = True
+
+    def _purge_expired(self, now):
+        for index in range(len(self._entries) - 1, -1, -1):
+            if self._expired(self._entries[index], now):
+                self._remove_at(index)
+
+    def search(self, question, top_k=3):
+        """返回最相似的 top_k 个 (相似度, 条目)，按相似度降序"""
+        with self._lock:
+            return self._search(question, top_k)
+
+    def _search(self, question, top_k):
+        size = len(self._entries)
+        if size == 0:
+            return []
+
+        idf_sq = self._idf() ** 2
+        if self._norms is None:
+            tf = self._tf[:size]
+            self._norms = np.sqrt((tf * tf) @ idf_sq)
+
+        query = self._term_freq(question)
+        query_norm = np.sqrt((query * query) @ idf_sq)
+        if query_norm == 0:
+            return []
+
+        scores = self._tf[:size] @ (query * idf_sq) / (self._norms * query_norm + 1e-12)
+        k = min(top_k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self._entries[i]) for i in top]
+
+    def lookup(self, question):
+        """
+        查找近似问题
+
+        Returns:
+            dict | None: 命中时返回 {'question', 'answer', 'audio', 'similarity', ...}
+        """
+        now = time.time()
+        terms = topic_terms(question)
+        with self._lock:
+            for similarity, entry in self._search(question, top_k=3):
+                if similarity < self.threshold:
+                    break
+                if self._expired(entry, now):
+                    continue
+                if topic_overlap(terms, topic_terms(entry['question'])) < self.min_topic_overlap:
+                    # 句式相同、主题不同（失眠 / 便秘），不能复用回答
+                    continue
+                entry['last_hit'] = now
+                entry['hits'] += 1
+                self.hits += 1
+                return dict(entry, similarity=similarity)
+            self.misses += 1
+            return None
+
+    def add(self, question, answer, audio=b''):
+        """写入一条问答及其 TTS 音频"""
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            while len(self._entries) >= self.max_entries:
+                lru = min(range(len(self._entries)), key=lambda i: self._entries[i]['last_hit'])
+                self._remove_at(lru)
+
+            size = len(self._entries)
+            if size == len(self._tf):
+                grown = np.zeros((len(self._tf) * 2, self.n_features), dtype=np.float32)
+                grown[:size] = self._tf[:size]
+                self._tf = grown
+
+            tf = self._term_freq(question)
+            self._tf[size] = tf
+            self._doc_freq += tf > 0
+            self._entries.append({
+                'question': question,
+                'answer': answer,
+                'audio': bytes(audio or b''),
+                'created': now,
+                'last_hit': now,
+                'hits': 0,
+            })
+            self._norms = None
+            self._dirty = True
+
+            autosave = self.path and not self._autosaving and now - self._last_save >= self.autosave_interval
+            if autosave:
+                self._autosaving = True
+                self._last_save = now
+
+        if autosave:
+            # 整个索引连同音频序列化较慢，放到后台线程，不阻塞调用方（事件循环）
+            threading.Thread(target=self._autosave, name='semantic-cache-save', daemon=True).start()
+
+    def _autosave(self):
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"[SemanticCache] 自动保存失败: {e}")
+        finally:
+            with self._lock:
+                self._autosaving = False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def save(self, path=None):
+        """
+        原子地写入持久化文件（先写临时文件再替换）；只在复制快照时持有索引锁，序列化不阻塞检索
+        多进程模式下各工作进程共用同一个文件：持有文件锁，先把其他进程已写入、本进程还没有的条目合并进来再写，
+        不会互相覆盖。写自己的文件且自上次保存以来没有变化时直接跳过
+        """
+        own_file = path is None
+        path = path or self.path
+        if not path:
+            return
+        path = os.path.abspath(path)
+        with self._save_lock:
+            if own_file and not self._dirty:
+                return
+            with FileLock(f"{path}.lock"):
+                if os.path.exists(path):
+                    self._merge(path)
+                with self._lock:
+                    size = len(self._entries)
+                    tf = self._tf[:size].copy()
+                    audio = [entry['audio'] for entry in self._entries]
+                    meta = [{k: v for k, v in entry.items() if k != 'audio'} for entry in self._entries]
+                    self._dirty = False
+                    self._last_save = time.time()
+
+                try:
+                    self._write(path, tf, audio, meta)
+                except Exception:
+                    self._dirty = True
+                    raise
+
+    def _write(self, path, tf, audio, meta):
+        offsets = np.cumsum([0] + [len(a) for a in audio], dtype=np.int64)
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            tf=tf,
+            audio_blob=np.frombuffer(b''.join(audio), dtype=np.uint8),
+            audio_offsets=offsets,
+            meta=np.array(json.dumps({
+                'n_features': self.n_features,
+                'ngram_range': list(self.ngram_range),
+                'entries': meta,
+            }, ensure_ascii=False)),
+        )
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        """读取持久化文件，返回 (tf, entries)；文件损坏或特征配置不一致时返回 None"""
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data['meta']))
+                if meta['n_features'] != self.n_features or tuple(meta['ngram_range']) != self.ngram_range:
+                    logger.warning(f"[SemanticCache] 特征配置变化，忽略旧缓存: {path}")
+                    return None
+                tf = data['tf']
+                blob = data['audio_blob'].tobytes()
+                offsets = data['audio_offsets']
+        except Exception as e:
+            logger.error(f"[SemanticCache] 加载缓存失败: {e}")
+            return None
+
+        entries = meta['entries']
+        for i, entry in enumerate(entries):
+            entry['audio'] = blob[offsets[i]:offsets[i + 1]]
+        return tf, entries
+
+    def _merge(self, path):
+        """把磁盘文件中本进程没有的问题加入索引（其他工作进程写入的），最近命中的优先，不超过 max_entries"""
+        data = self._read(path)
+        if data is None:
+            return
+        tf, entries = data
+        now = time.time()
+        with self._lock:
+            known = {entry['question'] for entry in self._entries}
+            for i in sorted(range(len(entries)), key=lambda i: -entries[i]['last_hit']):
+                if len(self._entries) >= self.max_entries:
+                    break
+                entry = entries[i]
+                if entry['question'] in known or self._expired(entry, now):
+                    continue
+                size = len(self._entries)
+                if size == len(self._tf):
+                    grown = np.zeros((len(self._tf) * 2, self.n_features), dtype=np.float32)
+                    grown[:size] = self._tf[:size]
+                    self._tf = grown
+                self._tf[size] = tf[i]
+                self._doc_freq += tf[i] > 0
+                self._entries.append(entry)
+                known.add(entry['question'])
+                self._norms = None
+
+    def load(self, path=None):
+        """从持久化文件恢复缓存，特征配置不一致时忽略旧文件"""
+        path = path or self.path
+        data = self._read(path)
+        if data is None:
+            return
+        tf, entries = data
+
+        with self._lock:
+            size = len(tf)
+            self._tf = np.zeros((max(16, size * 2), self.n_features), dtype=np.float32)
+            self._tf[:size] = tf
+            self._doc_freq = (tf > 0).sum(axis=0).astype(np.float32)
+            self._entries = entries
+            self._norms = None
+            self._dirty = False
+            self._purge_expired(time.time())
+        logger.info(f"[SemanticCache] 已加载 {len(self._entries)} 条缓存: {path}")
+
+if __name__ == '__main__':
+    import random
+
+    print("语义缓存基准测试：索引大小 vs 检索耗时")
+    print("=" * 50)
+
+    topics = ["掉头发", "脱发", "下奶", "回奶", "减肥", "瘦身", "便秘", "失眠", "贫血", "伤口恢复",
+              "补钙", "补铁", "月子餐", "水肿", "腰疼", "乳腺堵塞", "奶水少", "没胃口", "上火", "湿气重"]
+    prefixes = ["产后", "生完宝宝", "哺乳期", "坐月子", "最近", "剖腹产后", "顺产后", "二胎后"]
+    suffixes = ["怎么办", "吃什么好", "有什么食谱", "该怎么调理", "严重吗", "能喝什么汤"]
+    rng = random.Random(0)
+
+    def random_question():
+        return f"{rng.choice(prefixes)}{rng.choice(topics)}{rng.choice(suffixes)}{rng.randint(0, 99)}"
+
+    for size in (100, 1000, 5000):
+        cache = SemanticCache(path=None, max_entries=size, ttl=None)
+        for _ in range(size):
+            cache.add(random_question(), "回答", b"\x00" * 16)
+        cache.search("预热")
+
+        queries = [random_question() for _ in range(200)]
+        start = time.perf_counter()
+        for query in queries:
+            cache.lookup(query)
+        elapsed = (time.perf_counter() - start) / len(queries)
+        print(f"条目数 {size:>5}: 平均检索 {elapsed * 1000:.3f} ms, "
+              f"命中率 {cache.stats()['hit_rate']:.1%}, "
+              f"索引内存 {cache._tf.nbytes / 1024 / 1024:.1f} MB")
+
+    # 回归检查：同义改写应命中，句式相同但主题不同的问题不能命中
+    cache = SemanticCache()
+    for question in ["最近感觉掉头发好严重，怎么办？", "哺乳期便秘怎么办", "产后失眠吃什么好", "坐月子可以吃水果吗",
+                     "剖腹产后伤口多久能恢复", "产后水肿怎么消", "哺乳期可以喝咖啡吗", "月子里能洗头吗"]:
+        cache.add(question, "回答：" + question, b"mp3")
+    paraphrases = [
+        ("产后掉头发很严重怎么办", "最近感觉掉头发好严重，怎么办？"),
+        ("哺乳期便秘了怎么办啊", "哺乳期便秘怎么办"),
+        ("生完宝宝失眠吃什么好", "产后失眠吃什么好"),
+        ("坐月子能吃水果吗", "坐月子可以吃水果吗"),
+        ("剖腹产伤口多久恢复", "剖腹产后伤口多久能恢复"),
+        ("产后水肿怎么消除", "产后水肿怎么消"),
+        ("坐月子能洗头吗", "月子里能洗头吗"),
+    ]
+    near_misses = ["哺乳期失眠怎么办", "产后补铁吃什么好", "哺乳期奶水少怎么办", "奶水不足吃什么"]
+    failed = 0
+    for question, expected in paraphrases + [(question, None) for question in near_misses]:
+        hit = cache.lookup(question)
+        got = hit['question'] if hit else None
+        failed += got != expected
+        print(f"{'OK ' if got == expected else '错误'} {question} -> {'命中: ' + got if got else '未命中'}")
+    assert failed == 0, f"{failed} 条语义缓存检查未通过"
+
+    # 持久化检查：没有变化时不重写文件；两个工作进程共用一个文件时互相合并，不覆盖对方的条目
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cache.npz')
+        worker_a = SemanticCache(path=path, autosave_interval=3600)
+        worker_b = SemanticCache(path=path, autosave_interval=3600)
+        worker_a.add("产后掉头发怎么办", "回答A", b"a")
+        worker_b.add("哺乳期便秘怎么办", "回答B", b"b")
+        worker_a.save()
+        saved_at = os.stat(path).st_mtime_ns
+        worker_a.save()
+        assert os.stat(path).st_mtime_ns == saved_at, "缓存没有变化却重写了文件"
+        worker_b.save()
+        merged = SemanticCache(path=path)
+        questions = sorted(entry['question'] for entry in merged._entries)
+        print(f"两个进程先后保存后文件中的问题: {questions}")
+        assert questions == ["产后掉头发怎么办", "哺乳期便秘怎么办"], "后保存的进程覆盖了其他进程的条目"
+        assert merged.lookup("哺乳期便秘了怎么办啊")['audio'] == b"b"
@@ -13,14 +13,31 @@ import sys
 from pathlib import Path
 from flask import Flask, send_from_directory, jsonify, request
 from flask_cors import CORS
+from aiohttp import web
 import threading
 
 # 添加路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Audio'))
 
-from Audio.realtime_voice_server import RealtimeVoiceHandler
-from Audio.baidu_asr import asr
+from Audio.realtime_voice_server import RealtimeVoiceHandler, TTS_ws_demo, forward_audio
+from Audio.baidu_asr import asr, asr_async, get_async_asr_instance, get_asr_auth, audio_fingerprint, configure_asr_cache
+from Audio.vad import trim_silence, Endpointer
+from Audio.long_asr import transcribe_long, transcribe_long_async
+from Audio.streaming_asr import BaiduRealtimeRecognizer, LocalStreamingRecognizer, VoiceStream
+from Audio.audio_ingest import AudioIngest, ingest, is_canonical, normalize_pcm
+from baidu_auth import start_token_refresher
+from Audio.text_segmenter import SentenceSplitter
+from Audio.speech_text import SpeechFilter, to_speech
+from Audio.tts_cache import TTSCache
+from Audio.tts_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PRAISE, configure_tts_scheduler
+from output_sink import AsyncQueueSink, get_logger
+from ws_protocol import ProtocolV1, ProtocolError, negotiate_protocol
+from semantic_cache import SemanticCache
+from worker_pools import configure_pools, get_pool, WorkerPoolFull
+from aio_server import create_app as create_aio_app
+from supervisor import Supervisor
+import metrics
 from supermom_config import (
     VOICE_SETTINGS, 
     SYSTEM_PROMPTS, 
@@ -30,9 +47,31 @@ from supermom_config import (
     WEBSOCKET_HOST,
     WEBSOCKET_PORT,
     HTTP_HOST,
-    HTTP_PORT
+    HTTP_PORT,
+    SEMANTIC_CACHE,
+    WORKER_POOLS,
+    WORKER_POOL_MAX_QUEUE,
+    VOICE_PIPELINE,
+    TTS_POOL,
+    TTS_CACHE,
+    TTS_SEGMENT,
+    TTS_SCHEDULER,
+    VAD,
+    ASR_SEGMENT,
+    STREAMING_ASR,
+    AUDIO_INGEST,
+    ASR_CACHE,
+    ASR_BATCH,
+    ASR_UPLOAD,
+    SERVER
 )
 
+logger = get_logger('supermom')  # 请求路径上的日志交给后台线程写出，不阻塞在终端 I/O 上
+
+configure_pools(WORKER_POOLS, max_queue=WORKER_POOL_MAX_QUEUE)
+asr_cache = configure_asr_cache(max_entries=ASR_CACHE['max_entries'], ttl=ASR_CACHE['ttl_seconds'])
+metrics.register('asr_cache', asr_cache.stats)
+
 # ===========================
 # Flask HTTP Server
 # ===========================
@@ -75,75 +114,441 @@ def get_pomodoro_audio():
             'message': str(e)
         }), 500
 
+def audio_format(options):
+    """客户端声明的录音格式：sample_rate（默认16000）、channels（默认1）、sample_format（int16 / float32）"""
+    return {
+        'rate': int(options.get('sample_rate') or 16000),
+        'channels': int(options.get('channels') or 1),
+        'sample_format': options.get('sample_format') or 'int16'
+    }
+
+
+def detect_voice(pcm_data, rate=16000):
+    """
+    ASR 前的语音检测：裁掉首尾静音、压缩长停顿
+    返回 (送去识别的 PCM, VAD 结果)；未启用 VAD 时原样返回并视为有语音
+    """
+    if not VAD['enabled']:
+        return pcm_data, {'speech': True, 'speech_ms': len(pcm_data) * 1000 // (rate * 2)}
+    trimmed, info = trim_silence(
+        pcm_data,
+        rate=rate,
+        max_pause_ms=VAD['max_pause_ms'],
+        energy_margin_db=VAD['energy_margin_db'],
+        hangover_ms=VAD['hangover_ms'],
+        min_speech_ms=VAD['min_speech_ms']
+    )
+    logger.info(f"[VAD] 录音 {info['total_ms']}ms，语音 {info['speech_ms']}ms，"
+          f"送识别 {len(trimmed) * 1000 // (rate * 2)}ms")
+    return trimmed, info
+
+def prepare_speech(audio_data, options):
+    """
+    识别前的音频准备：格式统一 -> VAD -> 增益归一化，返回 (送去识别的 PCM, VAD 结果)
+    VAD 看的是原始音量（先放大会把纯底噪抬成“语音”），归一化只放大裁剪后的说话部分；
+    已经是 16kHz 单声道 int16 的录音不做归一化，原样送识别
+    """
+    fmt = audio_format(options)
+    pcm_data, vad_info = detect_voice(ingest(audio_data, normalize=False, **fmt))
+    if vad_info['speech'] and AUDIO_INGEST['normalize'] and not is_canonical(**fmt):
+        pcm_data = normalize_pcm(pcm_data, AUDIO_INGEST['target_dbfs'], AUDIO_INGEST['max_gain_db'])
+    return pcm_data, vad_info
+
+def _asr_cache_args(dev_pid, options):
+    fmt = audio_format(options)
+    return dev_pid, fmt['rate'], f"{fmt['sample_format']}/{fmt['channels']}"
+
+def lookup_asr_cache(audio_hash, dev_pid, options):
+    """按客户端上传的音频指纹查识别结果缓存，命中时不必解码和识别"""
+    if not ASR_CACHE['enabled'] or not audio_hash:
+        return None
+    return asr_cache.get(audio_hash, *_asr_cache_args(dev_pid, options))
+
+def store_asr_cache(audio_data, dev_pid, options, result, fingerprint=None):
+    """按服务端算出的指纹缓存识别结果（不信任客户端声明的指纹，避免污染缓存）"""
+    if ASR_CACHE['enabled'] and result.get('success'):
+        dev_pid, rate, fmt = _asr_cache_args(dev_pid, options)
+        asr_cache.put(fingerprint or audio_fingerprint(audio_data), dev_pid, rate, result, format=fmt)
+
+def recognize_upload(audio_data, options, dev_pid, fingerprint=None):
+    """
+    同步识别一段上传的录音：格式统一 -> VAD -> 分段识别，成功的结果写入缓存
+    返回与 asr 相同结构的结果，另带 speech_ms；没有说话时 no_speech 为 True
+    """
+    pcm_data, vad_info = prepare_speech(audio_data, options)
+    if not vad_info['speech']:
+        return {'success': False, 'no_speech': True, 'error_msg': '没有检测到说话声音', 'speech_ms': 0, 'text': ''}
+    
+    result = transcribe_long(
+        pcm_data,
+        asr,
+        get_pool('asr'),
+        rate=16000,
+        max_seconds=ASR_SEGMENT['max_seconds'],
+        overlap_ms=ASR_SEGMENT['overlap_ms'],
+        format='pcm',
+        dev_pid=dev_pid
+    )
+    result['speech_ms'] = vad_info['speech_ms']
+    store_asr_cache(audio_data, dev_pid, options, result, fingerprint)
+    return result
+
+def recognize_batch_item(audio_data, options, dev_pid):
+    """批量识别中的一条：服务端计算指纹查缓存，重复同步的录音不再请求百度"""
+    fingerprint = audio_fingerprint(audio_data) if ASR_CACHE['enabled'] else None
+    cached = lookup_asr_cache(fingerprint, dev_pid, options)
+    if cached is not None:
+        return cached
+    return recognize_upload(audio_data, options, dev_pid, fingerprint)
+
+async def recognize_speech(pcm_data, format='pcm', rate=16000, dev_pid=1537):
+    """协程版识别：超过单次时长上限的录音分段并发识别"""
+    return await transcribe_long_async(
+        pcm_data,
+        asr_async,
+        rate=rate,
+        max_seconds=ASR_SEGMENT['max_seconds'],
+        overlap_ms=ASR_SEGMENT['overlap_ms'],
+        concurrency=ASR_SEGMENT['concurrency'],
+        format=format,
+        dev_pid=dev_pid
+    )
+
+RAW_UPLOAD_TYPES = ('application/octet-stream', 'multipart/form-data')
+
+def read_into_buffer(stream, length=None, max_bytes=None):
+    """
+    把上传的音频直接读进一块预分配的缓冲区，返回 memoryview，不经过 bytes 中转
+    length 未知时：BytesIO 直接引用其内部缓冲区，可 seek 的文件先取长度，分块传输的请求体按块追加
+    """
+    max_bytes = max_bytes or ASR_UPLOAD['max_body_mb'] * 1024 * 1024
+    if length is None and hasattr(stream, 'getbuffer'):
+        view = stream.getbuffer()
+        if len(view) > max_bytes:
+            raise ValueError(f"音频超过 {ASR_UPLOAD['max_body_mb']}MB 上限")
+        return view
+    if length is None and stream.seekable():
+        start = stream.tell()
+        length = stream.seek(0, os.SEEK_END) - start
+        stream.seek(start)
+    
+    if length is not None:
+        if length > max_bytes:
+            raise ValueError(f"音频超过 {ASR_UPLOAD['max_body_mb']}MB 上限")
+        view = memoryview(bytearray(length))
+        filled = 0
+        while filled < length:
+            count = stream.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        return view[:filled]
+    
+    buffer = bytearray()
+    chunk = memoryview(bytearray(64 * 1024))
+    while True:
+        count = stream.readinto(chunk)
+        if not count:
+            break
+        buffer += chunk[:count]
+        if len(buffer) > max_bytes:
+            raise ValueError(f"音频超过 {ASR_UPLOAD['max_body_mb']}MB 上限")
+    return memoryview(buffer)
+
+def read_audio_upload():
+    """原始音频上传：octet-stream 请求体，或 multipart 中的 audio 字段（没有时取第一个文件）"""
+    if request.mimetype == 'multipart/form-data':
+        storage = request.files.get('audio') or next(iter(request.files.values()), None)
+        return read_into_buffer(storage.stream) if storage is not None else None
+    return read_into_buffer(request.stream, request.content_length)
+
 @app.route('/api/asr', methods=['POST'])
 def speech_to_text():
     """语音转文字接口 - 用于贴心备忘录"""
-    print("\n" + "="*60)
-    print("[ASR] 收到语音识别请求")
+    logger.info("\n" + "="*60)
+    logger.info("[ASR] 收到语音识别请求")
     try:
-        data = request.json
-        audio_base64 = data.get('audio')
+        raw_upload = request.mimetype in RAW_UPLOAD_TYPES
+        if raw_upload:
+            # 原始 PCM 上传：格式参数和 audio_hash 放在查询字符串（multipart 也可以放在表单字段）
+            data = request.args.to_dict()
+            if request.mimetype == 'multipart/form-data':
+                data.update(request.form.to_dict())
+        else:
+            data = request.json
+        dev_pid = VOICE_SETTINGS['husband_praise']['asr_dev_pid']
+        
+        # 重传的录音：客户端带上音频指纹，命中缓存时不读取音频也不请求百度
+        result = lookup_asr_cache(data.get('audio_hash'), dev_pid, data)
+        if result is not None:
+            logger.info("[ASR] 识别结果缓存命中")
+        
+        else:
+            audio_data = None
+            if raw_upload:
+                audio_data = read_audio_upload()
+                if audio_data:
+                    logger.info(f"[ASR] 原始音频大小: {len(audio_data)} 字节")
+            elif data.get('audio'):
+                audio_base64 = data['audio']
+                logger.info(f"[ASR] 音频数据长度: {len(audio_base64)} 字符")
+                
+                # 解码音频
+                audio_data = base64.b64decode(audio_base64)
+                logger.info(f"[ASR] 解码后音频大小: {len(audio_data)} 字节")
+            
+            if not audio_data:
+                logger.error("[ASR] 错误: 缺少音频数据")
+                return jsonify({
+                    'error': True,
+                    'message': '缺少音频数据',
+                    'cache_miss': bool(data.get('audio_hash'))
+                }), 400
+            
+            # 调用百度ASR（超过单次时长上限的录音在静音处分段并发识别）
+            logger.info("[ASR] 调用百度ASR识别...")
+            result = recognize_upload(audio_data, data, dev_pid)
         
-        if not audio_base64:
-            print("[ASR] 错误: 缺少音频数据")
+        if result.get('no_speech'):
+            logger.info("[ASR] 未检测到语音，跳过识别")
+            logger.info("="*60 + "\n")
             return jsonify({
                 'error': True,
-                'message': '缺少音频数据'
+                'message': '没有检测到说话声音',
+                'speech_duration': 0
             }), 400
         
-        print(f"[ASR] 音频数据长度: {len(audio_base64)} 字符")
-        
-        # 解码音频
-        audio_data = base64.b64decode(audio_base64)
-        print(f"[ASR] 解码后音频大小: {len(audio_data)} 字节")
-        
-        # 调用百度ASR
-        print("[ASR] 调用百度ASR识别...")
-        result = asr(
-            audio_data,
-            format='pcm',
-            rate=16000,
-            dev_pid=VOICE_SETTINGS['husband_praise']['asr_dev_pid']
-        )
-        
-        print(f"[ASR] 识别结果: {result}")
+        logger.info(f"[ASR] 识别结果: {result}")
         
         if result.get('success'):
             text = result.get('text', '')
-            print(f"[ASR] 识别成功: {text}")
-            print("="*60 + "\n")
+            logger.info(f"[ASR] 识别成功: {text}")
+            logger.info("="*60 + "\n")
             return jsonify({
                 'error': False,
                 'text': text,
-                'all_results': result.get('all_results', [])
+                'all_results': result.get('all_results', []),
+                'speech_duration': result['speech_ms'] / 1000
             })
         else:
             error_msg = result.get('error_msg', '识别失败')
-            print(f"[ASR] 识别失败: {error_msg}")
-            print("="*60 + "\n")
+            logger.error(f"[ASR] 识别失败: {error_msg}")
+            logger.info("="*60 + "\n")
             return jsonify({
                 'error': True,
                 'message': error_msg
             }), 400
     
+    except ValueError as e:
+        logger.error(f"[ASR] 请求格式错误: {e}")
+        logger.info("="*60 + "\n")
+        return jsonify({
+            'error': True,
+            'message': str(e)
+        }), 400
+    
+    except Exception as e:
+        logger.exception(f"[ASR] 异常: {str(e)}")
+        logger.info("="*60 + "\n")
+        return jsonify({
+            'error': True,
+            'message': str(e)
+        }), 500
+
+def read_batch_items():
+    """
+    解析批量识别请求，返回 ([(条目id, 音频)], 录音格式参数)
+    - multipart/form-data：每个文件字段一条录音，id 为文件名；格式参数放在表单字段中
+    - 二进制：若干个 [4 字节大端长度][音频字节]，id 为序号；格式参数放在查询字符串中
+    """
+    if request.files:
+        items = [(f.filename or name, read_into_buffer(f.stream)) for name, f in request.files.items(multi=True)]
+        options = request.form.to_dict()
+    else:
+        body = read_into_buffer(request.stream, request.content_length)
+        items = []
+        pos = 0
+        while pos < len(body):
+            if pos + 4 > len(body):
+                raise ValueError('批量音频格式错误：长度头不完整')
+            size = int.from_bytes(body[pos:pos + 4], 'big')
+            pos += 4
+            if pos + size > len(body):
+                raise ValueError(f'批量音频格式错误：第{len(items)}条长度超出请求体')
+            items.append((str(len(items)), body[pos:pos + size]))
+            pos += size
+        options = request.args.to_dict()
+    return items, options
+
+def batch_item_response(item_id, result):
+    if result.get('success'):
+        return {
+            'id': item_id,
+            'error': False,
+            'text': result.get('text', ''),
+            'all_results': result.get('all_results', []),
+            'speech_duration': result.get('speech_ms', 0) / 1000
+        }
+    return {
+        'id': item_id,
+        'error': True,
+        'message': result.get('error_msg', '识别失败')
+    }
+
+@app.route('/api/asr/batch', methods=['POST'])
+def batch_speech_to_text():
+    """批量语音转文字 - 贴心备忘录一次同步多条离线录音，各条并发识别，单条失败不影响其他条"""
+    logger.info("\n" + "="*60)
+    logger.info("[ASR Batch] 收到批量语音识别请求")
+    try:
+        items, options = read_batch_items()
+        if not items:
+            return jsonify({
+                'error': True,
+                'message': '缺少音频数据'
+            }), 400
+        if len(items) > ASR_BATCH['max_items']:
+            return jsonify({
+                'error': True,
+                'message': f"单次最多识别 {ASR_BATCH['max_items']} 条录音"
+            }), 400
+        
+        logger.info(f"[ASR Batch] 共 {len(items)} 条录音")
+        dev_pid = VOICE_SETTINGS['husband_praise']['asr_dev_pid']
+        pool = get_pool('asr_batch')
+        futures = []
+        for item_id, audio_data in items:
+            try:
+                futures.append((item_id, pool.submit(recognize_batch_item, audio_data, options, dev_pid)))
+            except WorkerPoolFull as e:
+                futures.append((item_id, e))
+        
+        results = []
+        for item_id, future in futures:
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                results.append(batch_item_response(item_id, future.result()))
+            except Exception as e:
+                logger.error(f"[ASR Batch] 第 {item_id} 条识别异常: {e}")
+                results.append({'id': item_id, 'error': True, 'message': str(e)})
+        
+        failed = sum(1 for item in results if item['error'])
+        logger.info(f"[ASR Batch] 完成: 成功 {len(results) - failed} 条，失败 {failed} 条")
+        logger.info("="*60 + "\n")
+        return jsonify({
+            'error': False,
+            'results': results
+        })
+    
+    except ValueError as e:
+        logger.error(f"[ASR Batch] 请求格式错误: {e}")
+        return jsonify({
+            'error': True,
+            'message': str(e)
+        }), 400
+    
     except Exception as e:
-        print(f"[ASR] 异常: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        print("="*60 + "\n")
+        logger.exception(f"[ASR Batch] 异常: {str(e)}")
+        logger.info("="*60 + "\n")
         return jsonify({
             'error': True,
             'message': str(e)
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """运行指标：线程池排队深度、缓存命中率等"""
+    return jsonify(metrics.snapshot())
+
 # ===========================
 # WebSocket Server for Voice Chat
 # ===========================
 
-class SuperMomVoiceServer:
+class ClientSession:
+    """
+    单个WebSocket连接的会话状态
+    客户端在第一条消息中通过 capabilities 声明支持的扩展协议：
+      - text_delta: text_chat 先推送 text_response_delta 增量文本，再推送带语音的 text_response
+      - voice_pipeline: voice_chat 默认使用逐句流水线 (voice_response_chunk / voice_response_end)
+      - audio_stream: TTS 音频边合成边以 audio_chunk 推送，随后的 voice_response / text_response /
+                      memo_praise 不再携带音频，改为 "audio_streamed": true
+    同一条消息中的 "protocol": 2（可选 "encoding": "msgpack" | "json"）启用二进制协议 v2，见 ws_protocol.py
+    
+    流式识别：发送 voice_stream_start 后边录音边发送 PCM 二进制帧（v1 为原始 PCM，v2 为 b'S' + PCM），
+    服务端推送 user_text_partial；检测到说完或收到 voice_stream_end 后给出 user_text_recognized 并开始回复
+    """
+    SUPPORTED_CAPABILITIES = {'text_delta', 'voice_pipeline', 'audio_stream'}
+    MAX_PENDING_AUDIO = 8  # v2 下最多暂存的未被引用音频帧数
+    
     def __init__(self):
+        self.negotiated = False
+        self.capabilities = set()
+        self.protocol = ProtocolV1()
+        self.pending_audio = {}
+        self.stream = None
+        self.stream_request = None
+        self._stream_used = False
+    
+    def negotiate(self, data):
+        """读取客户端声明的能力和协议版本，只保留服务端支持的部分"""
+        requested = data.get('capabilities') or []
+        self.capabilities = set(requested) & self.SUPPORTED_CAPABILITIES
+        self.protocol = negotiate_protocol(data)
+        self.negotiated = True
+    
+    def receive(self, frame):
+        """解码一帧；音频帧暂存等待控制消息引用，返回 None"""
+        message, audio = self.protocol.decode(frame)
+        if audio is not None:
+            audio_id, view = audio
+            self.pending_audio[audio_id] = view
+            while len(self.pending_audio) > self.MAX_PENDING_AUDIO:
+                self.pending_audio.pop(next(iter(self.pending_audio)))
+        return message
+    
+    def stream_frame(self, frame):
+        """流式识别的音频帧返回 PCM，其他帧返回 None（本连接从未开始流式识别时不做判断）"""
+        if isinstance(frame, str) or not self._stream_used:
+            return None
+        return self.protocol.stream_audio(frame)
+    
+    def start_stream(self, stream, request):
+        self.stream = stream
+        self.stream_request = request
+        self._stream_used = True
+    
+    def end_stream(self):
+        """取出当前的流式识别，返回 (VoiceStream, voice_stream_start 消息)"""
+        stream, request = self.stream, self.stream_request
+        self.stream = None
+        self.stream_request = None
+        return stream, request
+    
+    def take_audio(self, message):
+        """取出消息携带的音频：v1 为 base64 字段，v2 为 audio_id 引用的二进制帧"""
+        return self.protocol.audio_from(message, self.pending_audio)
+    
+    async def send(self, websocket, message, audio=None):
+        """按协商的协议发送消息，audio 为原始音频字节"""
+        for frame in self.protocol.encode(message, audio):
+            await websocket.send(frame)
+
+
+class SuperMomVoiceServer:
+    def __init__(self, workers=1):
+        """workers: 多进程模式下的工作进程数；百度TTS的并发和QPS是整个账号的额度，按进程数平分"""
         self.handlers = {}
+        self.semantic_caches = {}
+        self.tts_cache = self._init_tts_cache()
+        self.tts_scheduler = configure_tts_scheduler(
+            max_concurrency=max(1, -(-TTS_SCHEDULER['max_concurrency'] // workers)),
+            qps=TTS_SCHEDULER['qps'] / workers,
+            max_retries=TTS_SCHEDULER['max_retries']
+        )
+        metrics.register('tts_scheduler', self.tts_scheduler.stats)
         self._init_handlers()
+        self._init_semantic_caches()
     
     def _init_handlers(self):
         """初始化不同功能的语音处理器"""
@@ -155,7 +560,12 @@ class SuperMomVoiceServer:
             tts_speed=VOICE_SETTINGS['emotional_support']['tts_speed'],
             tts_pitch=VOICE_SETTINGS['emotional_support']['tts_pitch'],
             tts_volume=VOICE_SETTINGS['emotional_support']['tts_volume'],
-            asr_dev_pid=VOICE_SETTINGS['emotional_support']['asr_dev_pid']
+            asr_dev_pid=VOICE_SETTINGS['emotional_support']['asr_dev_pid'],
+            tts_pool_size=TTS_POOL['max_size'],
+            tts_cache=self.tts_cache,
+            tts_max_chars=TTS_SEGMENT['max_chars'],
+            tts_segment_concurrency=TTS_SEGMENT['concurrency'],
+            tts_scheduler=self.tts_scheduler
         )
         
         # 产后食记处理器
@@ -166,7 +576,12 @@ class SuperMomVoiceServer:
             tts_speed=VOICE_SETTINGS['nutrition_advisor']['tts_speed'],
             tts_pitch=VOICE_SETTINGS['nutrition_advisor']['tts_pitch'],
             tts_volume=VOICE_SETTINGS['nutrition_advisor']['tts_volume'],
-            asr_dev_pid=VOICE_SETTINGS['nutrition_advisor']['asr_dev_pid']
+            asr_dev_pid=VOICE_SETTINGS['nutrition_advisor']['asr_dev_pid'],
+            tts_pool_size=TTS_POOL['max_size'],
+            tts_cache=self.tts_cache,
+            tts_max_chars=TTS_SEGMENT['max_chars'],
+            tts_segment_concurrency=TTS_SEGMENT['concurrency'],
+            tts_scheduler=self.tts_scheduler
         )
         
         # 贴心备忘录 - 丈夫夸奖处理器
@@ -177,207 +592,648 @@ class SuperMomVoiceServer:
             tts_speed=VOICE_SETTINGS['husband_praise']['tts_speed'],
             tts_pitch=VOICE_SETTINGS['husband_praise']['tts_pitch'],
             tts_volume=VOICE_SETTINGS['husband_praise']['tts_volume'],
-            asr_dev_pid=VOICE_SETTINGS['husband_praise']['asr_dev_pid']
+            asr_dev_pid=VOICE_SETTINGS['husband_praise']['asr_dev_pid'],
+            tts_pool_size=TTS_POOL['max_size'],
+            tts_cache=self.tts_cache,
+            tts_max_chars=TTS_SEGMENT['max_chars'],
+            tts_segment_concurrency=TTS_SEGMENT['concurrency'],
+            tts_scheduler=self.tts_scheduler
+        )
+        metrics.register('tts_pool', TTS_ws_demo.session_pool_stats)
+    
+    def _init_tts_cache(self):
+        """创建各处理器共用的 TTS 音频缓存"""
+        if not TTS_CACHE['enabled']:
+            return None
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        cache = TTSCache(
+            os.path.join(base_dir, TTS_CACHE['dir']),
+            memory_bytes=TTS_CACHE['memory_mb'] * 1024 * 1024,
+            disk_bytes=TTS_CACHE['disk_mb'] * 1024 * 1024
         )
+        metrics.register('tts_cache', cache.stats)
+        return cache
+
+    def _init_semantic_caches(self):
+        """为配置中的对话类型创建语义缓存"""
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for chat_type in SEMANTIC_CACHE['chat_types']:
+            self.semantic_caches[chat_type] = SemanticCache(
+                path=os.path.join(base_dir, SEMANTIC_CACHE['path'].format(chat_type=chat_type)),
+                threshold=SEMANTIC_CACHE['threshold'],
+                min_topic_overlap=SEMANTIC_CACHE['min_topic_overlap'],
+                ttl=SEMANTIC_CACHE['ttl_seconds'],
+                max_entries=SEMANTIC_CACHE['max_entries']
+            )
+        metrics.register('semantic_cache', lambda: {
+            chat_type: cache.stats() for chat_type, cache in self.semantic_caches.items()
+        })
+    
+    def _start_llm_stream(self, handler, prompt):
+        """在LLM线程池中启动流式调用，返回 (llm_task, 增量文本队列)；队列以 None 结束"""
+        sink = AsyncQueueSink(asyncio.get_running_loop())
+        llm_task = asyncio.ensure_future(get_pool('llm').run(
+            handler.llm_agent.router,
+            prompt=prompt,
+            model=handler.llm_model,
+            systemInstruction=handler.system_instruction,
+            stream_output=False,
+            sink=sink
+        ))
+        llm_task.add_done_callback(lambda _: sink.close())
+        return llm_task, sink.queue
+    
+    def _audio_forwarder(self, websocket, session, chat_type, reply_type):
+        """
+        客户端声明 audio_stream 时返回协程回调：每收到一块TTS音频就推送一条 audio_chunk
+        未声明时返回 None，音频随最终回复一起发送
+        """
+        if 'audio_stream' not in session.capabilities:
+            return None
+        seq = 0
+        
+        async def on_audio(chunk):
+            nonlocal seq
+            await session.send(websocket, {
+                'type': 'audio_chunk',
+                'chat_type': chat_type,
+                'reply_type': reply_type,
+                'seq': seq
+            }, audio=chunk)
+            seq += 1
+        
+        return on_audio
+    
+    async def _synthesize(self, handler, text, on_audio=None, priority=PRIORITY_INTERACTIVE):
+        """合成回复语音；提供 on_audio 时音频块一到就回调，不必等整段合成结束"""
+        if not text.strip():
+            return b''
+        if on_audio is None:
+            return await handler.synthesize_to_memory(
+                text=text,
+                spd=handler.tts_speed,
+                pit=handler.tts_pitch,
+                vol=handler.tts_volume,
+                aue=3,
+                priority=priority
+            )
+        return await forward_audio(handler.synthesize_stream(
+            text=text,
+            spd=handler.tts_speed,
+            pit=handler.tts_pitch,
+            vol=handler.tts_volume,
+            aue=3,
+            priority=priority
+        ), on_audio)
+    
+    async def _generate_reply(self, chat_type, user_text, on_delta=None, on_audio=None):
+        """
+        LLM生成回复并合成语音；启用语义缓存的对话类型先查近似问题
+        on_delta: 可选的协程回调，LLM每产生一段增量文本就调用一次
+        on_audio: 可选的协程回调，每收到一块TTS音频就调用一次
+        """
+        handler = self.handlers[chat_type]
+        cache = self.semantic_caches.get(chat_type)
+        
+        if cache is not None:
+            hit = cache.lookup(user_text)
+            if hit:
+                logger.info(f"[{chat_type}] 语义缓存命中 (相似度 {hit['similarity']:.2f}): {hit['question']}")
+                if on_delta is not None:
+                    await on_delta(hit['answer'])
+                if on_audio is not None and hit['audio']:
+                    await on_audio(hit['audio'])
+                return hit['answer'], hit['audio']
+        
+        logger.info(f"[{chat_type}] 调用LLM生成回复...")
+        if on_delta is None:
+            llm_response = await get_pool('llm').run(
+                handler.llm_agent.router,
+                prompt=user_text,
+                model=handler.llm_model,
+                systemInstruction=handler.system_instruction,
+                stream_output=False
+            )
+        else:
+            llm_task, deltas = self._start_llm_stream(handler, user_text)
+            finished = False
+            while not finished:
+                delta = await deltas.get()
+                if delta is None:
+                    break
+                # 合并已经排队的增量，减少发送的消息数
+                parts = [delta]
+                while not deltas.empty():
+                    delta = deltas.get_nowait()
+                    if delta is None:
+                        finished = True
+                        break
+                    parts.append(delta)
+                await on_delta(''.join(parts))
+            llm_response = await llm_task
+        
+        response_text = llm_response if isinstance(llm_response, str) else str(llm_response)
+        logger.info(f"[{chat_type}] LLM回复: {response_text}")
+        
+        # 表格、Markdown 标记只用于显示，TTS 只朗读正文
+        logger.info(f"[{chat_type}] TTS合成语音...")
+        audio_content = await self._synthesize(handler, to_speech(response_text), on_audio)
+        
+        # 只缓存正常的文本回复
+        if cache is not None and isinstance(llm_response, str) and llm_response:
+            cache.add(user_text, response_text, audio_content)
+        
+        return response_text, audio_content
+    
+    async def _send_reply(self, websocket, session, message, audio_content, streamed=False):
+        """发送最终回复；音频已经以 audio_chunk 推送过的只标记 audio_streamed"""
+        if streamed:
+            await session.send(websocket, dict(message, audio_streamed=True))
+        else:
+            await session.send(websocket, message, audio=audio_content)
+    
+    async def _pipelined_reply(self, websocket, session, chat_type, user_text):
+        """
+        流水线式回复：LLM增量输出按句切分，每句一生成就开始TTS，
+        按顺序推送 voice_response_chunk，最后发送 voice_response_end
+        """
+        handler = self.handlers[chat_type]
+        cache = self.semantic_caches.get(chat_type)
+        
+        if cache is not None:
+            hit = cache.lookup(user_text)
+            if hit:
+                logger.info(f"[{chat_type}] 语义缓存命中 (相似度 {hit['similarity']:.2f}): {hit['question']}")
+                await session.send(websocket, {
+                    'type': 'voice_response_chunk',
+                    'chat_type': chat_type,
+                    'seq': 0,
+                    'text': hit['answer']
+                }, audio=hit['audio'])
+                await session.send(websocket, {
+                    'type': 'voice_response_end',
+                    'chat_type': chat_type,
+                    'error': False,
+                    'user_text': user_text,
+                    'response_text': hit['answer'],
+                    'chunks': 1
+                })
+                return
+        
+        tts_limit = asyncio.Semaphore(VOICE_PIPELINE['tts_concurrency'])
+        pending = asyncio.Queue()  # 按句子顺序排列的TTS任务，None 表示结束
+        
+        logger.info(f"[{chat_type}] 流水线模式：调用LLM生成回复...")
+        llm_task, deltas = self._start_llm_stream(handler, user_text)
+        
+        async def synthesize(sentence):
+            async with tts_limit:
+                return await handler.synthesize_to_memory(
+                    text=sentence,
+                    spd=handler.tts_speed,
+                    pit=handler.tts_pitch,
+                    vol=handler.tts_volume,
+                    aue=3
+                )
+        
+        async def produce():
+            speech_filter = SpeechFilter()
+            splitter = SentenceSplitter(min_chars=VOICE_PIPELINE['min_sentence_chars'])
+            while True:
+                delta = await deltas.get()
+                if delta is None:
+                    sentences = splitter.feed(speech_filter.flush()) + splitter.flush()
+                else:
+                    sentences = splitter.feed(speech_filter.feed(delta))
+                for sentence in sentences:
+                    await pending.put((sentence, asyncio.ensure_future(synthesize(sentence))))
+                if delta is None:
+                    await pending.put(None)
+                    return
+        
+        producer = asyncio.ensure_future(produce())
+        audio_segments = []
+        seq = 0
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                sentence, tts_task = item
+                chunk = {
+                    'type': 'voice_response_chunk',
+                    'chat_type': chat_type,
+                    'seq': seq,
+                    'text': sentence
+                }
+                audio_content = None
+                try:
+                    audio_content = await tts_task
+                    audio_segments.append(audio_content)
+                except Exception as e:
+                    logger.error(f"[{chat_type}] 第{seq}句TTS失败: {e}")
+                    chunk['error'] = True
+                    chunk['message'] = str(e)
+                await session.send(websocket, chunk, audio=audio_content)
+                seq += 1
+            
+            llm_response = await llm_task
+        finally:
+            producer.cancel()
+            while not pending.empty():
+                item = pending.get_nowait()
+                if item is not None:
+                    item[1].cancel()
+        
+        if not isinstance(llm_response, str) or not llm_response:
+            await session.send(websocket, {
+                'type': 'voice_response_end',
+                'chat_type': chat_type,
+                'error': True,
+                'message': 'LLM未返回有效回复'
+            })
+            return
+        
+        logger.info(f"[{chat_type}] LLM回复: {llm_response}")
+        await session.send(websocket, {
+            'type': 'voice_response_end',
+            'chat_type': chat_type,
+            'error': False,
+            'user_text': user_text,
+            'response_text': llm_response,
+            'chunks': seq
+        })
+        
+        if cache is not None and len(audio_segments) == seq:
+            cache.add(user_text, llm_response, b''.join(audio_segments))
     
     async def handle_client(self, websocket):
         """处理WebSocket客户端连接"""
         client_id = id(websocket)
-        print(f"[WebSocket] 客户端连接: {client_id}")
+        logger.info(f"[WebSocket] 客户端连接: {client_id}")
+        session = ClientSession()
         
         try:
             async for message in websocket:
                 try:
-                    data = json.loads(message)
+                    pcm = session.stream_frame(message)
+                    if pcm is not None:
+                        # 流式识别的音频帧；识别已经结束后迟到的帧直接丢弃
+                        if session.stream is not None:
+                            await self._feed_voice_stream(websocket, session, pcm)
+                        continue
+                    
+                    data = session.receive(message)
+                    if data is None:
+                        # v2 音频帧，等待后续控制消息引用
+                        continue
                     msg_type = data.get('type')
                     
+                    if not session.negotiated:
+                        # 第一条消息可携带 capabilities / protocol，未携带的旧前端保持原有协议
+                        session.negotiate(data)
+                        if msg_type == 'hello':
+                            # 握手回复始终是 JSON 文本帧
+                            await websocket.send(json.dumps({
+                                'type': 'hello',
+                                'capabilities': sorted(session.capabilities),
+                                'protocol': session.protocol.version,
+                                'encoding': session.protocol.encoding
+                            }))
+                            continue
+                    
                     if msg_type == 'voice_chat':
                         # 语音对话 - 安心话匣 或 产后食记
-                        await self._handle_voice_chat(websocket, data)
+                        await self._handle_voice_chat(websocket, data, session)
                     
                     elif msg_type == 'memo_complete':
                         # 备忘录完成 - 丈夫夸奖
-                        await self._handle_memo_complete(websocket, data)
+                        await self._handle_memo_complete(websocket, data, session)
                     
                     elif msg_type == 'text_chat':
                         # 纯文本对话
-                        await self._handle_text_chat(websocket, data)
+                        await self._handle_text_chat(websocket, data, session)
+                    
+                    elif msg_type == 'voice_stream_start':
+                        # 流式语音输入 - 边录边识别
+                        await self._start_voice_stream(websocket, data, session)
+                    
+                    elif msg_type == 'voice_stream_end':
+                        await self._finish_voice_stream(websocket, session)
+                    
+                    elif msg_type == 'voice_stream_cancel':
+                        await self._cancel_voice_stream(session)
                     
                     else:
-                        await websocket.send(json.dumps({
+                        await session.send(websocket, {
                             'error': True,
                             'message': f'未知消息类型: {msg_type}'
-                        }))
+                        })
                 
                 except json.JSONDecodeError as e:
-                    await websocket.send(json.dumps({
+                    await session.send(websocket, {
                         'error': True,
                         'message': f'JSON解析错误: {str(e)}'
-                    }))
+                    })
+                
+                except ProtocolError as e:
+                    await session.send(websocket, {
+                        'error': True,
+                        'message': f'消息解析错误: {str(e)}'
+                    })
                 
                 except Exception as e:
-                    print(f"[WebSocket] 处理错误: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    await websocket.send(json.dumps({
+                    logger.exception(f"[WebSocket] 处理错误: {e}")
+                    await session.send(websocket, {
                         'error': True,
                         'message': str(e)
-                    }))
+                    })
         
         except websockets.exceptions.ConnectionClosed:
-            print(f"[WebSocket] 客户端断开: {client_id}")
+            logger.info(f"[WebSocket] 客户端断开: {client_id}")
         except Exception as e:
-            print(f"[WebSocket] 连接错误: {e}")
+            logger.error(f"[WebSocket] 连接错误: {e}")
+        finally:
+            await self._cancel_voice_stream(session)
     
-    async def _handle_voice_chat(self, websocket, data):
+    async def _handle_voice_chat(self, websocket, data, session):
         """处理语音对话（安心话匣/产后食记）- 分步响应"""
         chat_type = data.get('chat_type')  # 'emotional_support' or 'nutrition_advisor'
-        audio_base64 = data.get('audio')
         
         if chat_type not in self.handlers:
-            await websocket.send(json.dumps({
+            await session.send(websocket, {
                 'error': True,
                 'message': f'未知对话类型: {chat_type}'
-            }))
+            })
             return
         
         handler = self.handlers[chat_type]
         
         # 分步处理：先ASR，再LLM+TTS
         try:
+            # 重传的录音：带音频指纹且命中缓存时跳过解码和ASR
+            asr_result = lookup_asr_cache(data.get('audio_hash'), handler.asr_dev_pid, data)
+            if asr_result is not None:
+                logger.info(f"[{chat_type}] 识别结果缓存命中")
+                await self._respond_to_speech(
+                    websocket, session, chat_type, asr_result['text'], asr_result['speech_ms'], data.get('pipelined'))
+                return
+            
             # Step 1: ASR识别
-            print(f"[{chat_type}] 开始ASR识别...")
-            pcm_data = base64.b64decode(audio_base64)
+            logger.info(f"[{chat_type}] 开始ASR识别...")
+            audio_data = session.take_audio(data)
+            if not audio_data:
+                await session.send(websocket, {
+                    'type': 'voice_response',
+                    'error': True,
+                    'message': '缺少音频数据',
+                    'cache_miss': bool(data.get('audio_hash'))
+                })
+                return
             
-            from Audio.baidu_asr import asr
-            asr_result = asr(
-                pcm_data, 
-                format='pcm', 
-                rate=16000, 
-                dev_pid=handler.asr_dev_pid
-            )
+            # 重采样 / VAD 是 CPU 计算，放进有界的 asr 线程池：排队上限和 /api/metrics 的队列指标也覆盖这一步
+            pcm_data, vad_info = await get_pool('asr').run(prepare_speech, audio_data, data)
+            if not vad_info['speech']:
+                await session.send(websocket, {
+                    'type': 'voice_response',
+                    'error': True,
+                    'message': '没有检测到说话声音'
+                })
+                return
+            
+            asr_result = await recognize_speech(pcm_data, format='pcm', rate=16000, dev_pid=handler.asr_dev_pid)
+            asr_result['speech_ms'] = vad_info['speech_ms']
+            store_asr_cache(audio_data, handler.asr_dev_pid, data, asr_result)
             
             if not asr_result.get('success'):
-                await websocket.send(json.dumps({
+                await session.send(websocket, {
                     'type': 'voice_response',
                     'error': True,
                     'message': f"语音识别失败: {asr_result.get('error_msg', '未知错误')}"
-                }))
+                })
                 return
             
             user_text = asr_result.get('text', '')
-            print(f"[{chat_type}] 识别成功: {user_text}")
-            
-            # 立即发送用户识别文本
-            user_msg = {
-                'type': 'user_text_recognized',
-                'chat_type': chat_type,
-                'user_text': user_text
-            }
-            print(f"[{chat_type}] >>> 发送识别文本消息: {user_msg}")
-            await websocket.send(json.dumps(user_msg))
-            print(f"[{chat_type}] >>> 识别文本消息已发送")
-            
-            # Step 2: LLM生成回复
-            print(f"[{chat_type}] 调用LLM生成回复...")
-            llm_response = handler.llm_agent.router(
-                prompt=user_text,
-                model=handler.llm_model,
-                systemInstruction=handler.system_instruction,
-                stream_output=False
-            )
-            
-            response_text = llm_response if isinstance(llm_response, str) else str(llm_response)
-            print(f"[{chat_type}] LLM回复: {response_text}")
-            
-            # Step 3: TTS合成语音
-            print(f"[{chat_type}] TTS合成语音...")
-            audio_content = await handler.synthesize_to_memory(
-                text=response_text,
-                spd=handler.tts_speed,
-                pit=handler.tts_pitch,
-                vol=handler.tts_volume,
-                aue=3
-            )
+            logger.info(f"[{chat_type}] 识别成功: {user_text}")
             
-            audio_base64_reply = base64.b64encode(audio_content).decode('utf-8')
+            # Step 2 & 3: LLM生成回复 + TTS合成语音
+            await self._respond_to_speech(
+                websocket, session, chat_type, user_text, vad_info['speech_ms'], data.get('pipelined'))
             
-            # 发送AI回复
-            await websocket.send(json.dumps({
+        except Exception as e:
+            logger.exception(f"[{chat_type}] 处理错误: {e}")
+            await session.send(websocket, {
                 'type': 'voice_response',
+                'error': True,
+                'message': str(e)
+            })
+    
+    async def _respond_to_speech(self, websocket, session, chat_type, user_text, speech_ms, pipelined=False):
+        """识别完成后：先发送识别文本，再生成并发送AI回复"""
+        # 立即发送用户识别文本
+        user_msg = {
+            'type': 'user_text_recognized',
+            'chat_type': chat_type,
+            'user_text': user_text,
+            'speech_duration': speech_ms / 1000
+        }
+        logger.info(f"[{chat_type}] >>> 发送识别文本消息: {user_msg}")
+        await session.send(websocket, user_msg)
+        logger.info(f"[{chat_type}] >>> 识别文本消息已发送")
+        
+        # 流水线模式：逐句合成并推送语音分片
+        if pipelined or 'voice_pipeline' in session.capabilities:
+            await self._pipelined_reply(websocket, session, chat_type, user_text)
+            return
+        
+        on_audio = self._audio_forwarder(websocket, session, chat_type, 'voice_response')
+        response_text, audio_content = await self._generate_reply(chat_type, user_text, on_audio=on_audio)
+        
+        # 发送AI回复（音频已通过 audio_chunk 推送时不再重复携带）
+        await self._send_reply(websocket, session, {
+            'type': 'voice_response',
+            'chat_type': chat_type,
+            'error': False,
+            'user_text': user_text,
+            'response_text': response_text
+        }, audio_content, streamed=on_audio is not None)
+    
+    def _create_recognizer(self, handler, on_partial):
+        """按配置创建流式识别器：百度实时语音识别，或基于短语音识别的本地替身"""
+        if STREAMING_ASR['backend'] == 'baidu':
+            return BaiduRealtimeRecognizer(dev_pid=STREAMING_ASR['dev_pid'], on_partial=on_partial)
+        return LocalStreamingRecognizer(
+            recognize_speech,
+            dev_pid=handler.asr_dev_pid,
+            on_partial=on_partial,
+            partial_interval_ms=STREAMING_ASR['partial_interval_ms'],
+            window_ms=STREAMING_ASR['window_ms']
+        )
+    
+    async def _start_voice_stream(self, websocket, data, session):
+        """开始流式语音输入：之后的二进制音频帧边收边识别，并推送 user_text_partial"""
+        chat_type = data.get('chat_type')
+        if chat_type not in self.handlers:
+            await session.send(websocket, {
+                'error': True,
+                'message': f'未知对话类型: {chat_type}'
+            })
+            return
+        await self._cancel_voice_stream(session)
+        
+        seq = 0
+        
+        async def on_partial(text):
+            nonlocal seq
+            await session.send(websocket, {
+                'type': 'user_text_partial',
                 'chat_type': chat_type,
-                'error': False,
-                'user_text': user_text,
-                'response_text': response_text,
-                'audio': audio_base64_reply
-            }))
+                'seq': seq,
+                'text': text
+            })
+            seq += 1
+        
+        stream = VoiceStream(
+            self._create_recognizer(self.handlers[chat_type], on_partial),
+            Endpointer(
+                energy_margin_db=VAD['energy_margin_db'],
+                min_speech_ms=VAD['min_speech_ms'],
+                end_silence_ms=STREAMING_ASR['end_silence_ms']
+            ) if STREAMING_ASR['endpointing'] else None,
+            max_seconds=STREAMING_ASR['max_seconds'],
+            ingest=AudioIngest(
+                normalize=AUDIO_INGEST['normalize'],
+                target_dbfs=AUDIO_INGEST['target_dbfs'],
+                max_gain_db=AUDIO_INGEST['max_gain_db'],
+                onset_dbfs=AUDIO_INGEST['onset_dbfs'],
+                **audio_format(data)
+            )
+        )
+        try:
+            await stream.start()
+        except Exception as e:
+            logger.error(f"[{chat_type}] 流式识别启动失败: {e}")
+            await session.send(websocket, {
+                'type': 'voice_response',
+                'error': True,
+                'message': f'流式识别启动失败: {e}'
+            })
+            return
+        session.start_stream(stream, data)
+        logger.info(f"[{chat_type}] 流式识别开始")
+        await session.send(websocket, {'type': 'voice_stream_started', 'chat_type': chat_type})
+    
+    async def _feed_voice_stream(self, websocket, session, pcm):
+        """送入一帧音频；检测到说完时立即结束识别并开始回复"""
+        try:
+            ended = await session.stream.feed(pcm)
+        except Exception as e:
+            # 识别器出错后这次流式识别不能再用：结束并取消，只回复一次错误，之后迟到的帧直接丢弃
+            chat_type = session.stream_request.get('chat_type')
+            logger.info(f"[{chat_type}] 流式识别出错: {e}")
+            try:
+                await self._cancel_voice_stream(session)
+            except Exception as cancel_error:
+                logger.error(f"[{chat_type}] 取消流式识别失败: {cancel_error}")
+            await session.send(websocket, {
+                'type': 'voice_response',
+                'error': True,
+                'message': f'流式识别失败: {e}'
+            })
+            return
+        if ended:
+            await self._finish_voice_stream(websocket, session)
+    
+    async def _finish_voice_stream(self, websocket, session):
+        """结束流式语音输入（服务端检测到说完，或客户端发送 voice_stream_end）"""
+        stream, data = session.end_stream()
+        if stream is None:
+            return
+        chat_type = data.get('chat_type')
+        try:
+            asr_result = await stream.finish()
+            if not asr_result.get('success'):
+                await session.send(websocket, {
+                    'type': 'voice_response',
+                    'error': True,
+                    'message': f"语音识别失败: {asr_result.get('error_msg', '未知错误')}"
+                })
+                return
             
+            user_text = asr_result.get('text', '')
+            if not user_text:
+                await session.send(websocket, {
+                    'type': 'voice_response',
+                    'error': True,
+                    'message': '没有检测到说话声音'
+                })
+                return
+            logger.info(f"[{chat_type}] 流式识别完成: {user_text}")
+            await self._respond_to_speech(
+                websocket, session, chat_type, user_text, stream.speech_ms, data.get('pipelined'))
+        
         except Exception as e:
-            print(f"[{chat_type}] 处理错误: {e}")
-            import traceback
-            traceback.print_exc()
-            await websocket.send(json.dumps({
+            logger.exception(f"[{chat_type}] 处理错误: {e}")
+            await session.send(websocket, {
                 'type': 'voice_response',
                 'error': True,
                 'message': str(e)
-            }))
+            })
+    
+    async def _cancel_voice_stream(self, session):
+        stream, _ = session.end_stream()
+        if stream is not None:
+            await stream.cancel()
     
-    async def _handle_text_chat(self, websocket, data):
+    async def _handle_text_chat(self, websocket, data, session):
         """处理纯文本对话"""
         chat_type = data.get('chat_type')
         user_text = data.get('text', '')
         
         if chat_type not in self.handlers:
-            await websocket.send(json.dumps({
+            await session.send(websocket, {
                 'error': True,
                 'message': f'未知对话类型: {chat_type}'
-            }))
+            })
             return
         
-        try:
-            handler = self.handlers[chat_type]
+        on_delta = None
+        if 'text_delta' in session.capabilities:
+            seq = 0
             
-            # 直接调用LLM
-            llm_response = handler.llm_agent.router(
-                prompt=user_text,
-                model=handler.llm_model,
-                systemInstruction=handler.system_instruction,
-                stream_output=False
-            )
-            
-            response_text = llm_response if isinstance(llm_response, str) else str(llm_response)
-            
-            # 生成语音
-            audio_content = await handler.synthesize_to_memory(
-                text=response_text,
-                spd=handler.tts_speed,
-                pit=handler.tts_pitch,
-                vol=handler.tts_volume,
-                aue=3
-            )
-            
-            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+            async def on_delta(delta):
+                nonlocal seq
+                await session.send(websocket, {
+                    'type': 'text_response_delta',
+                    'chat_type': chat_type,
+                    'seq': seq,
+                    'delta': delta
+                })
+                seq += 1
+        
+        try:
+            # 调用LLM并生成语音（支持增量的前端会先收到 text_response_delta）
+            on_audio = self._audio_forwarder(websocket, session, chat_type, 'text_response')
+            response_text, audio_content = await self._generate_reply(
+                chat_type, user_text, on_delta=on_delta, on_audio=on_audio)
             
-            await websocket.send(json.dumps({
+            await self._send_reply(websocket, session, {
                 'type': 'text_response',
                 'chat_type': chat_type,
                 'error': False,
                 'user_text': user_text,
-                'response_text': response_text,
-                'audio': audio_base64
-            }))
+                'response_text': response_text
+            }, audio_content, streamed=on_audio is not None)
         
         except Exception as e:
-            print(f"[TextChat] 错误: {e}")
-            import traceback
-            traceback.print_exc()
-            await websocket.send(json.dumps({
+            logger.exception(f"[TextChat] 错误: {e}")
+            await session.send(websocket, {
                 'type': 'text_response',
                 'error': True,
                 'message': str(e)
-            }))
+            })
     
-    async def _handle_memo_complete(self, websocket, data):
+    async def _handle_memo_complete(self, websocket, data, session):
         """处理备忘录完成 - 生成丈夫夸奖语音"""
         memo_text = data.get('memo_text', '')
         
@@ -388,7 +1244,8 @@ class SuperMomVoiceServer:
             prompt = f"我老婆刚刚完成了「{memo_text}」这个任务，请夸奖她。"
             
             # 获取LLM回复
-            llm_response = handler.llm_agent.router(
+            llm_response = await get_pool('llm').run(
+                handler.llm_agent.router,
                 prompt=prompt,
                 model=handler.llm_model,
                 systemInstruction=handler.system_instruction,
@@ -396,41 +1253,53 @@ class SuperMomVoiceServer:
             )
             
             response_text = llm_response if isinstance(llm_response, str) else str(llm_response)
-            print(f"[MemoComplete] 夸奖文本: {response_text}")
+            logger.info(f"[MemoComplete] 夸奖文本: {response_text}")
             
             # 生成语音
-            audio_content = await handler.synthesize_to_memory(
-                text=response_text,
-                spd=handler.tts_speed,
-                pit=handler.tts_pitch,
-                vol=handler.tts_volume,
-                aue=3
-            )
-            
-            audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+            on_audio = self._audio_forwarder(websocket, session, 'husband_praise', 'memo_praise')
+            audio_content = await self._synthesize(handler, to_speech(response_text), on_audio, priority=PRIORITY_PRAISE)
             
-            await websocket.send(json.dumps({
+            await self._send_reply(websocket, session, {
                 'type': 'memo_praise',
                 'error': False,
-                'praise_text': response_text,
-                'audio': audio_base64
-            }))
+                'praise_text': response_text
+            }, audio_content, streamed=on_audio is not None)
         
         except Exception as e:
-            print(f"[MemoComplete] 错误: {e}")
-            import traceback
-            traceback.print_exc()
-            await websocket.send(json.dumps({
+            logger.exception(f"[MemoComplete] 错误: {e}")
+            await session.send(websocket, {
                 'type': 'memo_praise',
                 'error': True,
                 'message': str(e)
-            }))
+            })
+    
+    async def startup(self):
+        """启动前的准备：百度令牌刷新（TTS、ASR 各用各的凭据）、TTS连接预热"""
+        start_token_refresher()
+        get_asr_auth().start_background_refresh()
+        if TTS_POOL['prewarm'] > 0:
+            # 同一发音人共用会话池，预热失败不影响启动
+            pooled = {id(handler.tts_pool): handler for handler in self.handlers.values()}
+            await asyncio.gather(*(
+                handler.prewarm_tts(TTS_POOL['prewarm']) for handler in pooled.values()
+            ))
+    
+    async def shutdown(self):
+        """关闭共享的ASR会话，保存语义缓存"""
+        await get_async_asr_instance().close()
+        for cache in self.semantic_caches.values():
+            cache.save()
     
     async def start(self):
-        """启动WebSocket服务器"""
+        """启动WebSocket服务器（独立端口，旧部署方式）"""
         print(f"[WebSocket] 服务启动: ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}")
-        async with websockets.serve(self.handle_client, WEBSOCKET_HOST, WEBSOCKET_PORT):
-            await asyncio.Future()
+        await self.startup()
+        try:
+            async with websockets.serve(self.handle_client, WEBSOCKET_HOST, WEBSOCKET_PORT,
+                                        max_size=websocket_message_limit()):
+                await asyncio.Future()
+        finally:
+            await self.shutdown()
     
     def run(self):
         """运行WebSocket服务器"""
@@ -450,24 +1319,76 @@ def start_websocket_server():
     server = SuperMomVoiceServer()
     server.run()
 
+def websocket_message_limit():
+    """单条 WebSocket 消息上限：voice_chat 整段携带录音，按上传上限计算，并留出 v1 base64 膨胀（4/3）和 JSON 字段的余量"""
+    return ASR_UPLOAD['max_body_mb'] * 1024 * 1024 * 4 // 3 + 64 * 1024
+
+def create_single_server_app(server=None, workers=1):
+    """HTTP 与语音 WebSocket 合并为一个 aiohttp 应用（同一事件循环、同一端口）；多进程模式下每个工作进程各调用一次"""
+    server = server or SuperMomVoiceServer(workers=workers)
+    return create_aio_app(
+        server.handle_client,
+        app,
+        get_pool('http'),
+        static_dir=app.static_folder,
+        ws_path=SERVER['ws_path'],
+        client_max_size=ASR_UPLOAD['max_body_mb'] * 1024 * 1024,
+        max_message_size=websocket_message_limit(),
+        on_startup=server.startup,
+        on_cleanup=server.shutdown
+    )
+
+def start_single_server(workers=1):
+    """启动合并后的 HTTP + WebSocket 服务；workers > 1 时由监督进程启动多个工作进程共用端口"""
+    if workers <= 1:
+        web.run_app(create_single_server_app(), host=HTTP_HOST, port=HTTP_PORT, print=None)
+        return
+    Supervisor(
+        create_single_server_app,
+        workers=workers,
+        host=HTTP_HOST,
+        port=HTTP_PORT,
+        reuse_port=SERVER['reuse_port'],
+        grace_seconds=SERVER['graceful_timeout'],
+        factory_kwargs={'workers': workers}
+    ).run()
+
+def worker_count():
+    """工作进程数：--workers N 启动参数优先，其次 SERVER['workers']，0 表示 CPU 核数"""
+    workers = SERVER['workers']
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+    return workers or os.cpu_count() or 1
+
 if __name__ == "__main__":
     print("=" * 70)
     print("🌟 Super Mom 工作台服务启动中...")
     print("=" * 70)
     print()
     
-    # 在独立线程中启动HTTP服务器
-    http_thread = threading.Thread(target=start_http_server, daemon=True)
-    http_thread.start()
-    
-    print(f"✅ HTTP服务器: http://{HTTP_HOST}:{HTTP_PORT}")
-    print(f"✅ WebSocket服务器: ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}")
+    single = SERVER['mode'] == 'single' and '--legacy' not in sys.argv
+    workers = worker_count() if single else 1
+    if single:
+        print(f"✅ HTTP服务器: http://{HTTP_HOST}:{HTTP_PORT}")
+        print(f"✅ WebSocket服务器: ws://{HTTP_HOST}:{HTTP_PORT}{SERVER['ws_path']}")
+        if workers > 1:
+            print(f"✅ 工作进程: {workers} 个（kill -HUP {os.getpid()} 滚动重启）")
+    else:
+        # 在独立线程中启动HTTP服务器
+        http_thread = threading.Thread(target=start_http_server, daemon=True)
+        http_thread.start()
+        
+        print(f"✅ HTTP服务器: http://{HTTP_HOST}:{HTTP_PORT}")
+        print(f"✅ WebSocket服务器: ws://{WEBSOCKET_HOST}:{WEBSOCKET_PORT}")
     print()
     print("=" * 70)
     print()
     
     try:
-        # 主线程运行WebSocket服务器
-        start_websocket_server()
+        if single:
+            start_single_server(workers)
+        else:
+            # 主线程运行WebSocket服务器
+            start_websocket_server()
     except KeyboardInterrupt:
         print("\n\n服务器已停止")
@@ -147,3 +147,118 @@ WEBSOCKET_PORT = 8766  # 使用不同端口避免冲突
 # HTTP服务器配置
 HTTP_HOST = "localhost"
 HTTP_PORT = 8080
+
+# 语义缓存配置（近似问题直接复用已缓存的回答和语音）
+SEMANTIC_CACHE = {
+    "chat_types": ["nutrition_advisor"],  # 启用语义缓存的对话类型
+    "path": "Audio/outputs/semantic_cache_{chat_type}.npz",
+    "threshold": 0.5,                   # 余弦相似度阈值
+    "min_topic_overlap": 0.5,           # 去掉句式词后主题词的最低重叠比例（避免“失眠”命中“便秘”）
+    "ttl_seconds": 7 * 24 * 3600,       # 缓存有效期
+    "max_entries": 1000                 # 最大缓存条目数
+}
+
+# 线程池配置（阻塞的 ASR / LLM 调用放到独立线程池，不占用 WebSocket 事件循环）
+WORKER_POOLS = {
+    "asr": 4,         # 百度ASR并发数
+    "asr_batch": 4,   # 批量识别时同时处理的录音条数
+    "http": 8,        # 单服务模式下执行 Flask 接口的线程数
+    "llm": 8          # LLM请求并发数
+}
+WORKER_POOL_MAX_QUEUE = 64  # 每个线程池最多排队的任务数
+
+# 语音流水线模式（voice_chat 消息携带 "pipelined": true 时启用）
+VOICE_PIPELINE = {
+    "tts_concurrency": 2,      # 同时进行的逐句TTS数量
+    "min_sentence_chars": 8    # 过短的句子与下一句合并后再合成
+}
+
+# 百度TTS连接池（按发音人共享，合成结束后复用WebSocket连接）
+TTS_POOL = {
+    "max_size": 4,   # 每个发音人最多同时合成的连接数
+    "prewarm": 1     # 启动时为每个发音人预先建立的连接数
+}
+
+# TTS音频缓存（相同文本和合成参数只请求一次百度TTS）
+TTS_CACHE = {
+    "enabled": True,
+    "dir": "Audio/outputs/tts_cache",
+    "memory_mb": 32,   # 内存层上限
+    "disk_mb": 512     # 磁盘层上限
+}
+
+# 长文本TTS分段（百度TTS单次文本上限1000字，高负载时过长的文本还会被拒绝）
+TTS_SEGMENT = {
+    "max_chars": 500,   # 每段最多字符数，按句切分
+    "concurrency": 3    # 同一条回复最多同时合成的段数
+}
+
+# 百度TTS调度（所有对话类型共享的并发和QPS预算，429/502时自动退避重试）
+TTS_SCHEDULER = {
+    "max_concurrency": 6,   # 同时进行的合成数
+    "qps": 10,              # 每秒最多发起的合成数
+    "max_retries": 3        # 被限流后的最大重试次数
+}
+
+# 语音活动检测（ASR前裁掉首尾静音、压缩长停顿，没有说话的录音不再请求百度ASR）
+VAD = {
+    "enabled": True,
+    "energy_margin_db": 10,   # 高于底噪多少dB视为语音
+    "min_speech_ms": 200,     # 语音总时长低于该值视为没有说话
+    "hangover_ms": 300,       # 语音结束后保留的拖尾
+    "max_pause_ms": 800       # 句间停顿超过该值时压缩
+}
+
+# 长录音分段识别（百度短语音识别单次最长60秒，超出时在静音处切分后并发识别）
+ASR_SEGMENT = {
+    "max_seconds": 50,   # 每段最长时长（含重叠）
+    "overlap_ms": 300,   # 相邻段重叠时长，拼接时去掉重复识别的字
+    "concurrency": 4     # 语音对话中同一段录音最多同时识别的段数（HTTP接口使用asr线程池）
+}
+
+# 流式语音识别（voice_stream_start 后边录边识别，推送中间结果，说完立即开始回复）
+STREAMING_ASR = {
+    "backend": "baidu",          # baidu: 百度实时语音识别；local: 本地替身（定期用短语音识别最近的音频，
+                                 #   额外消耗短语音识别额度，只用于没有开通实时识别的部署和本地测试）
+    "dev_pid": 15372,            # 百度实时识别模型（普通话，加强标点）
+    "endpointing": True,         # 服务端检测说完；关闭时只在收到 voice_stream_end 时结束
+    "end_silence_ms": 700,       # 说话后静音超过该值视为说完
+    "max_seconds": 60,           # 单次流式输入的时长上限
+    "partial_interval_ms": 1000, # 本地替身每新增多少音频识别一次中间结果
+    "window_ms": 6000            # 本地替身每次中间识别的最长音频，更早的部分定稿后不再重复识别
+}
+
+# 录音格式统一（客户端可上传任意采样率 / 声道 / int16 或 float32 的 PCM，服务端转为 16kHz 单声道）
+AUDIO_INGEST = {
+    "normalize": True,     # 增益归一化，放大音量过小的录音（整段上传只放大VAD裁剪后的说话部分，16kHz单声道int16不处理）
+    "target_dbfs": -3,     # 归一化目标峰值
+    "max_gain_db": 20,     # 最大放大倍数
+    "onset_dbfs": -40      # 流式录音音量达到该值（开口说话）之后才放大，开头的底噪保持原音量
+}
+
+# ASR识别结果缓存（客户端重传同一段录音时不再请求百度；消息中带 audio_hash 时命中可跳过解码）
+ASR_CACHE = {
+    "enabled": True,
+    "max_entries": 512,    # 最多缓存的识别结果数
+    "ttl_seconds": 600     # 过期时间
+}
+
+# 批量语音识别（/api/asr/batch，贴心备忘录同步离线录音）
+ASR_BATCH = {
+    "max_items": 20   # 单次请求最多的录音条数
+}
+
+# 语音上传（/api/asr 与 /api/asr/batch 的请求体上限；WebSocket 单条消息上限按它加上 base64 余量计算）
+ASR_UPLOAD = {
+    "max_body_mb": 32
+}
+
+# 服务部署方式
+SERVER = {
+    "mode": "single",         # single: HTTP 与语音 WebSocket 共用 HTTP_PORT 上的一个 aiohttp 事件循环；
+                              # legacy: Flask 线程 + WEBSOCKET_PORT 上的 websockets 服务（也可用 --legacy 启动参数）
+    "ws_path": "/ws",         # 单服务模式下语音 WebSocket 的路径（带 Upgrade 首部访问 / 也可以）
+    "workers": 1,             # 工作进程数：1 为单进程，0 为 CPU 核数（也可用 --workers N 启动参数）
+    "reuse_port": True,       # 多进程时优先用 SO_REUSEPORT 各自绑定端口，系统不支持时改为共享监听 socket
+    "graceful_timeout": 30    # 工作进程退出（滚动重启 / 停止）时等待处理中请求完成的秒数
+}
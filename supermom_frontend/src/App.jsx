@@ -19,7 +19,8 @@ import {
   RefreshCw
 } from 'lucide-react';
 
-const WS_URL = 'ws://localhost:8766';
+// 语音 WebSocket 与 HTTP 共用 8080 端口（单服务模式）；后端以 --legacy 启动时改为 ws://localhost:8766
+const WS_URL = 'ws://localhost:8080/ws';
 const API_URL = 'http://localhost:8080';
 
 /**
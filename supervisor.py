@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+"""
+多进程工作模式
+单个事件循环只能用满一个核，所有连接的 JSON 解析、base64 编解码都挤在这一个核上。
+Supervisor 启动 N 个工作进程监听同一端口，每个进程运行一份完整的 aiohttp 应用：
+- 系统支持 SO_REUSEPORT 时每个工作进程各自绑定端口，由内核在进程间分配新连接；
+  不支持时（Windows 等）由监督进程绑定一次，把监听 socket 传给工作进程共同 accept
+- 工作进程意外退出后自动重启；启动后很快又退出的按指数退避，避免反复崩溃占满 CPU
+- SIGHUP 滚动重启：逐个先启动新进程、等它就绪，再向旧进程发 SIGTERM 让它优雅退出
+  （停止监听，空闲的 WebSocket 以 1001 关闭让前端重连，处理中的消息处理完再断开）
+- 各工作进程定期把 metrics.snapshot() 写到共享目录，任意进程 /api/metrics 的 workers 项汇总所有进程
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+from aiohttp import web
+
+import metrics
+from output_sink import flush_console
+
+
+def reuse_port_supported():
+    """当前系统能否多个进程绑定同一端口"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        return False
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return True
+    except OSError:
+        return False
+
+
+def bind_socket(host, port, reuse_port=False, listen=True, backlog=1024):
+    """创建监听 socket；reuse_port 为 True 时设置 SO_REUSEPORT"""
+    family = socket.AF_INET6 if host and ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if listen:
+            sock.listen(backlog)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+# ===========================
+# 指标汇总
+# ===========================
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # 文件不存在或正在被替换
+        return None
+
+
+def merge_metrics(snapshots):
+    """
+    合并各进程同结构的指标
+    计数和容量求和；max_*_ms 取最大；avg_* 和 *_rate 取平均（未按请求数加权，近似值）
+    """
+    merged = {}
+    keys = []
+    for snapshot in snapshots:
+        keys.extend(key for key in snapshot if key not in keys)
+    for key in keys:
+        values = [snapshot[key] for snapshot in snapshots if key in snapshot]
+        if all(isinstance(value, dict) for value in values):
+            merged[key] = merge_metrics(values)
+        elif all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            if key.startswith('max_') and key.endswith('_ms'):
+                merged[key] = max(values)
+            elif key.startswith('avg_') or key.endswith('_rate'):
+                merged[key] = round(sum(values) / len(values), 4)
+            else:
+                merged[key] = sum(values)
+        else:
+            merged[key] = values[0]
+    return merged
+
+
+def collect_worker_metrics(state_dir, max_age=10.0):
+    """读取共享目录中各工作进程最近一次上报的指标，超过 max_age 秒未更新的视为已退出"""
+    now = time.time()
+    workers = {}
+    for name in sorted(os.listdir(state_dir)):
+        if not (name.startswith('worker-') and name.endswith('.json')):
+            continue
+        data = _read_json(os.path.join(state_dir, name))
+        if data is None or now - data['updated'] > max_age:
+            continue
+        workers[str(data['pid'])] = data
+    supervisor = _read_json(os.path.join(state_dir, 'supervisor.json')) or {}
+    return {
+        'supervisor_pid': supervisor.get('pid'),
+        'mode': supervisor.get('mode'),
+        'workers': supervisor.get('workers'),
+        'alive': len(workers),
+        'restarts': supervisor.get('restarts', {}),
+        'rolling_restarts': supervisor.get('rolling_restarts', 0),
+        'per_worker': {
+            pid: {'index': data['index'], 'uptime_s': round(now - data['started'], 1), 'metrics': data['metrics']}
+            for pid, data in workers.items()
+        },
+        'total': merge_metrics([data['metrics'] for data in workers.values()]),
+    }
+
+
+async def _publish_metrics(state_dir, index, interval):
+    """定期把本进程的指标写到共享目录"""
+    path = os.path.join(state_dir, f'worker-{os.getpid()}.json')
+    started = time.time()
+    try:
+        while True:
+            _write_json(path, {
+                'index': index,
+                'pid': os.getpid(),
+                'started': started,
+                'updated': time.time(),
+                'metrics': metrics.snapshot(exclude=('workers',)),
+            })
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# ===========================
+# 工作进程
+# ===========================
+
+def _worker_main(app_factory, factory_kwargs, index, sock, host, port, ready, state_dir, grace_seconds,
+                 metrics_interval):
+    """工作进程入口：没有传入监听 socket 时自己用 SO_REUSEPORT 绑定"""
+    # fork 出来的进程继承了监督进程的信号处理函数，恢复默认，之后由 aiohttp 接管 SIGTERM / SIGINT
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    if hasattr(signal, 'SIGHUP'):
+        # SIGHUP 只发给监督进程；终端关闭时由监督进程统一停止
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if sock is None:
+        sock = bind_socket(host, port, reuse_port=True)
+    metrics.register('workers', lambda: collect_worker_metrics(state_dir, max_age=metrics_interval * 5))
+
+    app = app_factory(**factory_kwargs)
+    publisher = None
+
+    async def on_ready(_):
+        nonlocal publisher
+        publisher = asyncio.ensure_future(_publish_metrics(state_dir, index, metrics_interval))
+        ready.set()
+
+    async def on_cleanup(_):
+        if publisher is not None:
+            publisher.cancel()
+            await asyncio.gather(publisher, return_exceptions=True)
+
+    app.on_startup.append(on_ready)
+    app.on_cleanup.append(on_cleanup)
+    print(f"[Worker {index}] 进程 {os.getpid()} 启动")
+    web.run_app(app, sock=sock, shutdown_timeout=grace_seconds, print=None)
+    print(f"[Worker {index}] 进程 {os.getpid()} 退出")
+    # 子进程退出时不跑 atexit，请求日志还在后台写线程的队列里，先写完
+    flush_console()
+
+
+class _Worker:
+    def __init__(self, index, process, ready):
+        self.index = index
+        self.process = process
+        self.ready = ready
+        self.started = time.monotonic()
+
+
+# ===========================
+# 监督进程
+# ===========================
+
+class Supervisor:
+    """启动并看护 N 个监听同一端口的工作进程"""
+
+    def __init__(self, app_factory, workers=None, host='localhost', port=8080, reuse_port=True,
+                 grace_seconds=30, ready_timeout=60, metrics_interval=2.0, min_uptime=5.0, max_backoff=30.0,
+                 factory_kwargs=None):
+        """
+        Args:
+            app_factory: 模块级函数，在工作进程中调用 app_factory(**factory_kwargs) 返回 aiohttp Application
+            workers: 工作进程数，默认 CPU 核数
+            reuse_port: 优先使用 SO_REUSEPORT；系统不支持时自动改为共享监听 socket
+            grace_seconds: 工作进程收到 SIGTERM 后等待处理中请求完成的时间，超时后强制结束
+            ready_timeout: 滚动重启时等待新进程就绪的时间，超时则放弃本次滚动重启、保留旧进程
+            metrics_interval: 工作进程上报指标的间隔（秒）
+            min_uptime: 运行不到该时长就退出视为启动失败，重启按指数退避
+            max_backoff: 重启退避上限（秒）
+        """
+        self.app_factory = app_factory
+        self.factory_kwargs = factory_kwargs or {}
+        self.workers = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port and reuse_port_supported()
+        self.grace_seconds = grace_seconds
+        self.ready_timeout = ready_timeout
+        self.metrics_interval = metrics_interval
+        self.min_uptime = min_uptime
+        self.max_backoff = max_backoff
+
+        self.ctx = multiprocessing.get_context()
+        self.state_dir = None
+        self.listener = None
+        self.slots = [None] * self.workers
+        self.restarts = [0] * self.workers
+        self.rolling_restarts = 0
+        self._failures = [0] * self.workers   # 连续启动失败次数
+        self._retry_at = [0.0] * self.workers
+        self._retiring = []                   # [(已发 SIGTERM 的旧进程, 强制结束时间)]
+        self._stopping = False
+        self._reload_requested = False
+
+    # ---------- 进程管理 ----------
+
+    def _spawn(self, index):
+        ready = self.ctx.Event()
+        process = self.ctx.Process(
+            target=_worker_main,
+            name=f'supermom-worker-{index}',
+            args=(self.app_factory, self.factory_kwargs, index, self.listener, self.host, self.port, ready,
+                  self.state_dir, self.grace_seconds, self.metrics_interval)
+        )
+        process.start()
+        return _Worker(index, process, ready)
+
+    def _retire(self, worker):
+        """SIGTERM：aiohttp 停止监听并优雅关闭；超过宽限时间仍未退出的由 _reap_retiring 强制结束"""
+        worker.process.terminate()
+        self._retiring.append((worker, time.monotonic() + self.grace_seconds + 5))
+
+    def _reap_retiring(self):
+        now = time.monotonic()
+        remaining = []
+        for worker, deadline in self._retiring:
+            if not worker.process.is_alive():
+                worker.process.join()
+            elif now > deadline:
+                print(f"[Supervisor] 工作进程 {worker.index}（pid {worker.process.pid}）未在宽限时间内退出，强制结束")
+                worker.process.kill()
+                worker.process.join()
+            else:
+                remaining.append((worker, deadline))
+        self._retiring = remaining
+
+    def _check_workers(self):
+        """重启意外退出的工作进程"""
+        now = time.monotonic()
+        for index, worker in enumerate(self.slots):
+            if worker is not None:
+                if worker.process.is_alive():
+                    continue
+                worker.process.join()
+                quick = now - worker.started < self.min_uptime
+                self._failures[index] = self._failures[index] + 1 if quick else 0
+                delay = min(self.max_backoff, 0.5 * 2 ** self._failures[index]) if quick else 0.0
+                self._retry_at[index] = now + delay
+                self.slots[index] = None
+                print(f"[Supervisor] 工作进程 {index}（pid {worker.process.pid}）退出，"
+                      f"退出码 {worker.process.exitcode}，{delay:.1f}s 后重启")
+            if now >= self._retry_at[index]:
+                self.slots[index] = self._spawn(index)
+                self.restarts[index] += 1
+                self._write_state()
+
+    def _wait_ready(self, worker):
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline and not self._stopping:
+            if worker.ready.wait(0.2):
+                return True
+            if not worker.process.is_alive():
+                return False
+        return False
+
+    def rolling_restart(self):
+        """逐个替换工作进程：新进程就绪后旧进程才退出，任何时刻都有进程在接受连接"""
+        print("[Supervisor] 开始滚动重启")
+        for index in range(self.workers):
+            if self._stopping:
+                return
+            new = self._spawn(index)
+            if not self._wait_ready(new):
+                print(f"[Supervisor] 新工作进程 {index} 未能就绪，停止本次滚动重启，保留旧进程")
+                self._retire(new)
+                return
+            old, self.slots[index] = self.slots[index], new
+            self._failures[index] = 0
+            if old is not None:
+                self._retire(old)
+            self._reap_retiring()
+        self.rolling_restarts += 1
+        self._write_state()
+        print("[Supervisor] 滚动重启完成")
+
+    def _stop_all(self):
+        for worker in self.slots:
+            if worker is not None and worker.process.is_alive():
+                self._retire(worker)
+        self.slots = [None] * self.workers
+        while self._retiring:
+            self._reap_retiring()
+            time.sleep(0.1)
+
+    # ---------- 状态与信号 ----------
+
+    def _write_state(self):
+        _write_json(os.path.join(self.state_dir, 'supervisor.json'), {
+            'pid': os.getpid(),
+            'mode': 'reuse_port' if self.reuse_port else 'shared_socket',
+            'workers': self.workers,
+            'restarts': {str(index): count for index, count in enumerate(self.restarts)},
+            'rolling_restarts': self.rolling_restarts,
+        })
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _install_signals(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._on_reload)
+
+    # ---------- 主循环 ----------
+
+    def run(self):
+        """启动所有工作进程并看护，直到收到 SIGTERM / SIGINT"""
+        if self.reuse_port:
+            # 先试绑一次，端口被其他程序占用时立即报错，而不是让工作进程反复崩溃
+            bind_socket(self.host, self.port, reuse_port=True, listen=False).close()
+        else:
+            self.listener = bind_socket(self.host, self.port)
+        self.state_dir = tempfile.mkdtemp(prefix='supermom-workers-')
+        self._install_signals()
+        print(f"[Supervisor] 进程 {os.getpid()}：{self.workers} 个工作进程监听 {self.host}:{self.port}"
+              f"（{'SO_REUSEPORT' if self.reuse_port else '共享监听 socket'}）")
+
+        try:
+            self.slots = [self._spawn(index) for index in range(self.workers)]
+            self._write_state()
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.rolling_restart()
+                self._reap_retiring()
+                self._check_workers()
+                time.sleep(0.5)
+        finally:
+            print("[Supervisor] 正在停止所有工作进程...")
+            self._stop_all()
+            if self.listener is not None:
+                self.listener.close()
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+# ===========================
+# 吞吐测试（python supervisor.py）
+# 压测进程和工作进程的入口需要是模块级函数，spawn 方式启动子进程时才能找到
+# ===========================
+
+BENCH_PORT = 18770
+
+
+def _bench_app():
+    """每条消息都做一次 JSON 解析 + base64 解码，再编码回复，模拟 voice_chat 的 CPU 开销"""
+    import base64
+
+    from flask import Flask
+
+    from aio_server import create_app
+    from worker_pools import get_pool
+
+    async def handle_client(websocket):
+        async for message in websocket:
+            data = json.loads(message)
+            pcm = base64.b64decode(data['audio'])
+            await websocket.send(json.dumps({
+                'type': 'voice_response',
+                'user_text': f'{len(pcm)} 字节',
+                'audio': base64.b64encode(pcm[::-1]).decode(),
+            }))
+
+    return create_app(handle_client, Flask(__name__), get_pool('http'))
+
+
+def _bench_supervisor(workers):
+    import sys
+    sys.stdout = open(os.devnull, 'w')  # 只输出测试结果
+    Supervisor(_bench_app, workers=workers, host='127.0.0.1', port=BENCH_PORT, grace_seconds=1).run()
+
+
+def _bench_client(request, seconds, connections, results):
+    import websockets
+
+    async def one(deadline):
+        done = 0
+        async with websockets.connect(f'ws://127.0.0.1:{BENCH_PORT}/ws', max_size=None) as ws:
+            while time.monotonic() < deadline:
+                await ws.send(request)
+                await ws.recv()
+                done += 1
+        return done
+
+    async def main():
+        deadline = time.monotonic() + seconds
+        return sum(await asyncio.gather(*(one(deadline) for _ in range(connections))))
+
+    results.put(asyncio.run(main()))
+
+
+if __name__ == '__main__':
+    import base64
+
+    print("多进程工作模式吞吐测试：每条消息都是 JSON + base64 音频（模拟 voice_chat 的解析与回复编码）")
+    print("=" * 70)
+
+    request = json.dumps({
+        'type': 'voice_chat',
+        'chat_type': 'emotional_support',
+        'audio': base64.b64encode(os.urandom(96 * 1024)).decode(),  # 约 3 秒 16kHz PCM
+    })
+
+    def wait_listening():
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', BENCH_PORT), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+
+    cores = os.cpu_count() or 1
+    ctx = multiprocessing.get_context()
+    seconds, clients = 3.0, max(2, cores)
+    print(f"CPU 核数 {cores}，SO_REUSEPORT {'可用' if reuse_port_supported() else '不可用（共享监听 socket）'}，"
+          f"{clients} 个压测进程 × 8 个连接")
+    for workers in sorted({1, 2, 4, cores}):
+        supervisor = ctx.Process(target=_bench_supervisor, args=(workers,))
+        supervisor.start()
+        wait_listening()
+        time.sleep(0.5 + 0.2 * workers)  # 等所有工作进程就绪
+        results = ctx.Queue()
+        loaders = [ctx.Process(target=_bench_client, args=(request, seconds, 8, results)) for _ in range(clients)]
+        for loader in loaders:
+            loader.start()
+        total = sum(results.get() for _ in loaders)
+        for loader in loaders:
+            loader.join()
+        supervisor.terminate()
+        supervisor.join()
+        print(f"{workers} 个工作进程: {total / seconds:7.0f} msg/s")
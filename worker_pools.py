@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+有界线程池
+阻塞调用（百度 ASR、LLM 请求）按类型分配到各自大小固定的线程池，
+不在 asyncio 事件循环上执行，并统计排队深度与等待时间。
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class WorkerPoolFull(Exception):
+    """线程池排队已满"""
+    pass
+
+
+class WorkerPool:
+    def __init__(self, name, max_workers, max_queue=None):
+        """
+        Args:
+            name: 线程池名称（用于线程名和指标）
+            max_workers: 最大并发线程数
+            max_queue: 最多允许排队的任务数，超出时抛出 WorkerPoolFull；None 表示不限制
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def _wrap(self, fn, args, kwargs):
+        with self._lock:
+            if self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise WorkerPoolFull(f"{self.name} 线程池繁忙，排队任务数已达上限 {self.max_queue}")
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            wait = started - submitted
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self.failed += 0 if ok else 1
+                    self.total_run += time.perf_counter() - started
+
+        return task
+
+    def _submit(self, fn, args, kwargs):
+        future = self.executor.submit(self._wrap(fn, args, kwargs))
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        if future.cancelled():
+            # 还没开始执行就被取消（客户端断开、超时），task() 不会运行，排队计数在这里归还
+            with self._lock:
+                self.queued -= 1
+                self.cancelled += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """在线程池中执行 fn(*args, **kwargs) 并等待结果（供协程使用）；等待方被取消时，尚未开始的任务一并取消"""
+        return await asyncio.wrap_future(self._submit(fn, args, kwargs))
+
+    def submit(self, fn, *args, **kwargs):
+        """提交到线程池并返回 concurrent.futures.Future（供同步代码使用）"""
+        return self._submit(fn, args, kwargs)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed or 1
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'cancelled': self.cancelled,
+                'avg_wait_ms': round(self.total_wait / done * 1000, 2),
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'avg_run_ms': round(self.total_run / done * 1000, 2),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def configure_pools(sizes, max_queue=None):
+    """按 {名称: 线程数} 预先创建线程池，已存在的不重复创建"""
+    for name, max_workers in sizes.items():
+        get_pool(name, max_workers=max_workers, max_queue=max_queue)
+
+
+def get_pool(name, max_workers=4, max_queue=None):
+    """获取指定名称的共享线程池，不存在时按参数创建"""
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = WorkerPool(name, max_workers, max_queue)
+                _pools[name] = pool
+    return pool
+
+
+def pool_stats():
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+
+metrics.register('worker_pools', pool_stats)
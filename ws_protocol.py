@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+WebSocket 消息编解码
+
+v1（默认）：所有消息都是 JSON 文本帧，音频以 base64 字符串放在 "audio" 字段中
+v2（握手协商）：控制消息为 JSON 文本帧或 msgpack 二进制帧，音频作为独立的二进制帧发送，
+              控制消息中用 "audio_id" 引用，服务端解码时直接切片 memoryview，不复制音频数据
+
+v2 二进制帧格式（首字节为帧类型）：
+    b'M' + msgpack(控制消息)
+    b'A' + audio_id (4 字节大端无符号整数) + 原始音频字节
+    b'S' + PCM（流式识别 voice_stream_start 之后边录边发的音频）
+
+流式识别时 v1 连接直接发送不带前缀的 PCM 二进制帧
+"""
+
+import base64
+import itertools
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FRAME_MSGPACK = ord('M')
+FRAME_AUDIO = ord('A')
+FRAME_STREAM = ord('S')
+AUDIO_HEADER_SIZE = 5
+
+
+class ProtocolError(Exception):
+    """无法解析的帧"""
+    pass
+
+
+class ProtocolV1:
+    """JSON + base64 音频"""
+    version = 1
+    encoding = 'json'
+
+    def encode(self, message, audio=None):
+        """返回需要依次发送的帧列表"""
+        if audio is not None:
+            message = dict(message, audio=base64.b64encode(audio).decode('utf-8'))
+        return [json.dumps(message)]
+
+    def decode(self, frame):
+        """返回 (控制消息, None)；v1 不使用二进制帧"""
+        if not isinstance(frame, str):
+            raise ProtocolError('协议 v1 不支持二进制帧')
+        return json.loads(frame), None
+
+    def audio_from(self, message, pending_audio):
+        audio_base64 = message.get('audio')
+        return base64.b64decode(audio_base64) if audio_base64 else None
+
+    def stream_audio(self, frame):
+        """流式识别的 PCM 帧：v1 的二进制帧全部是原始 PCM"""
+        return memoryview(frame)
+
+
+class ProtocolV2:
+    """控制消息 msgpack/JSON + 独立二进制音频帧"""
+    version = 2
+
+    def __init__(self, encoding='msgpack'):
+        self.encoding = 'msgpack' if encoding == 'msgpack' and msgpack is not None else 'json'
+        self._audio_ids = itertools.count(1)
+
+    def _encode_control(self, message):
+        if self.encoding == 'msgpack':
+            return b'M' + msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message)
+
+    def encode(self, message, audio=None):
+        """音频帧在前、引用它的控制消息在后，客户端收到控制消息时音频已经就绪"""
+        frames = []
+        if audio is not None:
+            audio_id = next(self._audio_ids) & 0xFFFFFFFF
+            frames.append(b''.join((b'A', audio_id.to_bytes(4, 'big'), audio)))
+            message = dict(message, audio_id=audio_id)
+        frames.append(self._encode_control(message))
+        return frames
+
+    def decode(self, frame):
+        """
+        返回 (控制消息, 音频)
+        音频为 (audio_id, memoryview)，是对原始帧的零拷贝切片
+        """
+        if isinstance(frame, str):
+            return json.loads(frame), None
+
+        view = memoryview(frame)
+        if len(view) == 0:
+            raise ProtocolError('空的二进制帧')
+        frame_type = view[0]
+        if frame_type == FRAME_AUDIO:
+            if len(view) < AUDIO_HEADER_SIZE:
+                raise ProtocolError('音频帧长度不足')
+            audio_id = int.from_bytes(view[1:AUDIO_HEADER_SIZE], 'big')
+            return None, (audio_id, view[AUDIO_HEADER_SIZE:])
+        if frame_type == FRAME_MSGPACK:
+            if msgpack is None:
+                raise ProtocolError('服务端未安装 msgpack')
+            return msgpack.unpackb(view[1:], raw=False), None
+        raise ProtocolError(f'未知帧类型: {frame_type}')
+
+    def audio_from(self, message, pending_audio):
+        audio_id = message.get('audio_id')
+        if audio_id is not None:
+            return pending_audio.pop(audio_id, None)
+        audio_base64 = message.get('audio')
+        return base64.b64decode(audio_base64) if audio_base64 else None
+
+    def stream_audio(self, frame):
+        """流式识别的 PCM 帧（b'S' 前缀）；其他帧返回 None，按普通帧解码"""
+        view = memoryview(frame)
+        if len(view) and view[0] == FRAME_STREAM:
+            return view[1:]
+        return None
+
+
+def negotiate_protocol(message):
+    """根据客户端第一条消息选择协议；未声明 protocol 的旧前端使用 v1"""
+    if message.get('protocol') == 2:
+        return ProtocolV2(encoding=message.get('encoding', 'msgpack'))
+    return ProtocolV1()
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    print("WebSocket 协议 v1 / v2 基准测试（单轮语音对话）")
+    print("=" * 60)
+
+    upload_pcm = os.urandom(16000 * 2 * 5)  # 5 秒 16kHz PCM
+    reply_mp3 = os.urandom(60 * 1024)      # 约 60KB 的 TTS 音频
+    reply_text = "宝儿别慌，这是产后激素在作妖！" * 10
+    rounds = 200
+
+    def client_frames(protocol):
+        """客户端上传：v1 为 base64 JSON，v2 为音频帧 + 控制消息"""
+        request = {'type': 'voice_chat', 'chat_type': 'nutrition_advisor'}
+        if protocol.version == 1:
+            return [json.dumps(dict(request, audio=base64.b64encode(upload_pcm).decode('utf-8')))]
+        frames = [b'A' + (1).to_bytes(4, 'big') + upload_pcm]
+        request['audio_id'] = 1
+        if protocol.encoding == 'msgpack':
+            frames.append(b'M' + msgpack.packb(request, use_bin_type=True))
+        else:
+            frames.append(json.dumps(request))
+        return frames
+
+    def to_wire(frame):
+        """文本帧在线路上是 UTF-8 字节，返回 (是否文本帧, 字节)"""
+        return (True, frame.encode('utf-8')) if isinstance(frame, str) else (False, frame)
+
+    candidates = [('v1 json+base64', ProtocolV1()), ('v2 json+binary', ProtocolV2('json'))]
+    if msgpack is not None:
+        candidates.append(('v2 msgpack+binary', ProtocolV2('msgpack')))
+    else:
+        print("未安装 msgpack，跳过 v2 msgpack")
+
+    for name, protocol in candidates:
+        incoming = [to_wire(f) for f in client_frames(protocol)]
+        start = time.process_time()
+        for _ in range(rounds):
+            pending = {}
+            for is_text, data in incoming:
+                message, audio = protocol.decode(data.decode('utf-8') if is_text else data)
+                if audio is not None:
+                    pending[audio[0]] = audio[1]
+            pcm = protocol.audio_from(message, pending)
+            outgoing = [to_wire(f) for f in protocol.encode({
+                'type': 'voice_response',
+                'chat_type': 'nutrition_advisor',
+                'error': False,
+                'user_text': '掉头发怎么办',
+                'response_text': reply_text
+            }, audio=reply_mp3)]
+        cpu = (time.process_time() - start) / rounds
+        wire_in = sum(len(data) for _, data in incoming)
+        wire_out = sum(len(data) for _, data in outgoing)
+        print(f"{name:<20} 上行 {wire_in / 1024:7.1f} KB  下行 {wire_out / 1024:6.1f} KB  "
+              f"服务端CPU {cpu * 1000:6.3f} ms/轮")